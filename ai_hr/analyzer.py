@@ -1,140 +1,104 @@
 # analyzer.py
 
 from sentence_transformers import SentenceTransformer, util
+import numpy as np
 import torch
 import os
 import re
-from pathlib import Path
-from striprtf.striprtf import rtf_to_text
-from docx import Document
-from pypdf import PdfReader
+import io
 import json
-from typing import Union, List, Dict, Optional
+import threading
+import time
+from functools import lru_cache
+from typing import Union, List, Dict, Optional, Iterator, Iterable, Sequence
+from embedding_cache import EmbeddingCache, default_embedding_cache, make_cache_key
+
+try:
+    import razdel
+except ImportError:
+    razdel = None
 
 # ==============================
 # 1. ИЗВЛЕЧЕНИЕ ТЕКСТА ИЗ ФАЙЛОВ
 # ==============================
 
 
-def extract_text_as_single_line(file_path: str) -> str:
-    """Извлекает и очищает текст из .docx, .pdf, .rtf"""
-
-    def clean_special_chars(text: str) -> str:
-        if not text:
-            return ""
-        text = text.replace('\\t', ' ').replace('\t', ' ')
-        text = re.sub(
-            r'[\n\r\f\v\u00a0\u1680\u2000-\u200F\u2028-\u202F\u205F\u2060\u3000]', ' ', text)
-        text = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F-\x9F]', '', text)
-        text = re.sub(r'[\u200E\u200F\u202A-\u202E]', '', text)
-        text = re.sub(r'[•▪▶➢\*\•\‣\⁃\-\•]', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
-
-    def extract_from_docx(filepath: str) -> str:
-        try:
-            doc = Document(filepath)
-            paragraphs = [p.text.strip()
-                          for p in doc.paragraphs if p.text.strip()]
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            paragraphs.append(cell.text.strip())
-            return ' '.join(paragraphs)
-        except Exception as e:
-            print(f"Ошибка DOCX: {str(e)}")
-            return ""
-
-    def extract_from_pdf(filepath: str) -> str:
-        try:
-            text_parts = []
-            with open(filepath, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-            return ' '.join(text_parts)
-        except Exception as e:
-            print(f"Ошибка PDF: {str(e)}")
-            return ""
-
-    def extract_from_rtf(filepath: str) -> str:
-        try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as file:
-                rtf_content = file.read()
-            return rtf_to_text(rtf_content)
-        except Exception as e:
-            print(f"Ошибка RTF: {str(e)}")
-            return ""
-
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Файл не найден: {file_path}")
-
-    extension = Path(file_path).suffix.lower()
-
-    if extension == '.rtf':
-        text = extract_from_rtf(file_path)
-    elif extension == '.docx':
-        text = extract_from_docx(file_path)
-    elif extension == '.pdf':
-        text = extract_from_pdf(file_path)
-    else:
-        raise ValueError(f"Неподдерживаемый формат: {extension}")
-
-    return clean_special_chars(text) if text else ""
+# Реализация вынесена в text_extraction.py: модуль не тянет torch и
+# импортируется воркерами извлечения (extraction_pool.py)
+from text_extraction import (
+    normalize_text,
+    extract_document,
+    extract_text_as_single_line,
+)
 
 # ==============================
 # 2. ПАРСИНГ ТЕКСТА ВАКАНСИИ
 # ==============================
 
 
-def parse_text_to_dict(text: str) -> Dict[str, Union[str, List[str]]]:
-    known_fields = [
-        'Наименование поля', 'Значение', 'Статус', 'Название', 'Регион', 'Город',
-        'Адрес', 'Тип трудового', 'Тип занятости', 'Текст график работы',
-        'Доход (руб/мес)', 'Оклад макс. (руб/мес)', 'Оклад мин. (руб/мес)',
-        'Годовая премия (%)', 'Тип премирования. Описание', 'Обязанности (для публикации)',
-        'Требования (для публикации)', 'Будет преимуществом:', 'Уровень образования',
-        'Требуемый опыт работы', 'Знание специальных программ', 'Навыки работы на компьютере',
-        'Знание иностранных языков', 'Уровень владения языка', 'Наличие командировок',
-        'Дополнительная информация'
-    ]
-
-    field_pattern = '|'.join(re.escape(field) for field in known_fields)
-    parts = re.split(f'({field_pattern})', text)
-    parts = [part.strip() for part in parts if part and part.strip()]
-
-    result = {}
-    i = 0
-    while i < len(parts):
-        part = parts[i]
-        if part in known_fields:
-            current_field = part
-            i += 1
-            value_parts = []
-            while i < len(parts) and parts[i] not in known_fields:
-                value_parts.append(parts[i])
-                i += 1
-            value = ' '.join(value_parts).strip()
-            if any(keyword in current_field.lower() for keyword in ['обязанности', 'требования', 'преимуществом']):
-                if ';' in value:
-                    value_list = [item.strip()
-                                  for item in value.split(';') if item.strip()]
-                    result[current_field] = value_list
-                else:
-                    lines = re.split(r'\n\s*\n|\n(?=\d+\.|\•|\-)', value)
-                    if len(lines) > 1:
-                        result[current_field] = [line.strip()
-                                                 for line in lines if line.strip()]
-                    else:
-                        result[current_field] = value
+VACANCY_FIELDS = (
+    'Наименование поля', 'Значение', 'Статус', 'Название', 'Регион', 'Город',
+    'Адрес', 'Тип трудового', 'Тип занятости', 'Текст график работы',
+    'Доход (руб/мес)', 'Оклад макс. (руб/мес)', 'Оклад мин. (руб/мес)',
+    'Годовая премия (%)', 'Тип премирования. Описание', 'Обязанности (для публикации)',
+    'Требования (для публикации)', 'Будет преимуществом:', 'Уровень образования',
+    'Требуемый опыт работы', 'Знание специальных программ', 'Навыки работы на компьютере',
+    'Знание иностранных языков', 'Уровень владения языка', 'Наличие командировок',
+    'Дополнительная информация'
+)
+LIST_FIELD_KEYWORDS = ('обязанности', 'требования', 'преимуществом')
+LIST_ITEMS_PATTERN = re.compile(r'\n\s*\n|\n(?=\d+\.|\•|\-)')
+
+
+class VacancyFieldSchema:
+    """Набор известных полей шаблона вакансии; регулярка-разделитель компилируется один раз"""
+
+    def __init__(self, fields: tuple, list_field_keywords: tuple = LIST_FIELD_KEYWORDS):
+        self.fields = tuple(fields)
+        # Порядок альтернатив сохраняется: при совпадении в одной позиции побеждает первое поле
+        self._pattern = re.compile('|'.join(re.escape(field)
+                                   for field in self.fields))
+        self._list_fields = frozenset(
+            field for field in self.fields
+            if any(keyword in field.lower() for keyword in list_field_keywords))
+
+    @staticmethod
+    def _split_list(value: str) -> Union[str, List[str]]:
+        if ';' in value:
+            return [item.strip() for item in value.split(';') if item.strip()]
+        lines = LIST_ITEMS_PATTERN.split(value)
+        if len(lines) > 1:
+            return [line.strip() for line in lines if line.strip()]
+        return value
+
+    def parse(self, text: str) -> Dict[str, Union[str, List[str]]]:
+        """Один линейный проход: значение поля — текст до следующего известного поля"""
+        result = {}
+        matches = list(self._pattern.finditer(text))
+        for i, match in enumerate(matches):
+            value_end = matches[i + 1].start() if i + \
+                1 < len(matches) else len(text)
+            field = match.group(0)
+            value = text[match.end():value_end].strip()
+            if field in self._list_fields:
+                result[field] = self._split_list(value)
             else:
-                result[current_field] = value
-        else:
-            i += 1
-    return result
+                result[field] = value
+        return result
+
+
+@lru_cache(maxsize=64)
+def vacancy_field_schema(fields: tuple = VACANCY_FIELDS,
+                         list_field_keywords: tuple = LIST_FIELD_KEYWORDS) -> VacancyFieldSchema:
+    """Скомпилированная схема; каждый шаблон вакансии компилируется один раз на процесс"""
+    return VacancyFieldSchema(fields, list_field_keywords)
+
+
+def parse_text_to_dict(text: str, fields: Optional[Sequence[str]] = None) -> Dict[str, Union[str, List[str]]]:
+    """Разбирает текст вакансии по известным полям; fields — поля другого шаблона вакансии"""
+    schema = vacancy_field_schema(
+        tuple(fields) if fields is not None else VACANCY_FIELDS)
+    return schema.parse(text)
 
 
 def clean_and_format_dict(data_dict: Dict) -> Dict:
@@ -185,15 +149,400 @@ def parse_vacancy_from_json(jsonchick: Dict) -> Dict:
 # 3. АНАЛИЗАТОР СХОЖЕСТИ
 # ==============================
 
+DEFAULT_MODEL_NAME = 'ai-forever/sbert_large_nlu_ru'
+# Быстрый кодировщик первой ступени каскада (см. InterviewAnalyzer.match_requirements_cascade)
+DEFAULT_CASCADE_MODEL_NAME = 'cointegrated/rubert-tiny2'
+REQUIREMENT_PROMPT = "Требование: "
+SOURCE_PROMPT = "Текст кандидата: "
+VACANCY_SECTIONS = ("responsibilities", "requirements", "preferred")
+FEATURE_CATEGORIES = ("technical_skills",
+                      "communication_skills", "case_projects")
+# Бэкенды кодировщика: torch — fp32 (на GPU как есть), int8 — динамическая int8-квантизация
+# линейных слоев PyTorch (только CPU), onnx — граф ONNX Runtime (нужен optimum[onnxruntime])
+ENCODER_BACKENDS = ("torch", "int8", "onnx")
+# Бюджет токенов на батч кодировщика (размер батча x длина самой длинной последовательности в нем)
+DEFAULT_TOKEN_BUDGET = 4096
+BASE_WEIGHTS = {
+    "technical_skills": 0.4,
+    "experience_years_match": 0.3,
+    "communication_skills": 0.15,
+    "case_projects": 0.1,
+    "experience_relevance": 0.05
+}
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    return device if device else ("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """Бэкенд кодировщика: аргумент или переменная окружения ENCODER_BACKEND (по умолчанию torch)"""
+    backend = (backend or os.getenv("ENCODER_BACKEND") or "torch").lower()
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(
+            f"Неизвестный бэкенд кодировщика {backend}, доступны: {', '.join(ENCODER_BACKENDS)}")
+    return backend
+
+
+def encoder_id(model_name: str, backend: str) -> str:
+    """
+    Идентификатор пространства эмбеддингов: ключ кэша и метка CompiledVacancy.
+    Для fp32 совпадает с именем модели, поэтому прежние ключи кэша и вакансии остаются валидными.
+    """
+    return model_name if backend == "torch" else f"{model_name}#{backend}"
+
+
+def load_encoder(model_name: str, device: str, backend: str) -> SentenceTransformer:
+    if backend == "torch":
+        return SentenceTransformer(model_name, device=device)
+    if device != "cpu":
+        raise ValueError(f"Бэкенд {backend} работает только на CPU, запрошен {device}")
+    if backend == "int8":
+        model = SentenceTransformer(model_name, device=device)
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    # Модель экспортируется в ONNX при первой загрузке, если в репозитории нет готового графа
+    return SentenceTransformer(model_name, device=device, backend="onnx")
+
+
+def token_lengths(model: SentenceTransformer, sentences: Sequence[str]) -> np.ndarray:
+    """Длины последовательностей в токенах модели (со служебными токенами и усечением)"""
+    encoded = model.tokenizer(list(sentences), add_special_tokens=True, truncation=True,
+                              max_length=model.max_seq_length)
+    return np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(sentences))
+
+
+def token_budget_buckets(lengths: np.ndarray, token_budget: int) -> List[np.ndarray]:
+    """
+    Сортирует последовательности по длине и режет на батчи, у которых
+    число_последовательностей x максимальная_длина <= token_budget (не меньше одной в батче).
+    Возвращает индексы исходного порядка для каждого батча.
+    """
+    order = np.argsort(lengths, kind="stable")
+    buckets = []
+    start = 0
+    for end in range(1, len(order) + 1):
+        # Длины отсортированы, поэтому максимум батча — длина его последнего элемента
+        if end < len(order) and (end + 1 - start) * lengths[order[end]] <= token_budget:
+            continue
+        buckets.append(order[start:end])
+        start = end
+    return buckets
+
+
+class ModelRegistry:
+    """Загружает каждую тройку (model_name, device, backend) один раз на процесс и раздает ее всем анализаторам"""
+
+    def __init__(self):
+        self._models: Dict[tuple, SentenceTransformer] = {}
+        self._ready: set = set()
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, key: tuple) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _key(model_name: str, device: Optional[str], backend: Optional[str]) -> tuple:
+        return model_name, resolve_device(device), resolve_backend(backend)
+
+    def get(self, model_name: str = DEFAULT_MODEL_NAME, device: Optional[str] = None,
+            backend: Optional[str] = None) -> SentenceTransformer:
+        key = self._key(model_name, device, backend)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        # Блокировка на ключ: параллельные сессии ждут одну загрузку, а не грузят копии
+        with self._lock_for(key):
+            model = self._models.get(key)
+            if model is None:
+                model = load_encoder(*key)
+                self._models[key] = model
+        return model
+
+    def warmup(self, model_name: str = DEFAULT_MODEL_NAME, device: Optional[str] = None,
+               backend: Optional[str] = None) -> None:
+        """Загружает модель и прогоняет пробный батч, чтобы первый запрос не платил за инициализацию"""
+        key = self._key(model_name, device, backend)
+        model = self.get(*key)
+        model.encode([f"{REQUIREMENT_PROMPT}прогрев",
+                     f"{SOURCE_PROMPT}прогрев"], device=key[1])
+        self._ready.add(key)
+
+    def is_ready(self, model_name: str = DEFAULT_MODEL_NAME, device: Optional[str] = None,
+                 backend: Optional[str] = None) -> bool:
+        return self._key(model_name, device, backend) in self._ready
+
+    def status(self) -> Dict:
+        return {
+            "loaded": [f"{encoder_id(name, backend)}@{device}" for name, device, backend in self._models],
+            "ready": [f"{encoder_id(name, backend)}@{device}" for name, device, backend in self._ready]
+        }
+
+
+model_registry = ModelRegistry()
+
+
+class CompiledVacancy:
+    """
+    Вакансия, подготовленная к анализу: структура, категории пунктов, активные веса,
+    диапазон требуемого опыта и матрица эмбеддингов требований.
+    Компилируется один раз и сериализуется в байты (npz) для диска или объектного хранилища.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, vacancy: Dict, items: List[Dict], active_weights: Dict, required_experience: str,
+                 experience_range: tuple, model_name: str, requirement_texts: List[str],
+                 requirement_embeddings: np.ndarray):
+        self.vacancy = vacancy
+        self.items = items
+        self.active_weights = active_weights
+        self.required_experience = required_experience
+        self.experience_range = tuple(experience_range)
+        self.model_name = model_name
+        self.requirement_texts = requirement_texts
+        self.requirement_embeddings = np.asarray(
+            requirement_embeddings, dtype=np.float32)
+
+    def features(self) -> List[Dict]:
+        return [{"requirement": item["text"], "category": item["category"]}
+                for item in self.items if item["category"] in FEATURE_CATEGORIES]
+
+    def to_bytes(self) -> bytes:
+        meta = {
+            "format_version": self.FORMAT_VERSION,
+            "vacancy": self.vacancy,
+            "items": self.items,
+            "active_weights": self.active_weights,
+            "required_experience": self.required_experience,
+            "experience_range": list(self.experience_range),
+            "model_name": self.model_name,
+            "requirement_texts": self.requirement_texts,
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            meta=np.frombuffer(json.dumps(
+                meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+            requirement_embeddings=self.requirement_embeddings
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompiledVacancy":
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+            embeddings = archive["requirement_embeddings"]
+        if meta.get("format_version") != cls.FORMAT_VERSION:
+            raise ValueError(
+                f"Неподдерживаемая версия скомпилированной вакансии: {meta.get('format_version')}")
+        return cls(
+            vacancy=meta["vacancy"],
+            items=meta["items"],
+            active_weights=meta["active_weights"],
+            required_experience=meta["required_experience"],
+            experience_range=meta["experience_range"],
+            model_name=meta["model_name"],
+            requirement_texts=meta["requirement_texts"],
+            requirement_embeddings=embeddings
+        )
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledVacancy":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _trie_regex(words: List[str]) -> str:
+    """Регулярка-префиксное дерево: в каждой позиции жадно находит самое длинное слово"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(
+            branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Поиск подстрок из нескольких упорядоченных групп ключевых слов за один проход.
+    Все слова собраны в одно префиксное дерево внутри lookahead, поэтому пересекающиеся
+    вхождения не теряются. В каждой позиции находится самое длинное слово; все прочие
+    слова, начинающиеся там же, — его префиксы, их группы посчитаны заранее.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]], memo_size: int = 16384):
+        self.names = list(groups)
+        keyword_groups: Dict[str, set] = {}
+        for index, keywords in enumerate(groups.values()):
+            for kw in keywords:
+                keyword_groups.setdefault(kw, set()).add(index)
+        self._prefix_groups = {}
+        for kw in keyword_groups:
+            indices = set()
+            for end in range(len(kw) + 1):
+                indices |= keyword_groups.get(kw[:end], set())
+            self._prefix_groups[kw] = (min(indices), frozenset(indices))
+        self._pattern = re.compile(
+            f"(?=({_trie_regex(list(keyword_groups))}))") if keyword_groups else None
+        self.first = lru_cache(maxsize=memo_size)(self._first)
+        self.present = lru_cache(maxsize=memo_size)(self._present)
+
+    def _first(self, text: str) -> Optional[str]:
+        """Первая по порядку группа, слово которой встречается в тексте"""
+        if self._pattern is None:
+            return None
+        best = len(self.names)
+        for match in self._pattern.finditer(text.lower()):
+            best = min(best, self._prefix_groups[match.group(1)][0])
+            if best == 0:
+                break
+        return self.names[best] if best < len(self.names) else None
+
+    def _present(self, text: str) -> frozenset:
+        """Все группы, слова которых встречаются в тексте"""
+        if self._pattern is None:
+            return frozenset()
+        found = set()
+        for match in self._pattern.finditer(text.lower()):
+            found |= self._prefix_groups[match.group(1)][1]
+            if len(found) == len(self.names):
+                break
+        return frozenset(self.names[index] for index in found)
+
+
+@lru_cache(maxsize=32)
+def _compile_keyword_matcher(groups: tuple) -> KeywordMatcher:
+    return KeywordMatcher({name: list(keywords) for name, keywords in groups})
+
+
+def keyword_matcher(groups: Dict[str, List[str]]) -> KeywordMatcher:
+    """Скомпилированный матчер; одинаковые наборы групп компилируются один раз на процесс"""
+    return _compile_keyword_matcher(tuple((name, tuple(keywords)) for name, keywords in groups.items()))
+
+
+# Длительность «N лет/года [и] M месяцев» или «M месяцев»; каждый отрезок находится один раз.
+# Общий числовой префикс у обеих ветвей: движок проверяет единицы только после числа.
+# Числа из четырех цифр — это даты («2015 года»), а не стаж.
+EXPERIENCE_SPAN_PATTERN = re.compile(
+    r'(?<!\d)(?P<number>\d{1,3})\s*(?:'
+    r'(?P<years_unit>лет|год(?:а|ов)?)(?![а-я])'
+    r'(?:\s*(?:и\s*)?(?P<extra_months>\d{1,2})\s*месяц(?:а|ев)?(?![а-я]))?'
+    r'|месяц(?:а|ев)?(?![а-я]))'
+)
+
+
+def find_experience_spans(text: str) -> List[Dict]:
+    """Находит отрезки стажа за один проход; возвращает текст, позиции и длительность в месяцах"""
+    spans = []
+    for match in EXPERIENCE_SPAN_PATTERN.finditer(text.lower()):
+        number = int(match.group("number"))
+        if match.group("years_unit") is not None:
+            months = number * 12 + int(match.group("extra_months") or 0)
+        else:
+            months = number
+        spans.append({
+            "text": match.group(0),
+            "start": match.start(),
+            "end": match.end(),
+            "months": months
+        })
+    return spans
+
+
+def extract_experience_spans(text_list: List[str]) -> tuple:
+    """Суммарный стаж в месяцах и отрезки, из которых он сложен (позиции — в тексте, склеенном пробелами)"""
+    spans = find_experience_spans(" ".join(text_list))
+    return sum(span["months"] for span in spans), spans
+
+
+# Грамматика разделов резюме; компилируется один раз на процесс
+RESUME_REPEATED_EXPERIENCE = re.compile(
+    r'(Опыт работы\s*—[^—]+)\s*\1+', re.IGNORECASE)
+RESUME_REPEATED_HEADERS = re.compile(
+    r'(?P<education>(?:Образование\s+)+)|(?P<skills>(?:Навыки\s+)+)'
+    r'|(?P<about>(?:Дополнительная информация\s+)+)', re.IGNORECASE)
+RESUME_CANONICAL_HEADERS = {
+    "education": "Образование ",
+    "skills": "Навыки ",
+    "about": "Дополнительная информация ",
+}
+RESUME_SECTION_SPLIT = re.compile(
+    r'(?=\n*(Опыт работы|Образование|Навыки|Дополнительная информация|Обо мне)\s*[:—]?)',
+    re.IGNORECASE)
+# Порядок групп — приоритет разделов, если в части встречается несколько заголовков
+RESUME_SECTION_HEADER = re.compile(
+    r'(?P<experience>Опыт работы)|(?P<skills>Навыки)|(?P<education>Образование)'
+    r'|(?P<about>Дополнительная информация|Обо мне)', re.IGNORECASE)
+RESUME_SKILLS_SPLIT = re.compile(r'[,;\n•–—\-\s]\s*')
+RESUME_SENTENCE_SPLIT = re.compile(r'[.!?]+(?=\s+[А-Я]|$)')
+RESUME_EXPERIENCE_BLOCK = re.compile(r'([А-Яа-я]+\s+\d{4}\s*—\s*[А-Яа-я\s\d]+)')
+
+
+def _section_header(part: str) -> Optional[str]:
+    """Раздел, к которому относится часть; приоритет как у последовательных проверок"""
+    found = {match.lastgroup for match in RESUME_SECTION_HEADER.finditer(part)}
+    for section in ("experience", "skills", "education", "about"):
+        if section in found:
+            return section
+    return None
+
+
+DEPTH_INDICATORS = {
+    "example": ["на проекте", "в компании", "у нас был", "когда я работал", "однажды"],
+    "detail": ["использовал", "настроил", "применил", "инструмент", "технология", "версия", "v1", "v2"],
+    "result": ["сократил", "увеличил", "добился", "улучшил", "экономия", "результат", "kpi"]
+}
+
 
 class InterviewAnalyzer:
-    def __init__(self, model_name='ai-forever/sbert_large_nlu_ru', device=None, threshold=0.5, default_soft_skill_score=0.3):
-        self.device = device if device else (
-            "cuda" if torch.cuda.is_available() else "cpu")
-        self.model = SentenceTransformer(model_name, device=self.device)
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, device=None, threshold=0.5, default_soft_skill_score=0.3, batch_size=32,
+                 embedding_cache: Optional[EmbeddingCache] = None, stream_batch_size=256, backend: Optional[str] = None,
+                 cascade_model_name: Optional[str] = None, cascade_band=0.1, cascade_top_k=5,
+                 token_budget: Optional[int] = None):
+        self.device = resolve_device(device)
+        self.model_name = model_name
+        self.backend = resolve_backend(backend)
+        self.encoder_id = encoder_id(model_name, self.backend)
+        self.model = model_registry.get(model_name, self.device, self.backend)
+        # Каскад: малая модель оценивает все пары, большая — только пограничные требования
+        # Пустая строка отключает каскад, даже если задан ENCODER_CASCADE_MODEL
+        if cascade_model_name is None:
+            cascade_model_name = os.getenv("ENCODER_CASCADE_MODEL")
+        self.cascade_model = model_registry.get(
+            cascade_model_name, self.device, self.backend) if cascade_model_name else None
+        self.cascade_encoder_id = encoder_id(
+            cascade_model_name, self.backend) if cascade_model_name else None
+        self.cascade_band = cascade_band
+        self.cascade_top_k = cascade_top_k
+        self.embedding_cache = embedding_cache if embedding_cache is not None else default_embedding_cache()
         self.threshold = threshold
+        self.batch_size = batch_size
+        # 0 — прежнее поведение: батчи фиксированного размера batch_size
+        self.token_budget = int(os.getenv("ENCODER_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)) \
+            if token_budget is None else token_budget
+        self.stream_batch_size = stream_batch_size
         self.default_soft_skill_score = default_soft_skill_score
         self.CATEGORIES_CONFIG = self._get_categories_config()
+        self._category_matcher = keyword_matcher(self.CATEGORIES_CONFIG)
+        self._depth_matcher = keyword_matcher(DEPTH_INDICATORS)
 
     def _get_categories_config(self):
         return {
@@ -223,37 +572,10 @@ class InterviewAnalyzer:
         }
 
     def categorize_item(self, item_text: str) -> str:
-        item_lower = item_text.lower()
-        for category, keywords in self.CATEGORIES_CONFIG.items():
-            if any(kw in item_lower for kw in keywords):
-                return category
-        return "experience_relevance"
+        return self._category_matcher.first(item_text) or "experience_relevance"
 
     def extract_experience_from_text(self, text_list: List[str]) -> int:
-        full_text = " ".join(text_list).lower()
-        patterns = [
-            r'(\d+)\s*лет?\s*(\d+)?\s*месяц[а-я]*',
-            r'(\d+)\s*года?\s*(\d+)?\s*месяц[а-я]*',
-            r'(\d+)\s*лет?',
-            r'(\d+)\s*года?',
-            r'(\d+)\s*год[а-я]*',
-            r'(\d+)\s*месяц[а-я]*'
-        ]
-        total_months = 0
-        for pattern in patterns:
-            matches = re.findall(pattern, full_text)
-            for match in matches:
-                if isinstance(match, tuple):
-                    years = int(match[0]) if match[0] else 0
-                    months = int(match[1]) if len(
-                        match) > 1 and match[1] else 0
-                else:
-                    num = int(match)
-                    if "лет" in pattern or "год" in pattern:
-                        years, months = num, 0
-                    else:
-                        years, months = 0, num
-                total_months += years * 12 + months
+        total_months, _ = extract_experience_spans(text_list)
         return total_months
 
     def parse_required_experience(self, exp_str: str) -> tuple:
@@ -291,6 +613,9 @@ class InterviewAnalyzer:
 
     def match_experience(self, candidate_months: int, vacancy_exp_str: str) -> float:
         min_req, max_req = self.parse_required_experience(vacancy_exp_str)
+        return self.match_experience_range(candidate_months, min_req, max_req)
+
+    def match_experience_range(self, candidate_months: int, min_req: int, max_req: int) -> float:
         if max_req == 0 and min_req == 0:
             return 1.0
         if min_req <= candidate_months <= max_req:
@@ -305,18 +630,9 @@ class InterviewAnalyzer:
             return 0.0
 
     def evaluate_answer_depth(self, answer_text: str) -> Dict:
-        text = answer_text.lower()
-        indicators = {
-            "example": ["на проекте", "в компании", "у нас был", "когда я работал", "однажды"],
-            "detail": ["использовал", "настроил", "применил", "инструмент", "технология", "версия", "v1", "v2"],
-            "result": ["сократил", "увеличил", "добился", "улучшил", "экономия", "результат", "kpi"]
-        }
-        score = 0
-        reasons = []
-        for key, phrases in indicators.items():
-            if any(phrase in text for phrase in phrases):
-                score += 1
-                reasons.append(key)
+        found = self._depth_matcher.present(answer_text)
+        reasons = [key for key in DEPTH_INDICATORS if key in found]
+        score = len(reasons)
         depth_level = "surface"
         if score >= 3:
             depth_level = "detailed"
@@ -341,53 +657,210 @@ class InterviewAnalyzer:
         is_matched = score >= self.threshold
         return is_matched, source_text, score
 
-    def analyze(self, resume_input: Union[str, List[str]], vacancy: Dict, weights: Optional[Dict] = None, return_features: bool = False) -> Dict:
-        base_weights = {
-            "technical_skills": 0.4,
-            "experience_years_match": 0.3,
-            "communication_skills": 0.15,
-            "case_projects": 0.1,
-            "experience_relevance": 0.05
-        }
+    def _encode_batch(self, sentences: List[str], model: Optional[SentenceTransformer] = None) -> np.ndarray:
+        """
+        При token_budget > 0 тексты группируются по длине в токенах в батчи под бюджет:
+        короткие навыки идут большими батчами, длинные абзацы — маленькими, без лишнего паддинга.
+        Эмбеддинги возвращаются в исходном порядке.
+        """
+        model = model or self.model
+        if not self.token_budget or len(sentences) <= 1:
+            return model.encode(
+                sentences,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                device=self.device
+            )
+
+        embeddings = np.empty(
+            (len(sentences), model.get_sentence_embedding_dimension()), dtype=np.float32)
+        for bucket in token_budget_buckets(token_lengths(model, sentences), self.token_budget):
+            embeddings[bucket] = model.encode(
+                [sentences[i] for i in bucket],
+                batch_size=len(bucket),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                device=self.device
+            )
+        return embeddings
+
+    def encode_texts(self, texts: List[str], prompt: str = "", cascade: bool = False) -> np.ndarray:
+        """
+        Кодирует тексты батчами, возвращает нормированные эмбеддинги (n, dim).
+        cascade=True — кодировать малой моделью первой ступени каскада.
+        """
+        model = self.cascade_model if cascade else self.model
+        if self.embedding_cache is None:
+            return self._encode_batch([f"{prompt}{text}" for text in texts], model)
+
+        model_id = self.cascade_encoder_id if cascade else self.encoder_id
+        keys = [make_cache_key(model_id, prompt, text)
+                for text in texts]
+        vectors = self.embedding_cache.get_many(keys, model_id)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self._encode_batch(
+                [f"{prompt}{texts[i]}" for i in missing], model)
+            self.embedding_cache.put_many(
+                [keys[i] for i in missing], fresh, model_id)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return np.vstack(vectors).astype(np.float32, copy=False)
+
+    @staticmethod
+    def _unique_texts(texts: Iterable[str]) -> List[str]:
+        return list(dict.fromkeys(text for text in texts if text.strip()))
+
+    def _source_batches(self, source_texts: Iterable[str]) -> Iterator[List[str]]:
+        """Уникальные непустые тексты пачками по stream_batch_size по мере поступления"""
+        seen = set()
+        batch = []
+        for text in source_texts:
+            if not text.strip() or text in seen:
+                continue
+            seen.add(text)
+            batch.append(text)
+            if len(batch) >= self.stream_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def match_requirements(self, requirement_texts: List[str], source_texts: Iterable[str],
+                           requirement_embeddings: Optional[np.ndarray] = None) -> List[tuple]:
+        """
+        Для каждого требования находит лучший фрагмент кандидата.
+        Каждый уникальный текст кодируется один раз. Тексты кандидата можно передать
+        генератором: они кодируются пачками по мере появления, а лучшие оценки
+        обновляются на лету, поэтому память не растет с длиной резюме.
+        requirement_embeddings — готовые эмбеддинги уникальных требований (см. CompiledVacancy).
+        Возвращает список (score, source) в порядке requirement_texts;
+        (0.0, None), если совпадений с положительным сходством нет.
+        """
+        unique_requirements = self._unique_texts(requirement_texts)
+        if not unique_requirements:
+            return [(0.0, None)] * len(requirement_texts)
+
+        best_scores = np.zeros(len(unique_requirements), dtype=np.float64)
+        best_sources: List[Optional[str]] = [None] * len(unique_requirements)
+        for batch in self._source_batches(source_texts):
+            if requirement_embeddings is None:
+                requirement_embeddings = self.encode_texts(
+                    unique_requirements, REQUIREMENT_PROMPT)
+            self._update_best(requirement_embeddings, batch, self.encode_texts(batch, SOURCE_PROMPT),
+                              best_scores, best_sources)
+        return self._collect_matches(requirement_texts, unique_requirements, best_scores, best_sources)
+
+    def match_requirements_cascade(self, requirement_texts: List[str], source_texts: Iterable[str],
+                                   requirement_embeddings: Optional[np.ndarray] = None) -> tuple:
+        """
+        Каскадный вариант match_requirements. Малая модель оценивает все пары требование-фрагмент;
+        требования, чья лучшая оценка лежит в полосе threshold ± cascade_band, пересчитываются
+        большой моделью по cascade_top_k лучшим фрагментам малой модели. Остальные требования
+        получают оценку и фрагмент малой модели.
+        Возвращает (список (score, source), статистика ступеней: количества и время).
+        """
+        unique_requirements = self._unique_texts(requirement_texts)
+        sources = self._unique_texts(source_texts)
+        stats = {"requirements": len(unique_requirements), "sources": len(sources),
+                 "small_pairs": len(unique_requirements) * len(sources), "small_seconds": 0.0,
+                 "borderline_requirements": 0, "large_sources": 0, "large_pairs": 0, "large_seconds": 0.0}
+        if not unique_requirements or not sources:
+            return [(0.0, None)] * len(requirement_texts), stats
+
+        started = time.perf_counter()
+        scores = self.encode_texts(unique_requirements, REQUIREMENT_PROMPT, cascade=True) @ \
+            self.encode_texts(sources, SOURCE_PROMPT, cascade=True).T
+        best_scores = np.zeros(len(unique_requirements), dtype=np.float64)
+        best_sources: List[Optional[str]] = [None] * len(unique_requirements)
+        self._update_best_from_scores(scores, sources, best_scores, best_sources)
+        stats["small_seconds"] = round(time.perf_counter() - started, 4)
+
+        small_best = scores.max(axis=1)
+        borderline = np.flatnonzero(
+            np.abs(small_best - self.threshold) <= self.cascade_band)
+        if len(borderline):
+            started = time.perf_counter()
+            top_k = min(self.cascade_top_k, len(sources))
+            shortlist = np.argpartition(-scores[borderline], top_k - 1, axis=1)[:, :top_k]
+            source_rows = np.unique(shortlist)
+            if requirement_embeddings is None:
+                large_requirements = self.encode_texts(
+                    [unique_requirements[row] for row in borderline], REQUIREMENT_PROMPT)
+            else:
+                large_requirements = requirement_embeddings[borderline]
+            large_scores = large_requirements @ self.encode_texts(
+                [sources[row] for row in source_rows], SOURCE_PROMPT).T
+            # Каждое требование сравнивается только со своим коротким списком фрагментов
+            allowed = np.zeros(large_scores.shape, dtype=bool)
+            allowed[np.arange(len(borderline))[:, None],
+                    np.searchsorted(source_rows, shortlist)] = True
+            large_scores = np.where(allowed, large_scores, -np.inf)
+            large_best = np.zeros(len(borderline), dtype=np.float64)
+            large_sources: List[Optional[str]] = [None] * len(borderline)
+            self._update_best_from_scores(
+                large_scores, [sources[row] for row in source_rows], large_best, large_sources)
+            for i, row in enumerate(borderline):
+                best_scores[row] = large_best[i]
+                best_sources[row] = large_sources[i]
+            stats.update(borderline_requirements=int(len(borderline)), large_sources=int(len(source_rows)),
+                         large_pairs=int(len(borderline) * top_k),
+                         large_seconds=round(time.perf_counter() - started, 4))
+        return self._collect_matches(requirement_texts, unique_requirements, best_scores, best_sources), stats
+
+    @classmethod
+    def _update_best(cls, requirement_embeddings: np.ndarray, sources: List[str], source_embeddings: np.ndarray,
+                     best_scores: np.ndarray, best_sources: List[Optional[str]]) -> None:
+        """Обновляет лучшие оценки требований по пачке фрагментов (только строгим улучшением)"""
+        cls._update_best_from_scores(requirement_embeddings @ source_embeddings.T,
+                                     sources, best_scores, best_sources)
+
+    @staticmethod
+    def _update_best_from_scores(scores: np.ndarray, sources: List[str],
+                                 best_scores: np.ndarray, best_sources: List[Optional[str]]) -> None:
+        # argmax берет первый максимум — как строгое сравнение в попарном цикле
+        best_idx = scores.argmax(axis=1)
+        batch_best = scores[np.arange(len(best_idx)), best_idx]
+        for row in np.flatnonzero(batch_best > best_scores):
+            best_scores[row] = batch_best[row]
+            best_sources[row] = sources[best_idx[row]]
+
+    @staticmethod
+    def _collect_matches(requirement_texts: List[str], unique_requirements: List[str],
+                         best_scores: np.ndarray, best_sources: List[Optional[str]]) -> List[tuple]:
+        requirement_rows = {text: row for row,
+                            text in enumerate(unique_requirements)}
+        results = []
+        for text in requirement_texts:
+            row = requirement_rows.get(text)
+            if row is None or best_sources[row] is None:
+                results.append((0.0, None))
+            else:
+                results.append((float(best_scores[row]), best_sources[row]))
+        return results
+
+    @classmethod
+    def _best_matches(cls, requirement_texts: List[str], unique_requirements: List[str], requirement_embeddings: np.ndarray,
+                      sources: List[str], source_embeddings: np.ndarray) -> List[tuple]:
+        best_scores = np.zeros(len(unique_requirements), dtype=np.float64)
+        best_sources: List[Optional[str]] = [None] * len(unique_requirements)
+        if sources:
+            cls._update_best(requirement_embeddings, sources,
+                             source_embeddings, best_scores, best_sources)
+        return cls._collect_matches(requirement_texts, unique_requirements, best_scores, best_sources)
+
+    def _active_weights(self, items: List[Dict], required_exp_str: str, experience_range: tuple,
+                        weights: Optional[Dict] = None) -> Dict:
         if weights is None:
-            weights = base_weights.copy()
-
-        # Определяем тип входных данных
-        if isinstance(resume_input, str):
-            fragments = self._parse_resume_into_fragments(resume_input)
-            candidate_total_months = self.extract_experience_from_text([
-                                                                       resume_input])
-            all_source_texts = fragments
-            is_interview = False
-        elif isinstance(resume_input, list) and all(isinstance(x, str) for x in resume_input):
-            answers_text_list = [
-                ans.strip() for ans in resume_input if isinstance(ans, str) and ans.strip()]
-            candidate_total_months = self.extract_experience_from_text(
-                answers_text_list)
-            all_source_texts = answers_text_list
-            is_interview = True
-        else:
-            raise ValueError("resume_input должен быть str или list[str]")
-
-        required_exp_str = vacancy.get(
-            "Требуемый опыт работы", "") or vacancy.get("experience_years", "")
-        exp_match_score = self.match_experience(
-            candidate_total_months, required_exp_str)
-
-        all_vacancy_items = (
-            [{"text": r, "category": "responsibilities"} for r in vacancy.get("responsibilities", []) if r] +
-            [{"text": r, "category": "requirements"} for r in vacancy.get("requirements", []) if r] +
-            [{"text": r, "category": "preferred"}
-                for r in vacancy.get("preferred", []) if r]
-        )
+            weights = BASE_WEIGHTS.copy()
 
         present_categories = set()
-        for item in all_vacancy_items:
-            cat = self.categorize_item(item["text"])
-            if cat in weights:
-                present_categories.add(cat)
+        for item in items:
+            if item["category"] in weights:
+                present_categories.add(item["category"])
 
-        if not required_exp_str.strip() or self.parse_required_experience(required_exp_str) == (0, 0):
+        if not required_exp_str.strip() or experience_range == (0, 0):
             present_categories.discard("experience_years_match")
         else:
             present_categories.add("experience_years_match")
@@ -401,26 +874,189 @@ class InterviewAnalyzer:
         if total_weight > 0:
             active_weights = {k: v / total_weight for k,
                               v in active_weights.items()}
+        return active_weights
+
+    def compile_vacancy(self, vacancy: Dict, weights: Optional[Dict] = None) -> "CompiledVacancy":
+        """Готовит вакансию к анализу один раз: категории, веса, диапазон опыта и эмбеддинги требований"""
+        items = self._vacancy_items(vacancy)
+        requirement_texts = self._unique_texts(
+            [item["text"] for item in items])
+        if requirement_texts:
+            requirement_embeddings = self.encode_texts(
+                requirement_texts, REQUIREMENT_PROMPT)
+        else:
+            requirement_embeddings = np.zeros(
+                (0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return self._build_compiled_vacancy(vacancy, items, requirement_texts, requirement_embeddings, weights)
+
+    def _vacancy_items(self, vacancy: Dict) -> List[Dict]:
+        return [
+            {"text": text, "section": section, "category": self.categorize_item(text)}
+            for section in VACANCY_SECTIONS
+            for text in vacancy.get(section, []) if text
+        ]
+
+    def _build_compiled_vacancy(self, vacancy: Dict, items: List[Dict], requirement_texts: List[str],
+                                requirement_embeddings: np.ndarray, weights: Optional[Dict]) -> "CompiledVacancy":
+        required_exp_str = vacancy.get(
+            "Требуемый опыт работы", "") or vacancy.get("experience_years", "")
+        experience_range = self.parse_required_experience(required_exp_str)
+        return CompiledVacancy(
+            vacancy=vacancy,
+            items=items,
+            active_weights=self._active_weights(
+                items, required_exp_str, experience_range, weights),
+            required_experience=required_exp_str,
+            experience_range=experience_range,
+            model_name=self.encoder_id,
+            requirement_texts=requirement_texts,
+            requirement_embeddings=requirement_embeddings
+        )
+
+    def _prepare_candidate(self, resume_input: Union[str, List[str]]) -> tuple:
+        """Возвращает (тексты кандидата, стаж в месяцах, это интервью); фрагменты резюме — генератор"""
+        if isinstance(resume_input, str):
+            fragments = self.iter_resume_fragments(resume_input)
+            candidate_total_months = self.extract_experience_from_text([
+                                                                       resume_input])
+            return fragments, candidate_total_months, False
+        elif isinstance(resume_input, list) and all(isinstance(x, str) for x in resume_input):
+            answers_text_list = [
+                ans.strip() for ans in resume_input if isinstance(ans, str) and ans.strip()]
+            candidate_total_months = self.extract_experience_from_text(
+                answers_text_list)
+            return answers_text_list, candidate_total_months, True
+        else:
+            raise ValueError("resume_input должен быть str или list[str]")
+
+    def _compiled(self, vacancy: Union[Dict, "CompiledVacancy"], weights: Optional[Dict]) -> tuple:
+        """Возвращает (скомпилированная вакансия, активные веса)"""
+        if not isinstance(vacancy, CompiledVacancy):
+            compiled = self.compile_vacancy(vacancy, weights)
+            return compiled, compiled.active_weights
+        if vacancy.model_name != self.encoder_id:
+            raise ValueError(
+                f"Вакансия скомпилирована для модели {vacancy.model_name}, анализатор использует {self.encoder_id}")
+        if weights is None:
+            return vacancy, vacancy.active_weights
+        return vacancy, self._active_weights(vacancy.items, vacancy.required_experience,
+                                             vacancy.experience_range, weights)
+
+    def analyze(self, resume_input: Union[str, List[str]], vacancy: Union[Dict, "CompiledVacancy"], weights: Optional[Dict] = None, return_features: bool = False) -> Dict:
+        compiled, active_weights = self._compiled(vacancy, weights)
+        all_source_texts, candidate_total_months, is_interview = self._prepare_candidate(
+            resume_input)
+
+        requirement_texts = [item["text"] for item in compiled.items]
+        if self.cascade_model is None:
+            best_matches = self.match_requirements(
+                requirement_texts, all_source_texts,
+                requirement_embeddings=compiled.requirement_embeddings)
+            return self._build_result(compiled, active_weights, best_matches, candidate_total_months,
+                                      is_interview, return_features)
+
+        best_matches, cascade_stats = self.match_requirements_cascade(
+            requirement_texts, all_source_texts,
+            requirement_embeddings=compiled.requirement_embeddings)
+        result = self._build_result(compiled, active_weights, best_matches, candidate_total_months,
+                                    is_interview, return_features)
+        result["cascade"] = cascade_stats
+        return result
+
+    def iter_rank_resumes(self, vacancy: Union[Dict, "CompiledVacancy"],
+                          resumes: Union[Dict[str, str], Iterable[str]], weights: Optional[Dict] = None,
+                          group_size: int = 32, return_features: bool = False) -> Iterator[Dict]:
+        """
+        Оценивает пул резюме против одной вакансии. Вакансия кодируется один раз,
+        фрагменты резюме группы кодируются общими батчами. Результаты (с полем
+        candidate_id) отдаются в порядке входных резюме, но только после кодирования
+        всей группы: group_size обменивает задержку до первого результата на пропускную
+        способность, group_size=1 отдает каждое резюме сразу после его оценки.
+        С каскадом (ENCODER_CASCADE_MODEL) каждое резюме сопоставляется так же, как в
+        analyze, и результат содержит поле cascade.
+        """
+        if group_size < 1:
+            raise ValueError("group_size должен быть положительным")
+        compiled, active_weights = self._compiled(vacancy, weights)
+        requirement_texts = [item["text"] for item in compiled.items]
+        candidates = resumes.items() if isinstance(
+            resumes, dict) else enumerate(resumes)
+
+        group = []
+        for candidate_id, resume_text in candidates:
+            group.append((candidate_id, resume_text))
+            if len(group) >= group_size:
+                yield from self._rank_group(compiled, active_weights, requirement_texts, group, return_features)
+                group = []
+        if group:
+            yield from self._rank_group(compiled, active_weights, requirement_texts, group, return_features)
+
+    def _rank_group(self, compiled: "CompiledVacancy", active_weights: Dict, requirement_texts: List[str],
+                    group: List[tuple], return_features: bool) -> Iterator[Dict]:
+        if self.cascade_model is not None:
+            # Каскад выбирает фрагменты для большой модели по каждому резюме отдельно
+            for candidate_id, resume_text in group:
+                fragments, candidate_total_months, _ = self._prepare_candidate(
+                    resume_text)
+                best_matches, cascade_stats = self.match_requirements_cascade(
+                    requirement_texts, fragments, requirement_embeddings=compiled.requirement_embeddings)
+                result = self._build_result(compiled, active_weights, best_matches, candidate_total_months,
+                                            False, return_features)
+                yield {"candidate_id": candidate_id, **result, "cascade": cascade_stats}
+            return
+
+        prepared = []
+        fragment_rows: Dict[str, int] = {}
+        for candidate_id, resume_text in group:
+            fragments, candidate_total_months, _ = self._prepare_candidate(
+                resume_text)
+            sources = self._unique_texts(fragments)
+            for fragment in sources:
+                fragment_rows.setdefault(fragment, len(fragment_rows))
+            prepared.append((candidate_id, sources, candidate_total_months))
+
+        # Фрагменты всех резюме группы кодируются одним вызовом; общие строки — один раз
+        if fragment_rows and compiled.requirement_texts:
+            group_embeddings = self.encode_texts(
+                list(fragment_rows), SOURCE_PROMPT)
+
+        for candidate_id, sources, candidate_total_months in prepared:
+            if sources and compiled.requirement_texts:
+                rows = [fragment_rows[fragment] for fragment in sources]
+                best_matches = self._best_matches(requirement_texts, compiled.requirement_texts,
+                                                  compiled.requirement_embeddings, sources, group_embeddings[rows])
+            else:
+                best_matches = [(0.0, None)] * len(requirement_texts)
+            result = self._build_result(compiled, active_weights, best_matches, candidate_total_months,
+                                        False, return_features)
+            yield {"candidate_id": candidate_id, **result}
+
+    def rank_resumes(self, vacancy: Union[Dict, "CompiledVacancy"], resumes: Union[Dict[str, str], Iterable[str]],
+                     weights: Optional[Dict] = None, group_size: int = 32, return_features: bool = False) -> List[Dict]:
+        """Ранжирует резюме по total_match_percent (по убыванию)"""
+        results = list(self.iter_rank_resumes(
+            vacancy, resumes, weights, group_size, return_features))
+        return sorted(results, key=lambda r: r["total_match_percent"], reverse=True)
+
+    def _build_result(self, compiled: "CompiledVacancy", active_weights: Dict, best_matches: List[tuple],
+                      candidate_total_months: int, is_interview: bool, return_features: bool,
+                      answer_depths: Optional[Dict[str, Dict]] = None) -> Dict:
+        """answer_depths — уже посчитанная глубина ответов (см. interview_scorer.py)"""
+        min_req, max_req = compiled.experience_range
+        exp_match_score = self.match_experience_range(
+            candidate_total_months, min_req, max_req)
 
         category_scores = {cat: []
                            for cat in active_weights if cat != "experience_years_match"}
         matched_items = []
 
-        for item in all_vacancy_items:
-            best_score = 0.0
-            best_source = None
+        for item, (best_score, best_source) in zip(compiled.items, best_matches):
             best_depth = None
+            if is_interview and best_source:
+                best_depth = (answer_depths or {}).get(
+                    best_source) or self.evaluate_answer_depth(best_source)
 
-            for src_text in all_source_texts:
-                is_matched, source, score = self.match_text_to_requirement(
-                    src_text, item["text"])
-                if score > best_score:
-                    best_score = score
-                    best_source = source
-                    if is_interview:
-                        best_depth = self.evaluate_answer_depth(source)
-
-            cat = self.categorize_item(item["text"])
+            cat = item["category"]
 
             matched_item = {
                 "item": item["text"],
@@ -444,8 +1080,8 @@ class InterviewAnalyzer:
             if scores:
                 avg = sum(scores) / len(scores)
             else:
-                cat_items = [item for item in all_vacancy_items if self.categorize_item(
-                    item["text"]) == cat]
+                cat_items = [
+                    item for item in compiled.items if item["category"] == cat]
                 if cat_items:
                     if cat == "communication_skills":
                         avg = self.default_soft_skill_score
@@ -470,62 +1106,65 @@ class InterviewAnalyzer:
             "candidate_experience": {
                 "total_months": int(candidate_total_months),
                 "total_years": round(candidate_total_months / 12, 1),
-                "required_experience": required_exp_str,
+                "required_experience": compiled.required_experience,
                 "match_score": round(exp_match_score, 3)
             },
             "weights_used": active_weights
         }
 
         if return_features:
-            result["features_used"] = self.extract_features_from_vacancy(
-                vacancy)
+            result["features_used"] = compiled.features()
 
         return result
 
-    def extract_features_from_vacancy(self, vacancy: Dict) -> List[Dict]:
-        all_vacancy_items = (
-            [{"text": r, "category": "responsibilities"} for r in vacancy.get("responsibilities", []) if r] +
-            [{"text": r, "category": "requirements"} for r in vacancy.get("requirements", []) if r] +
-            [{"text": r, "category": "preferred"}
-                for r in vacancy.get("preferred", []) if r]
-        )
+    def extract_features_from_vacancy(self, vacancy: Union[Dict, "CompiledVacancy"]) -> List[Dict]:
+        if isinstance(vacancy, CompiledVacancy):
+            return vacancy.features()
         features = []
-        for item in all_vacancy_items:
-            cat = self.categorize_item(item["text"])
-            if cat in ["technical_skills", "communication_skills", "case_projects"]:
-                features.append({
-                    "requirement": item["text"],
-                    "category": cat
-                })
+        for section in VACANCY_SECTIONS:
+            for text in vacancy.get(section, []):
+                if not text:
+                    continue
+                cat = self.categorize_item(text)
+                if cat in FEATURE_CATEGORIES:
+                    features.append({
+                        "requirement": text,
+                        "category": cat
+                    })
         return features
 
     def _parse_resume_into_fragments(self, resume_text: str) -> List[str]:
-        try:
-            import razdel
-        except ImportError:
-            sentences = []
-            for part in re.split(r'[.!?]+(?=\s+[А-Я]|$)', resume_text):
+        return list(self.iter_resume_fragments(resume_text))
+
+    def iter_resume_fragments(self, resume_text: str) -> Iterator[str]:
+        """Лениво отдает уникальные фрагменты резюме в порядке появления"""
+        seen = set()
+        for fragment in self._iter_raw_fragments(resume_text):
+            if fragment and len(fragment) > 2 and fragment not in seen:
+                seen.add(fragment)
+                yield fragment
+
+    @staticmethod
+    def _sentences(text: str) -> Iterator[str]:
+        for sent in razdel.sentenize(text):
+            sentence = sent.text.strip()
+            if len(sentence) > 2:
+                yield sentence
+
+    def _iter_raw_fragments(self, resume_text: str) -> Iterator[str]:
+        if razdel is None:
+            for part in RESUME_SENTENCE_SPLIT.split(resume_text):
                 for line in part.split('\n'):
                     stripped = line.strip()
                     if len(stripped) > 5:
-                        sentences.append(stripped)
-            return sentences
+                        yield stripped
+            return
 
-        text = re.sub(r'(Опыт работы\s*—[^—]+)\s*\1+',
-                      r'\1', resume_text, flags=re.IGNORECASE)
-        text = re.sub(r'(Образование\s+)+', 'Образование ',
-                      text, flags=re.IGNORECASE)
-        text = re.sub(r'(Навыки\s+)+', 'Навыки ', text, flags=re.IGNORECASE)
-        text = re.sub(r'(Дополнительная информация\s+)+',
-                      'Дополнительная информация ', text, flags=re.IGNORECASE)
-
-        parts = re.split(
-            r'(?=\n*(Опыт работы|Образование|Навыки|Дополнительная информация|Обо мне)\s*[:—]?)',
-            text,
-            flags=re.IGNORECASE
-        )
+        text = RESUME_REPEATED_EXPERIENCE.sub(r'\1', resume_text)
+        text = RESUME_REPEATED_HEADERS.sub(
+            lambda match: RESUME_CANONICAL_HEADERS[match.lastgroup], text)
+        parts = RESUME_SECTION_SPLIT.split(text)
 
-        fragments = []
         i = 0
         while i < len(parts):
             part = parts[i].strip()
@@ -533,58 +1172,29 @@ class InterviewAnalyzer:
                 i += 1
                 continue
 
-            if re.search(r'Опыт работы', part, re.IGNORECASE):
+            section = _section_header(part)
+            if section is not None:
                 i += 1
-                if i < len(parts):
-                    content = parts[i].strip()
-                    exp_blocks = self._extract_experience_blocks(content)
-                    for block in exp_blocks:
-                        sentences = [sent.text.strip() for sent in razdel.sentenize(
-                            block) if len(sent.text.strip()) > 2]
-                        fragments.extend(sentences)
-            elif re.search(r'Навыки', part, re.IGNORECASE):
-                i += 1
-                if i < len(parts):
-                    skills_text = parts[i].strip()
-                    skills_list = re.split(r'[,;\n•–—\-\s]\s*', skills_text)
-                    for skill in skills_list:
+                content = parts[i].strip() if i < len(parts) else ""
+                if section == "experience":
+                    for block in self._extract_experience_blocks(content):
+                        yield from self._sentences(block)
+                elif section == "skills":
+                    for skill in RESUME_SKILLS_SPLIT.split(content):
                         skill_clean = skill.strip(" .,;:-–—")
                         if len(skill_clean) > 2:
-                            fragments.append(skill_clean)
-            elif re.search(r'Образование', part, re.IGNORECASE):
-                i += 1
-                if i < len(parts):
-                    edu_text = parts[i].strip()
-                    sentences = [sent.text.strip() for sent in razdel.sentenize(
-                        edu_text) if len(sent.text.strip()) > 2]
-                    fragments.extend(sentences)
-            elif re.search(r'Дополнительная информация|Обо мне', part, re.IGNORECASE):
-                i += 1
-                if i < len(parts):
-                    about_text = parts[i].strip()
-                    sentences = [sent.text.strip() for sent in razdel.sentenize(
-                        about_text) if len(sent.text.strip()) > 2]
-                    fragments.extend(sentences)
+                            yield skill_clean
+                elif content:
+                    yield from self._sentences(content)
             else:
-                sentences = [sent.text.strip() for sent in razdel.sentenize(
-                    part) if len(sent.text.strip()) > 2]
-                fragments.extend(sentences)
+                yield from self._sentences(part)
             i += 1
 
-        seen = set()
-        unique_fragments = []
-        for frag in fragments:
-            if frag and len(frag) > 2 and frag not in seen:
-                seen.add(frag)
-                unique_fragments.append(frag)
-
-        return unique_fragments
-
     def _extract_experience_blocks(self, text: str) -> List[str]:
         if not text:
             return []
-        pattern = r'([А-Яа-я]+\s+\d{4}\s*—\s*[А-Яа-я\s\d]+)'
-        positions = [match.start() for match in re.finditer(pattern, text)]
+        positions = [match.start()
+                     for match in RESUME_EXPERIENCE_BLOCK.finditer(text)]
         if not positions:
             return [text.strip()]
         blocks = []
@@ -601,32 +1211,84 @@ class InterviewAnalyzer:
 # ==============================
 
 
-def analyze_vacancy_vs_resume(vacancy_file: str, resume_file: str) -> Dict:
-    """Анализирует схожесть вакансии и резюме"""
-    vacancy_text = extract_text_as_single_line(vacancy_file)
-    resume_text = extract_text_as_single_line(resume_file)
-
-    vacancy_dict_raw = parse_text_to_dict(vacancy_text)
+def structure_vacancy_text(vacancy_text: str, fields: Optional[Sequence[str]] = None) -> Dict:
+    """Текст вакансии -> структурированная вакансия; fields — поля другого шаблона"""
+    vacancy_dict_raw = parse_text_to_dict(vacancy_text, fields)
     vacancy_dict_clean = clean_and_format_dict(vacancy_dict_raw)
-    vacancy_structured = parse_vacancy_from_json(vacancy_dict_clean)
+    return parse_vacancy_from_json(vacancy_dict_clean)
+
+
+def compile_vacancy_text(vacancy_text: str, analyzer: Optional[InterviewAnalyzer] = None) -> CompiledVacancy:
+    """Текст вакансии -> скомпилированная вакансия"""
+    analyzer = analyzer or InterviewAnalyzer()
+    return analyzer.compile_vacancy(structure_vacancy_text(vacancy_text))
 
+
+def compile_vacancy_file(vacancy_file: str, analyzer: Optional[InterviewAnalyzer] = None) -> CompiledVacancy:
+    """Файл вакансии -> скомпилированная вакансия"""
+    return compile_vacancy_text(extract_text_as_single_line(vacancy_file), analyzer)
+
+
+def analyze_vacancy_vs_resume(vacancy_file: Union[str, CompiledVacancy], resume_file: str) -> Dict:
+    """Анализирует схожесть вакансии (файл или скомпилированная) и резюме"""
     analyzer = InterviewAnalyzer()
+    if isinstance(vacancy_file, CompiledVacancy):
+        vacancy = vacancy_file
+    else:
+        vacancy = compile_vacancy_file(vacancy_file, analyzer)
+    resume_text = extract_text_as_single_line(resume_file)
+
     result = analyzer.analyze(
-        resume_text, vacancy_structured, return_features=True)
+        resume_text, vacancy, return_features=True)
     return result
 
 
-def analyze_vacancy_vs_interview(vacancy_text: str, interview_answers: List[str]) -> Dict:
-    """Анализирует схожесть вакансии и ответов на интервью"""
-    vacancy_dict_raw = parse_text_to_dict(vacancy_text)
-    vacancy_dict_clean = clean_and_format_dict(vacancy_dict_raw)
-    vacancy_structured = parse_vacancy_from_json(vacancy_dict_clean)
-
+def analyze_vacancy_vs_interview(vacancy_text: Union[str, CompiledVacancy], interview_answers: List[str]) -> Dict:
+    """Анализирует схожесть вакансии (текст или скомпилированная) и ответов на интервью"""
     analyzer = InterviewAnalyzer()
+    if isinstance(vacancy_text, CompiledVacancy):
+        vacancy = vacancy_text
+    else:
+        vacancy = compile_vacancy_text(vacancy_text, analyzer)
+
     result = analyzer.analyze(
-        interview_answers, vacancy_structured, return_features=True)
+        interview_answers, vacancy, return_features=True)
     return result
 
+
+def rank_resume_files(vacancy_file: Union[str, CompiledVacancy], resume_files: Iterable[str]) -> List[Dict]:
+    """
+    Ранжирует файлы резюме против одной вакансии; candidate_id — путь к файлу резюме.
+    Файлы читаются по мере ранжирования групп. Нечитаемые файлы не прерывают ранжирование:
+    они добавляются в конец списка как {"candidate_id", "skipped": True, "error"}.
+    """
+    analyzer = InterviewAnalyzer()
+    if isinstance(vacancy_file, CompiledVacancy):
+        vacancy = vacancy_file
+    else:
+        vacancy = compile_vacancy_file(vacancy_file, analyzer)
+
+    paths: List[str] = []
+    skipped: List[Dict] = []
+
+    def resume_texts() -> Iterator[str]:
+        for path in resume_files:
+            try:
+                text = extract_document(path)
+            except Exception as e:
+                skipped.append({"candidate_id": path, "skipped": True,
+                                "error": f"{type(e).__name__}: {e}"})
+                continue
+            paths.append(path)
+            yield text
+
+    results = []
+    for result in analyzer.iter_rank_resumes(vacancy, resume_texts(), return_features=True):
+        result["candidate_id"] = paths[result["candidate_id"]]
+        results.append(result)
+    results.sort(key=lambda r: r["total_match_percent"], reverse=True)
+    return results + skipped
+
 # ==============================
 # 5. LLMAnalyzer
 # ==============================
@@ -640,9 +1302,10 @@ class LLMAnalyzer:
         self.db_api_url = db_api_url
         self.analyzer = InterviewAnalyzer()
 
-    def analyze_text(self, vacancy_text: str, history_text: str) -> str:
+    def analyze_text(self, vacancy_text: Union[str, CompiledVacancy], history_text: str) -> str:
         """
-        Принимает JSON-строку с ответами кандидата, возвращает результат анализа.
+        Принимает текст (или скомпилированную вакансию) и JSON-строку с ответами кандидата,
+        возвращает результат анализа.
         Пример history_text: '["Писал скрипты на Python", "Использовал Docker"]'
         """
         try:
@@ -655,7 +1318,7 @@ class LLMAnalyzer:
         except Exception as e:
             return json.dumps({"error": str(e)}, ensure_ascii=False, indent=2)
 
-    def analyze_resume(self, vacancy_file: str, resume_file: str) -> str:
+    def analyze_resume(self, vacancy_file: Union[str, CompiledVacancy], resume_file: str) -> str:
         """Анализ резюме против вакансии"""
         try:
             result = analyze_vacancy_vs_resume(vacancy_file, resume_file)
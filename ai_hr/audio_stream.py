@@ -0,0 +1,204 @@
+# audio_stream.py
+# Потоковая обработка сырого PCM из конференции внутри процесса. Вместо запуска ffmpeg
+# на каждый фрагмент звук 44.1 кГц передискретизируется в 16 кГц с сохранением
+# состояния между фрагментами и отправляется в распознавание как audio/x-pcm.
+# Детектор речи отсекает тишину до распознавания и определяет конец реплики.
+
+from collections import deque
+from math import gcd
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+CONFERENCE_SAMPLE_RATE = 44100
+RECOGNIZER_SAMPLE_RATE = 16000
+# Формат, который SaluteSpeech принимает без перекодирования
+RECOGNIZER_CONTENT_TYPE = f"audio/x-pcm;bit=16;rate={RECOGNIZER_SAMPLE_RATE}"
+
+
+class PCMResampler:
+    """
+    Передискретизация 16-битного моно PCM с рациональным коэффициентом (44100 -> 16000 = 160/441)
+    фильтром windowed-sinc (окно Кайзера) с half_width отсчетами по каждую сторону.
+    Для каждой из up фаз веса посчитаны заранее, поэтому фрагмент обрабатывается одной
+    векторной сверткой. Состояние (хвост входа и номер следующего отсчета) хранится между
+    вызовами: склейка фрагментов дает тот же сигнал, что и обработка всего потока сразу,
+    с задержкой half_width входных отсчетов (~0.4 мс).
+    """
+
+    def __init__(self, from_rate: int = CONFERENCE_SAMPLE_RATE, to_rate: int = RECOGNIZER_SAMPLE_RATE,
+                 half_width: int = 16, beta: float = 8.0, rolloff: float = 0.95):
+        divisor = gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        self.half_width = half_width
+        self._offsets = np.arange(-half_width + 1, half_width + 1)
+        self._table = self._phase_table(min(1.0, to_rate / from_rate) * rolloff, beta)
+        # Вход дополнен нулями слева, чтобы первый выходной отсчет имел полное окно
+        self._buffer = np.zeros(half_width, dtype=np.float32)
+        self._buffer_start = -half_width
+        self._next_output = 0
+        self._pending = b""  # нечетный байт на границе фрагментов
+
+    def _phase_table(self, cutoff: float, beta: float) -> np.ndarray:
+        """Веса (up, 2 * half_width): строка p — для выходного отсчета с дробным сдвигом p / up"""
+        phases = np.arange(self.up)[:, None] / self.up
+        distance = self._offsets[None, :] - phases
+        window = np.i0(beta * np.sqrt(np.clip(1 - (distance / self.half_width) ** 2, 0, None))) / np.i0(beta)
+        table = cutoff * np.sinc(cutoff * distance) * window
+        return (table / table.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    def process(self, pcm: bytes) -> bytes:
+        """Очередной фрагмент int16 LE -> готовые выходные отсчеты int16 LE"""
+        if self._pending:
+            pcm, self._pending = self._pending + pcm, b""
+        if len(pcm) % 2:
+            pcm, self._pending = pcm[:-1], pcm[-1:]
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+        self._buffer = np.concatenate((self._buffer, samples))
+        last_input = self._buffer_start + len(self._buffer) - 1
+        # Выходной отсчет k готов, когда доступен правый край его окна
+        last_output = ((last_input - self.half_width) * self.up) // self.down
+        if last_output < self._next_output:
+            return b""
+
+        positions = np.arange(self._next_output, last_output + 1, dtype=np.int64) * self.down
+        base, phase = positions // self.up, positions % self.up
+        window = self._buffer[base[:, None] + self._offsets[None, :] - self._buffer_start]
+        output = np.einsum("ij,ij->i", window, self._table[phase])
+
+        self._next_output = last_output + 1
+        keep_from = (self._next_output * self.down) // self.up - self.half_width + 1
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+        return np.clip(np.rint(output), -32768, 32767).astype("<i2").tobytes()
+
+
+# События SpeechEndpointer
+UTTERANCE = "utterance"      # законченный фрагмент речи (PCM) для распознавания
+END_OF_TURN = "end_of_turn"  # кандидат закончил реплику
+
+
+class SpeechEndpointer:
+    """
+    Детектор речи (VAD) и определение конца реплики на PCM 16 бит моно.
+    Кадр frame_ms считается речью, если его энергия выше адаптивного уровня шума на
+    energy_margin_db (звонкие звуки) или на половину запаса при частоте переходов через
+    ноль выше zcr_threshold (глухие согласные). spectral=True дополнительно требует, чтобы
+    у звонкого кадра в полосе 80-4000 Гц было не меньше spectral_ratio энергии.
+    Фрагмент речи начинается после min_speech_ms речи подряд (с pre_roll_ms звука до начала)
+    и отдается событием UTTERANCE после utterance_silence_ms тишины или по достижении
+    max_utterance_ms. END_OF_TURN выдается после turn_silence_ms тишины, если с прошлого
+    конца реплики была речь.
+    """
+
+    def __init__(self, sample_rate: int = RECOGNIZER_SAMPLE_RATE, frame_ms: int = 20,
+                 utterance_silence_ms: int = 400, turn_silence_ms: int = 800, min_speech_ms: int = 100,
+                 pre_roll_ms: int = 200, max_utterance_ms: int = 30000, energy_margin_db: float = 12.0,
+                 min_energy_db: float = -60.0, zcr_threshold: float = 0.25, spectral: bool = False,
+                 spectral_ratio: float = 0.5, noise_adaptation: float = 0.05):
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.utterance_silence_frames = max(1, utterance_silence_ms // frame_ms)
+        self.turn_silence_frames = max(self.utterance_silence_frames, turn_silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_utterance_frames = max_utterance_ms // frame_ms
+        self.energy_margin_db = energy_margin_db
+        self.min_energy_db = min_energy_db
+        self.zcr_threshold = zcr_threshold
+        self.spectral = spectral
+        self.spectral_ratio = spectral_ratio
+        self.noise_adaptation = noise_adaptation
+        self.noise_db = min_energy_db
+        frequencies = np.fft.rfftfreq(self.frame_samples, 1 / sample_rate)
+        self._speech_band = (frequencies >= 80) & (frequencies <= 4000)
+
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._pre_roll: deque = deque(maxlen=max(1, pre_roll_ms // frame_ms) + self.min_speech_frames)
+        self._speech_run = 0
+        self._utterance: Optional[List[np.ndarray]] = None
+        self._silence_run = 0
+        self._turn_open = False
+        self.stats = {"frames": 0, "speech_frames": 0, "utterances": 0, "turns": 0}
+
+    def _classify(self, frames: np.ndarray) -> np.ndarray:
+        """Речь/не речь для кадров (n, frame_samples); уровень шума обновляется по кадрам без речи"""
+        samples = frames.astype(np.float32) / 32768.0
+        energy_db = 10 * np.log10(np.mean(samples ** 2, axis=1) + 1e-12)
+        signs = np.signbit(samples)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        band_ratio = None
+        if self.spectral:
+            power = np.abs(np.fft.rfft(samples, axis=1)) ** 2
+            band_ratio = power[:, self._speech_band].sum(axis=1) / (power.sum(axis=1) + 1e-12)
+
+        speech = np.zeros(len(frames), dtype=bool)
+        for i, energy in enumerate(energy_db):
+            floor = max(self.noise_db, self.min_energy_db)
+            voiced = energy > floor + self.energy_margin_db
+            if voiced and band_ratio is not None:
+                voiced = band_ratio[i] >= self.spectral_ratio
+            unvoiced = energy > floor + self.energy_margin_db / 2 and zcr[i] > self.zcr_threshold
+            speech[i] = voiced or unvoiced
+            # Шум отслеживается снизу сразу, сверху — медленно, а на кадрах речи еще в 25 раз
+            # медленнее: постоянный шум, принятый сначала за речь, со временем станет фоном
+            if energy < self.noise_db:
+                self.noise_db = energy
+            else:
+                rate = self.noise_adaptation / 25 if speech[i] else self.noise_adaptation
+                self.noise_db += rate * (energy - self.noise_db)
+        return speech
+
+    def _emit_utterance(self, events: List[Tuple[str, Optional[bytes]]]) -> None:
+        events.append((UTTERANCE, np.concatenate(self._utterance).tobytes()))
+        self._utterance = None
+        self._turn_open = True
+        self.stats["utterances"] += 1
+
+    def push(self, pcm: bytes) -> List[Tuple[str, Optional[bytes]]]:
+        """Очередной фрагмент PCM -> события [(UTTERANCE, pcm) | (END_OF_TURN, None)]"""
+        samples = np.concatenate((self._pending, np.frombuffer(pcm[:len(pcm) - len(pcm) % 2], dtype="<i2")))
+        count = len(samples) // self.frame_samples
+        self._pending = samples[count * self.frame_samples:]
+        events: List[Tuple[str, Optional[bytes]]] = []
+        if not count:
+            return events
+        frames = samples[:count * self.frame_samples].reshape(count, self.frame_samples)
+        speech = self._classify(frames)
+        self.stats["frames"] += count
+        self.stats["speech_frames"] += int(speech.sum())
+
+        for frame, is_speech in zip(frames, speech):
+            if self._utterance is None:
+                self._pre_roll.append(frame)
+                self._speech_run = self._speech_run + 1 if is_speech else 0
+                if self._speech_run >= self.min_speech_frames:
+                    self._utterance = list(self._pre_roll)
+                    self._pre_roll.clear()
+                    self._speech_run = 0
+                    self._silence_run = 0
+                    continue
+                self._silence_run = 0 if is_speech else self._silence_run + 1
+                if self._turn_open and self._silence_run >= self.turn_silence_frames:
+                    events.append((END_OF_TURN, None))
+                    self._turn_open = False
+                    self.stats["turns"] += 1
+                continue
+
+            self._utterance.append(frame)
+            self._silence_run = 0 if is_speech else self._silence_run + 1
+            if self._silence_run >= self.utterance_silence_frames or \
+                    len(self._utterance) >= self.max_utterance_frames:
+                self._emit_utterance(events)
+        return events
+
+    def flush(self) -> List[Tuple[str, Optional[bytes]]]:
+        """Конец потока: недоговоренный фрагмент и конец реплики"""
+        events: List[Tuple[str, Optional[bytes]]] = []
+        if self._utterance is not None:
+            self._emit_utterance(events)
+        if self._turn_open:
+            events.append((END_OF_TURN, None))
+            self._turn_open = False
+            self.stats["turns"] += 1
+        return events
@@ -0,0 +1,757 @@
+# benchmark.py
+# Микро-бенчмарки сервиса на встроенных ресурсах (resources/).
+# Запуск: python benchmark.py <бенчмарк> [параметры], список — python benchmark.py --help
+
+import argparse
+import glob
+import io
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from typing import Callable, Dict, List
+from xml.sax.saxutils import escape
+
+import numpy as np
+from docx import Document
+
+from analyzer import extract_experience_spans
+from text_extraction import (extract_docx, extract_docx_python_docx, extract_text_as_single_line,
+                             normalize_text)
+
+RESOURCE_FILES = sorted(glob.glob("resources/**/*.pdf", recursive=True) +
+                        glob.glob("resources/**/*.docx", recursive=True) +
+                        glob.glob("resources/**/*.rtf", recursive=True))
+
+
+def timed(func: Callable, repeat: int) -> float:
+    """Лучшее время из repeat запусков, секунды"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def resource_texts() -> List[str]:
+    return [extract_text_as_single_line(path) for path in RESOURCE_FILES]
+
+
+def large_text(target_bytes: int) -> str:
+    """Склеивает тексты ресурсов, пока размер не достигнет target_bytes"""
+    texts = [text for text in resource_texts() if text]
+    if not texts:
+        raise SystemExit("В resources/ нет документов для бенчмарка")
+    chunks, size, i = [], 0, 0
+    while size < target_bytes:
+        chunk = texts[i % len(texts)]
+        chunks.append(chunk)
+        size += len(chunk.encode("utf-8"))
+        i += 1
+    return " ".join(chunks)
+
+
+def report(name: str, seconds: float, size_bytes: int, baseline: float = None):
+    line = f"{name:<28} {seconds * 1000:10.2f} ms  {size_bytes / seconds / 1024 ** 2:8.1f} MB/s"
+    if baseline:
+        line += f"  x{baseline / seconds:.1f}"
+    print(line)
+
+
+# ==============================
+# Стаж из текста
+# ==============================
+
+def _legacy_extract_experience(text_list: List[str]) -> int:
+    """Прежняя реализация: шесть пересекающихся регулярок подряд (для сравнения)"""
+    full_text = " ".join(text_list).lower()
+    patterns = [
+        r'(\d+)\s*лет?\s*(\d+)?\s*месяц[а-я]*',
+        r'(\d+)\s*года?\s*(\d+)?\s*месяц[а-я]*',
+        r'(\d+)\s*лет?',
+        r'(\d+)\s*года?',
+        r'(\d+)\s*год[а-я]*',
+        r'(\d+)\s*месяц[а-я]*'
+    ]
+    total_months = 0
+    for pattern in patterns:
+        for match in re.findall(pattern, full_text):
+            if isinstance(match, tuple):
+                total_months += int(match[0] or 0) * 12 + int(match[1] or 0)
+            elif "лет" in pattern or "год" in pattern:
+                total_months += int(match) * 12
+            else:
+                total_months += int(match)
+    return total_months
+
+
+def bench_experience(args):
+    text = large_text(args.size_mb * 1024 ** 2)
+    size = len(text.encode("utf-8"))
+    print(f"Текст: {size / 1024 ** 2:.1f} MB из {len(RESOURCE_FILES)} файлов")
+    legacy = timed(lambda: _legacy_extract_experience([text]), args.repeat)
+    single = timed(lambda: extract_experience_spans([text]), args.repeat)
+    total, spans = extract_experience_spans([text])
+    report("six regex passes", legacy, size)
+    report("single pass", single, size, legacy)
+    print(f"Отрезков стажа: {len(spans)}, всего месяцев: {total} "
+          f"(прежний подсчет: {_legacy_extract_experience([text])})")
+
+
+# ==============================
+# Нормализация извлеченного текста
+# ==============================
+
+def _legacy_clean_special_chars(text: str) -> str:
+    """Прежняя очистка: семь последовательных проходов re.sub (для сравнения)"""
+    if not text:
+        return ""
+    text = text.replace('\\t', ' ').replace('\t', ' ')
+    text = re.sub(
+        r'[\n\r\f\v\u00a0\u1680\u2000-\u200F\u2028-\u202F\u205F\u2060\u3000]', ' ', text)
+    text = re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F-\x9F]', '', text)
+    text = re.sub(r'[\u200E\u200F\u202A-\u202E]', '', text)
+    text = re.sub(r'[•▪▶➢\uf0b7\*\•\‣\⁃\-\•]', ' ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def raw_resource_text(target_bytes: int) -> str:
+    """Сырой (ненормализованный) текст: переводы строк, табуляции, маркеры списков"""
+    sample = ("Опыт работы —\t5 лет 2 месяца\n• Python, SQL;\u00a0Docker\r\n"
+              "▪ Настройка серверов\u200b и сетей\x0c\n  \uf0b7 CI/CD\n")
+    texts = [text for text in resource_texts() if text] + [sample]
+    chunks, size, i = [], 0, 0
+    while size < target_bytes:
+        chunk = texts[i % len(texts)]
+        # Возвращаем структуру строк, которую нормализация убирает
+        chunk = chunk.replace(". ", ".\n\t• ")
+        chunks.append(chunk)
+        size += len(chunk.encode("utf-8"))
+        i += 1
+    return "\n".join(chunks)
+
+
+def bench_normalize(args):
+    text = raw_resource_text(args.size_mb * 1024 ** 2)
+    size = len(text.encode("utf-8"))
+    print(f"Текст: {size / 1024 ** 2:.1f} MB")
+    assert _legacy_clean_special_chars(text) == normalize_text(text)
+    legacy = timed(lambda: _legacy_clean_special_chars(text), args.repeat)
+    single = timed(lambda: normalize_text(text), args.repeat)
+    report("seven re.sub passes", legacy, size)
+    report("two passes + split/join", single, size, legacy)
+
+
+# ==============================
+# Извлечение текста из DOCX
+# ==============================
+
+def _legacy_extract_docx(source) -> str:
+    """Прежний обход python-docx: каждая объединенная ячейка читается по разу на колонку/строку"""
+    doc = Document(source)
+    paragraphs = [p.text.strip()
+                  for p in doc.paragraphs if p.text.strip()]
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell.text.strip():
+                    paragraphs.append(cell.text.strip())
+    return ' '.join(paragraphs)
+
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>')
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>')
+
+
+def generated_docx(rows: int) -> bytes:
+    """
+    DOCX с rows абзацами и таблицей rows x 6, где в каждой четвертой строке
+    объединены ячейки по горизонтали (gridSpan) и по вертикали (vMerge).
+    XML пишется напрямую: построение больших таблиц через python-docx квадратично.
+    """
+    texts = [text for text in resource_texts() if text] or ["Опыт работы 5 лет"]
+    words = [escape(word) for word in " ".join(texts).split()]
+
+    def paragraph(text: str) -> str:
+        return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+    def cell(text: str, properties: str = "") -> str:
+        return f'<w:tc><w:tcPr><w:tcW w:w="1500" w:type="dxa"/>{properties}</w:tcPr>{paragraph(text)}</w:tc>'
+
+    body = [paragraph(" ".join(words[(i * 7 + k) % len(words)] for k in range(12)))
+            for i in range(rows)]
+    body.append('<w:tbl><w:tblGrid>' + '<w:gridCol w:w="1500"/>' * 6 + '</w:tblGrid>')
+    for i in range(rows):
+        row_texts = [f"{words[(i * 6 + j) % len(words)]} {i}.{j}" for j in range(6)]
+        if i % 4 == 0:
+            cells = [cell(row_texts[0], '<w:gridSpan w:val="3"/>'), cell(row_texts[3]),
+                     cell(row_texts[4], '<w:vMerge w:val="restart"/>'), cell(row_texts[5])]
+        elif i % 4 == 1:
+            cells = [cell(row_texts[j]) for j in range(4)] + \
+                [cell("", '<w:vMerge/>'), cell(row_texts[5])]
+        else:
+            cells = [cell(text) for text in row_texts]
+        body.append('<w:tr>' + ''.join(cells) + '</w:tr>')
+    body.append('</w:tbl>')
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                '<w:body>' + ''.join(body) + '</w:body></w:document>')
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", DOCX_RELS)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def bench_docx(args):
+    data = generated_docx(args.docx_rows)
+    size = len(data)
+    print(f"DOCX: {size / 1024 ** 2:.1f} MB, {args.docx_rows} абзацев и строк таблицы")
+    legacy = timed(lambda: _legacy_extract_docx(io.BytesIO(data)), args.repeat)
+    fallback = timed(lambda: extract_docx_python_docx(io.BytesIO(data)), args.repeat)
+    streaming = timed(lambda: extract_docx(io.BytesIO(data)), args.repeat)
+    report("python-docx row.cells", legacy, size)
+    report("python-docx, dedup cells", fallback, size, legacy)
+    report("iterparse document.xml", streaming, size, legacy)
+    legacy_text = normalize_text(_legacy_extract_docx(io.BytesIO(data)))
+    streaming_text = normalize_text(extract_docx(io.BytesIO(data)))
+    print(f"Символов: {len(legacy_text)} -> {len(streaming_text)} (без повторов объединенных ячеек)")
+
+
+# ==============================
+# Бэкенды кодировщика
+# ==============================
+
+def resource_pairs() -> tuple:
+    """(тексты вакансий, тексты резюме) из resources/vacancies и resources/resumes"""
+    vacancies = [extract_text_as_single_line(path) for path in RESOURCE_FILES
+                 if "vacancies" in path]
+    resumes = [extract_text_as_single_line(path) for path in RESOURCE_FILES
+               if "vacancies" not in path]
+    return [text for text in vacancies if text], [text for text in resumes if text]
+
+
+def _encoder_run(backend: str, repeat: int) -> Dict:
+    """Выполняется в отдельном процессе, чтобы RSS каждого бэкенда мерился с нуля"""
+    import psutil
+    from analyzer import InterviewAnalyzer, REQUIREMENT_PROMPT, structure_vacancy_text
+
+    os.environ.pop("EMBEDDING_CACHE_DIR", None)
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    analyzer = InterviewAnalyzer(backend=backend)
+    vacancy_texts, resume_texts = resource_pairs()
+    vacancies = [structure_vacancy_text(text) for text in vacancy_texts]
+    sentences = [f"{REQUIREMENT_PROMPT}{item}" for vacancy in vacancies
+                 for section in ("responsibilities", "requirements", "preferred")
+                 for item in vacancy.get(section, [])]
+    for text in resume_texts:
+        sentences += analyzer._parse_resume_into_fragments(text)
+    analyzer._encode_batch(sentences[:8])  # прогрев
+    seconds = timed(lambda: analyzer._encode_batch(sentences), repeat)
+    results = [analyzer.analyze(resume, vacancy)
+               for vacancy in vacancies for resume in resume_texts]
+    return {
+        "sentences": len(sentences),
+        "sentences_per_sec": len(sentences) / seconds,
+        "rss_mb": (process.memory_info().rss - rss_before) / 1024 ** 2,
+        "results": results,
+    }
+
+
+def bench_encoders(args):
+    # spawn: каждый бэкенд грузит модель в чистом процессе
+    context = multiprocessing.get_context("spawn")
+    runs = {}
+    for backend in args.backends.split(","):
+        with context.Pool(1) as pool:
+            try:
+                runs[backend] = pool.apply(_encoder_run, (backend, args.repeat))
+            except Exception as e:
+                print(f"{backend:<8} недоступен: {type(e).__name__}: {e}")
+    if not runs:
+        return
+    reference = runs.get("torch")
+    print(f"{'backend':<8} {'sent/s':>9} {'RSS, MB':>9} {'found':>9} {'max |dscore|':>13} {'max |dtotal|':>13}")
+    for backend, run in runs.items():
+        line = f"{backend:<8} {run['sentences_per_sec']:9.1f} {run['rss_mb']:9.0f}"
+        if reference is not None:
+            agree = total = 0
+            score_diff = total_diff = 0.0
+            for ref, res in zip(reference["results"], run["results"]):
+                total_diff = max(total_diff, abs(
+                    ref["total_match_percent"] - res["total_match_percent"]))
+                for ref_item, item in zip(ref["matched_items"], res["matched_items"]):
+                    total += 1
+                    agree += ref_item["found"] == item["found"]
+                    score_diff = max(score_diff, abs(
+                        ref_item["similarity_score"] - item["similarity_score"]))
+            found = f"{agree}/{total}"
+            line += f" {found:>9} {score_diff:13.3f} {total_diff:13.1f}"
+        print(line)
+    print(f"Предложений в замере: {next(iter(runs.values()))['sentences']}; "
+          f"found — совпадения решений с torch fp32")
+
+
+# ==============================
+# Каскад малой и большой моделей
+# ==============================
+
+def bench_cascade(args):
+    from analyzer import DEFAULT_CASCADE_MODEL_NAME, InterviewAnalyzer, structure_vacancy_text
+
+    vacancy_texts, resume_texts = resource_pairs()
+    large = InterviewAnalyzer(cascade_model_name="")
+    compiled = [large.compile_vacancy(structure_vacancy_text(text))
+                for text in vacancy_texts]
+    start = time.perf_counter()
+    reference = [large.analyze(resume, vacancy)
+                 for vacancy in compiled for resume in resume_texts]
+    large_seconds = time.perf_counter() - start
+    print(f"Только большая модель: {len(reference)} пар вакансия-резюме, {large_seconds * 1000:.0f} ms")
+
+    print(f"{'band':>6} {'found':>9} {'large pairs':>14} {'small, ms':>10} {'large, ms':>10} {'total, ms':>10}")
+    for band in (float(value) for value in args.bands.split(",")):
+        cascade = InterviewAnalyzer(cascade_model_name=args.cascade_model or DEFAULT_CASCADE_MODEL_NAME,
+                                    cascade_band=band, cascade_top_k=args.cascade_top_k)
+        start = time.perf_counter()
+        results = [cascade.analyze(resume, vacancy)
+                   for vacancy in compiled for resume in resume_texts]
+        seconds = time.perf_counter() - start
+        agree = total = small_pairs = large_pairs = 0
+        small_time = large_time = 0.0
+        for ref, res in zip(reference, results):
+            stats = res["cascade"]
+            small_pairs += stats["small_pairs"]
+            large_pairs += stats["large_pairs"]
+            small_time += stats["small_seconds"]
+            large_time += stats["large_seconds"]
+            for ref_item, item in zip(ref["matched_items"], res["matched_items"]):
+                total += 1
+                agree += ref_item["found"] == item["found"]
+        found = f"{agree}/{total}"
+        pairs = f"{large_pairs}/{small_pairs}"
+        print(f"{band:6.2f} {found:>9} {pairs:>14} {small_time * 1000:10.0f} "
+              f"{large_time * 1000:10.0f} {seconds * 1000:10.0f}")
+
+
+# ==============================
+# Батчи под бюджет токенов
+# ==============================
+
+def _padded_tokens(lengths, batches) -> int:
+    return sum(len(batch) * max(lengths[i] for i in batch) for batch in batches)
+
+
+def bench_batching(args):
+    from analyzer import InterviewAnalyzer, SOURCE_PROMPT, token_budget_buckets, token_lengths
+
+    analyzer = InterviewAnalyzer(token_budget=0)
+    _, resume_texts = resource_pairs()
+    fragments = [f"{SOURCE_PROMPT}{fragment}" for text in resume_texts
+                 for fragment in analyzer._parse_resume_into_fragments(text)]
+    if not fragments:
+        raise SystemExit("В resources/ нет резюме для бенчмарка")
+    sentences = (fragments * (args.sentences // len(fragments) + 1))[:args.sentences]
+    lengths = token_lengths(analyzer.model, sentences)
+    print(f"Фрагментов: {len(sentences)}, токенов: медиана {int(np.median(lengths))}, "
+          f"p95 {int(np.percentile(lengths, 95))}, максимум {lengths.max()}")
+
+    # model.encode сортирует по длине строки и режет на батчи по batch_size
+    by_chars = sorted(range(len(sentences)), key=lambda i: -len(sentences[i]))
+    default_batches = [by_chars[i:i + analyzer.batch_size]
+                       for i in range(0, len(by_chars), analyzer.batch_size)]
+    baseline = timed(lambda: analyzer._encode_batch(sentences), args.repeat)
+    print(f"{'batching':<24} {'sent/s':>9} {'padding':>9}")
+    print(f"{f'batch_size={analyzer.batch_size}':<24} {len(sentences) / baseline:9.1f} "
+          f"{lengths.sum() / _padded_tokens(lengths, default_batches):9.0%}")
+    for budget in (int(value) for value in args.budgets.split(",")):
+        analyzer.token_budget = budget
+        seconds = timed(lambda: analyzer._encode_batch(sentences), args.repeat)
+        buckets = token_budget_buckets(lengths, budget)
+        print(f"{f'token_budget={budget}':<24} {len(sentences) / seconds:9.1f} "
+              f"{lengths.sum() / _padded_tokens(lengths, buckets):9.0%}  x{baseline / seconds:.2f}")
+    print("padding — доля реальных токенов среди обработанных моделью")
+
+
+# ==============================
+# Очередь кодирования между сессиями
+# ==============================
+
+def bench_queue(args):
+    import asyncio
+    from analyzer import InterviewAnalyzer, SOURCE_PROMPT
+    from inference_queue import EncodeQueue
+
+    os.environ.pop("EMBEDDING_CACHE_DIR", None)
+    analyzer = InterviewAnalyzer()
+    _, resume_texts = resource_pairs()
+    fragments = [fragment for text in resume_texts
+                 for fragment in analyzer._parse_resume_into_fragments(text)] or ["Опыт работы 5 лет"]
+
+    def session_texts(session: int) -> List[str]:
+        # Уникальные тексты на сессию: сравнение без эффекта общих строк
+        return [f"{fragments[(session * 20 + i) % len(fragments)]} #{session}" for i in range(20)]
+
+    async def threads(sessions: int):
+        await asyncio.gather(*(asyncio.to_thread(analyzer.encode_texts, session_texts(session), SOURCE_PROMPT)
+                               for session in range(sessions)))
+
+    async def queued(sessions: int):
+        queue = EncodeQueue(analyzer)
+        await asyncio.gather(*(queue.encode(session_texts(session), SOURCE_PROMPT)
+                               for session in range(sessions)))
+        await queue.close()
+
+    print(f"{'sessions':>8} {'threads, s/s':>13} {'queue, s/s':>11}")
+    for sessions in (int(value) for value in args.sessions.split(",")):
+        thread_seconds = timed(lambda: asyncio.run(threads(sessions)), args.repeat)
+        queue_seconds = timed(lambda: asyncio.run(queued(sessions)), args.repeat)
+        print(f"{sessions:8d} {sessions / thread_seconds:13.1f} {sessions / queue_seconds:11.1f}"
+              f"  x{thread_seconds / queue_seconds:.2f}")
+    print("s/s — завершенных сессий (по 20 ответов) в секунду")
+
+
+# ==============================
+# HTTP-клиент синтеза и распознавания речи
+# ==============================
+
+def _local_https_server():
+    """Локальный HTTPS-сервер с самоподписанным сертификатом вместо smartspeech.sber.ru"""
+    import ssl
+    import subprocess
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"result": ["ok"]}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    directory = tempfile.mkdtemp()
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_speech_http(args):
+    import requests
+    import urllib3
+    from dialog_voice import SpeechHTTPClient
+
+    urllib3.disable_warnings()
+    server = _local_https_server()
+    url = f"https://127.0.0.1:{server.server_port}/rest/v1/speech:recognize"
+    payload = os.urandom(16 * 1024)  # порядок размера Opus-фрагмента
+    client = SpeechHTTPClient()
+
+    def latencies(post) -> np.ndarray:
+        post()  # прогрев: у пула — первое соединение
+        values = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            post().raise_for_status()
+            values.append(time.perf_counter() - start)
+        return np.array(values) * 1000
+
+    variants = {
+        "requests.post": lambda: requests.post(url, data=payload, verify=False),
+        "SpeechHTTPClient": lambda: client.post(url, data=payload),
+    }
+    print(f"{'client':<20} {'mean, ms':>9} {'p50, ms':>8} {'p95, ms':>8}")
+    baseline = None
+    for name, post in variants.items():
+        values = latencies(post)
+        line = f"{name:<20} {values.mean():9.2f} {np.percentile(values, 50):8.2f} {np.percentile(values, 95):8.2f}"
+        if baseline:
+            line += f"  x{baseline / values.mean():.1f}"
+        baseline = baseline or values.mean()
+        print(line)
+    client.close()
+    server.shutdown()
+
+
+# ==============================
+# Подготовка звука для распознавания
+# ==============================
+
+def conference_audio(path: str = None, seconds: float = 60.0) -> bytes:
+    """
+    PCM 16 бит моно 44.1 кГц, как его присылает конференция. path — записанный WAV
+    (берется первый канал, частота должна быть 44.1 кГц); без него — синтетическая речь:
+    гармонические «слоги» по 1.5-3 с, разделенные паузами 0.5-1.5 с с шумом фона.
+    """
+    import wave
+
+    if path:
+        with wave.open(path, "rb") as wav:
+            if wav.getframerate() != 44100 or wav.getsampwidth() != 2:
+                raise SystemExit("Нужен WAV 44.1 кГц, 16 бит")
+            frames = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+            return frames[::wav.getnchannels()].tobytes()
+
+    rate, rng = 44100, np.random.default_rng(0)
+    parts, total = [], 0
+    while total < seconds * rate:
+        pause = int(rng.uniform(0.5, 1.5) * rate)
+        parts.append(rng.normal(0, 30, pause))
+        length = int(rng.uniform(1.5, 3.0) * rate)
+        t = np.arange(length) / rate
+        f0 = rng.uniform(110, 220)
+        voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 12))
+        syllables = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 5) * t) ** 2
+        parts.append(3000 * voiced * syllables + rng.normal(0, 300, length))
+        total += pause + length
+    signal = np.concatenate(parts)[:int(seconds * rate)]
+    return np.clip(signal, -32768, 32767).astype("<i2").tobytes()
+
+
+def conference_turns(turns: int = 20, seed: int = 0) -> tuple:
+    """
+    Синтетический звонок: реплики кандидата из 1-4 фраз с паузами 0.2-0.35 с, между репликами —
+    2-4 с тишины (говорит бот). Возвращает (PCM 44.1 кГц, [(начало, конец речи реплики), с]).
+    """
+    rate, rng = 44100, np.random.default_rng(seed)
+    parts, turn_spans, total = [], [], 0
+
+    def silence(seconds: float):
+        nonlocal total
+        length = int(seconds * rate)
+        parts.append(rng.normal(0, 30, length))
+        total += length
+
+    silence(1.0)
+    for _ in range(turns):
+        start = total / rate
+        for phrase in range(rng.integers(1, 5)):
+            if phrase:
+                silence(rng.uniform(0.2, 0.35))
+            length = int(rng.uniform(0.8, 2.5) * rate)
+            t = np.arange(length) / rate
+            f0 = rng.uniform(110, 220)
+            voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 12))
+            syllables = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 5) * t) ** 2
+            parts.append(3000 * voiced * syllables + rng.normal(0, 300, length))
+            total += length
+        turn_spans.append((start, total / rate))
+        silence(rng.uniform(2.0, 4.0))
+    signal = np.clip(np.concatenate(parts), -32768, 32767).astype("<i2").tobytes()
+    return signal, turn_spans
+
+
+def audio_chunks(pcm: bytes, chunk_ms: int) -> List[bytes]:
+    size = int(44100 * chunk_ms / 1000) * 2
+    return [pcm[i:i + size] for i in range(0, len(pcm), size)]
+
+
+def _cpu_seconds() -> float:
+    import resource
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def bench_transcode(args):
+    import shutil
+    import subprocess
+    from audio_stream import PCMResampler
+    from dialog_voice import ffmpeg_opus_command
+
+    pcm = conference_audio(args.audio)
+    minutes = len(pcm) / 2 / 44100 / 60
+    chunks = audio_chunks(pcm, args.chunk_ms)
+
+    def ffmpeg_per_chunk():
+        # Прежний путь: WAV-обертка фрагмента и новый ffmpeg на каждый фрагмент
+        import wave
+        for chunk in chunks:
+            wav_buffer = io.BytesIO()
+            with wave.open(wav_buffer, "wb") as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(44100)
+                wav_file.writeframes(chunk)
+            subprocess.run(ffmpeg_opus_command(), input=wav_buffer.getvalue(),
+                           capture_output=True, check=True)
+
+    def resampler():
+        stream = PCMResampler()
+        for chunk in chunks:
+            stream.process(chunk)
+
+    variants = {"resampler": resampler}
+    if shutil.which("ffmpeg"):
+        variants = {"ffmpeg per chunk": ffmpeg_per_chunk, **variants}
+    else:
+        print("ffmpeg не найден — прежний путь не измеряется")
+
+    print(f"{len(chunks)} фрагментов по {args.chunk_ms} мс, {minutes:.1f} мин звука")
+    print(f"{'path':<18} {'CPU s/min':>10} {'wall s/min':>11}")
+    baseline = None
+    for name, run in variants.items():
+        cpu, wall = _cpu_seconds(), time.perf_counter()
+        run()
+        cpu, wall = (_cpu_seconds() - cpu) / minutes, (time.perf_counter() - wall) / minutes
+        line = f"{name:<18} {cpu:10.3f} {wall:11.3f}"
+        if baseline:
+            line += f"  x{baseline / cpu:.0f}"
+        baseline = baseline or cpu
+        print(line)
+
+
+def bench_endpointing(args):
+    """
+    Прежний путь: каждый фрагмент уходит в ASR (вызовы по очереди, --asr-ms каждый), реплика
+    заканчивается после трех пустых распознаваний подряд. Пустым считается фрагмент без речи
+    по разметке фикстуры. Новый путь: SpeechEndpointer, фразы распознаются параллельно.
+    Задержка — от конца речи реплики до момента, когда текст реплики готов для диалога.
+    """
+    from audio_stream import END_OF_TURN, UTTERANCE, PCMResampler, SpeechEndpointer
+
+    pcm, turn_spans = conference_turns(args.turns)
+    chunk_seconds, asr_seconds = args.chunk_ms / 1000, args.asr_ms / 1000
+    chunks = audio_chunks(pcm, args.chunk_ms)
+
+    def speech_end_before(moment: float):
+        ends = [end for _, end in turn_spans if end <= moment]
+        return ends[-1] if ends else None
+
+    # Прежний путь
+    clock, empty_count, buffered, old_latencies = 0.0, 0, False, []
+    for index in range(len(chunks)):
+        start, end = index * chunk_seconds, (index + 1) * chunk_seconds
+        clock = max(clock, end) + asr_seconds
+        has_speech = any(s < end and e > start for s, e in turn_spans)
+        if has_speech:
+            empty_count, buffered = 0, True
+        else:
+            empty_count += 1
+        if empty_count >= 3 and buffered:
+            old_latencies.append(clock - speech_end_before(end))
+            buffered = False
+
+    # Новый путь
+    resampler = PCMResampler()
+    endpointer = SpeechEndpointer(utterance_silence_ms=args.utterance_silence_ms,
+                                  turn_silence_ms=args.turn_silence_ms, spectral=args.spectral)
+    asr_calls, asr_done, new_latencies = 0, 0.0, []
+    cpu = _cpu_seconds()
+    for index, chunk in enumerate(chunks):
+        arrival = (index + 1) * chunk_seconds
+        for kind, _ in endpointer.push(resampler.process(chunk)):
+            if kind == UTTERANCE:
+                asr_calls += 1
+                asr_done = max(asr_done, arrival + asr_seconds)
+            elif kind == END_OF_TURN:
+                new_latencies.append(max(arrival, asr_done) - speech_end_before(arrival))
+    cpu = _cpu_seconds() - cpu
+    minutes = len(pcm) / 2 / 44100 / 60
+
+    print(f"{len(turn_spans)} реплик, {minutes:.1f} мин звука, фрагменты по {args.chunk_ms} мс, ASR {args.asr_ms} мс")
+    print(f"{'path':<12} {'ASR calls':>10} {'turns':>6} {'latency mean, s':>16} {'p95, s':>7}")
+    for name, calls, latencies in (("per chunk", len(chunks), old_latencies),
+                                   ("endpointer", asr_calls, new_latencies)):
+        if not latencies:
+            print(f"{name:<12} {calls:10d} {0:6d} {'-':>16} {'-':>7}")
+            continue
+        print(f"{name:<12} {calls:10d} {len(latencies):6d} {np.mean(latencies):16.2f} "
+              f"{np.percentile(latencies, 95):7.2f}")
+    print(f"ASR вызовов в {len(chunks) / max(asr_calls, 1):.0f} раз меньше; "
+          f"VAD+ресемплинг {cpu / minutes:.3f} CPU s/мин")
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "experience": bench_experience,
+    "normalize": bench_normalize,
+    "docx": bench_docx,
+    "encoders": bench_encoders,
+    "cascade": bench_cascade,
+    "batching": bench_batching,
+    "queue": bench_queue,
+    "speech_http": bench_speech_http,
+    "transcode": bench_transcode,
+    "endpointing": bench_endpointing,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI HR benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Число повторов, берется лучшее время")
+    parser.add_argument("--size-mb", type=int, default=8,
+                        help="Размер синтетического текста, MB")
+    parser.add_argument("--docx-rows", type=int, default=2000,
+                        help="Число абзацев и строк таблицы в сгенерированном DOCX")
+    parser.add_argument("--backends", default="torch,int8,onnx",
+                        help="Бэкенды кодировщика через запятую (для encoders)")
+    parser.add_argument("--bands", default="0.05,0.1,0.15,0.2",
+                        help="Полуширины полосы вокруг порога через запятую (для cascade)")
+    parser.add_argument("--cascade-model", default=None,
+                        help="Малая модель каскада (для cascade)")
+    parser.add_argument("--cascade-top-k", type=int, default=5,
+                        help="Фрагментов на пограничное требование для большой модели (для cascade)")
+    parser.add_argument("--budgets", default="2048,4096,8192,16384",
+                        help="Бюджеты токенов на батч через запятую (для batching)")
+    parser.add_argument("--sentences", type=int, default=2000,
+                        help="Число фрагментов резюме в замере (для batching)")
+    parser.add_argument("--sessions", default="1,5,20,50",
+                        help="Числа одновременных сессий через запятую (для queue)")
+    parser.add_argument("--calls", type=int, default=200,
+                        help="Число запросов на клиент (для speech_http)")
+    parser.add_argument("--audio", default=None,
+                        help="Записанный WAV 44.1 кГц вместо синтетической речи (для transcode)")
+    parser.add_argument("--chunk-ms", type=int, default=250,
+                        help="Длительность фрагмента из конференции, мс (для transcode, endpointing)")
+    parser.add_argument("--turns", type=int, default=20,
+                        help="Число реплик кандидата в синтетическом звонке (для endpointing)")
+    parser.add_argument("--asr-ms", type=int, default=200,
+                        help="Время ответа ASR, мс (для endpointing)")
+    parser.add_argument("--utterance-silence-ms", type=int, default=400,
+                        help="Тишина, завершающая фразу (для endpointing)")
+    parser.add_argument("--turn-silence-ms", type=int, default=800,
+                        help="Тишина, завершающая реплику (для endpointing)")
+    parser.add_argument("--spectral", action="store_true",
+                        help="Спектральная проверка кадров в VAD (для endpointing)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    BENCHMARKS[args.benchmark](args)
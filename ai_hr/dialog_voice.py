@@ -3,77 +3,416 @@ from dotenv import load_dotenv
 import requests
 from pydub import AudioSegment
 from io import BytesIO
+import asyncio
+import functools
 import json
+import random
 import subprocess
+import threading
+import time
+from typing import Callable, Dict, Optional
+import httpx
 from pydub.utils import which
+from audio_stream import RECOGNIZER_CONTENT_TYPE
+from requests.adapters import HTTPAdapter
+
+OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+SALUTE_SCOPE = "SALUTE_SPEECH_PERS"
+
+# Токен не используется позже чем за TOKEN_REFRESH_MARGIN секунд до expires_at,
+# а за TOKEN_REFRESH_AHEAD секунд до истечения обновляется в фоне
+TOKEN_REFRESH_MARGIN = 60.0
+TOKEN_REFRESH_AHEAD = 300.0
+# Срок жизни, если сервер его не вернул (токены SaluteSpeech живут 30 минут)
+DEFAULT_TOKEN_LIFETIME = 1800.0
+# Пауза перед повторным фоновым обновлением после ошибки
+TOKEN_RETRY_DELAY = 5.0
+
+# Ответы, после которых запрос повторяется
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+SYNTHESIZE_URL = "https://smartspeech.sber.ru/rest/v1/text:synthesize"
+RECOGNIZE_URL = "https://smartspeech.sber.ru/rest/v1/speech:recognize"
+
+
+def retry_delay(backoff: float, attempt: int) -> float:
+    """Пауза перед повтором: full jitter в [0, backoff * 2^attempt]"""
+    return random.uniform(0, backoff * 2 ** attempt)
+
+
+class SpeechHTTPClient:
+    """
+    HTTP-клиент с пулом keep-alive соединений для OAuth, синтеза и распознавания.
+    pool_per_host — keep-alive соединений на хост (при исчерпании вызов не ждет, а открывает
+    временное соединение, которое закрывается после ответа), pool_hosts — хостов в пуле.
+    Запрос повторяется до retries раз при ошибке соединения, таймауте или статусе из
+    RETRY_STATUSES; пауза — случайная в [0, backoff * 2^попытка] (full jitter), чтобы
+    сессии не повторяли запросы синхронно.
+    """
+
+    def __init__(self, pool_per_host: int = 16, pool_hosts: int = 4, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, retries: int = 2, backoff: float = 0.2, verify: bool = False):
+        self.pool_per_host = pool_per_host
+        self.pool_hosts = pool_hosts
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.verify = verify
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts,
+                              pool_maxsize=pool_per_host, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = {"requests": 0, "retries": 0}
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        for attempt in range(self.retries + 1):
+            self.stats["requests"] += 1
+            try:
+                response = self.session.post(
+                    url, timeout=self.timeout, verify=self.verify, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                response.close()
+            self.stats["retries"] += 1
+            time.sleep(retry_delay(self.backoff, attempt))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncSpeechHTTPClient:
+    """
+    Асинхронный аналог SpeechHTTPClient на httpx с теми же лимитами, таймаутами и повторами.
+    Пул соединений httpx привязан к event loop, поэтому у каждого loop свой клиент: он
+    создается на первом запросе в этом loop и закрывается aclose() из того же loop
+    (до завершения loop). Клиенты уже закрытых loop закрыть нельзя — они отбрасываются.
+    """
+
+    def __init__(self, pool_per_host: int = 16, pool_hosts: int = 4, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, retries: int = 2, backoff: float = 0.2, verify: bool = False):
+        self.limits = httpx.Limits(max_connections=pool_per_host * pool_hosts,
+                                   max_keepalive_connections=pool_per_host)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout,
+                                     pool=read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.verify = verify
+        self._clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0}
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                for closed in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[closed]
+                client = self._clients[loop] = httpx.AsyncClient(
+                    limits=self.limits, timeout=self.timeout, verify=self.verify)
+        return client
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        client = self._ensure_client()
+        for attempt in range(self.retries + 1):
+            self.stats["requests"] += 1
+            try:
+                response = await client.post(url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+            self.stats["retries"] += 1
+            await asyncio.sleep(retry_delay(self.backoff, attempt))
+
+    async def aclose(self) -> None:
+        """Закрывает клиент текущего event loop"""
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def _client_settings() -> Dict:
+    return {
+        "pool_per_host": int(os.getenv("SPEECH_POOL_PER_HOST", 16)),
+        "connect_timeout": float(os.getenv("SPEECH_CONNECT_TIMEOUT", 5)),
+        "read_timeout": float(os.getenv("SPEECH_READ_TIMEOUT", 30)),
+        "retries": int(os.getenv("SPEECH_RETRIES", 2)),
+        "backoff": float(os.getenv("SPEECH_RETRY_BACKOFF", 0.2)),
+    }
+
+
+_default_client: Optional[SpeechHTTPClient] = None
+_default_async_client: Optional[AsyncSpeechHTTPClient] = None
+_default_client_lock = threading.Lock()
+
+
+def default_speech_client() -> SpeechHTTPClient:
+    """Общий на процесс клиент; настройки — переменные окружения SPEECH_*"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = SpeechHTTPClient(**_client_settings())
+    return _default_client
+
+
+def default_async_speech_client() -> AsyncSpeechHTTPClient:
+    """Общий на процесс асинхронный клиент с теми же настройками SPEECH_*"""
+    global _default_async_client
+    with _default_client_lock:
+        if _default_async_client is None:
+            _default_async_client = AsyncSpeechHTTPClient(**_client_settings())
+    return _default_async_client
+
+
+def request_salute_token(api_key_salute: str, user_id: str, scope: str = SALUTE_SCOPE,
+                         url: str = OAUTH_URL, client: Optional[SpeechHTTPClient] = None) -> Dict:
+    """Запрос нового токена: {"access_token": ..., "expires_at": мс от эпохи}"""
+    payload = {'scope': scope}
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept': 'application/json',
+        'RqUID': user_id,
+        'Authorization': f'Basic {api_key_salute}'
+    }
+
+    response = (client or default_speech_client()).post(
+        url,
+        headers=headers,
+        data=payload
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+
+class _TokenRefresh:
+    """Одно обновление токена, которого ждут все одновременные вызовы"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.token: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class TokenManager:
+    """
+    Кэш access token с учетом expires_at. Пока до истечения больше refresh_ahead секунд,
+    токен отдается из памяти; в окне refresh_ahead вызовы получают текущий токен, а один
+    фоновый поток запрашивает новый. Если токен истек (с запасом refresh_margin), первый
+    вызов запрашивает его сам, остальные ждут тот же запрос (single-flight).
+    Работает из потоков; из asyncio — через get_token_async, который не блокирует
+    event loop, когда токен есть в кэше.
+    """
+
+    def __init__(self, fetch: Callable[[], Dict], refresh_margin: float = TOKEN_REFRESH_MARGIN,
+                 refresh_ahead: float = TOKEN_REFRESH_AHEAD, clock: Callable[[], float] = time.time):
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.refresh_ahead = max(refresh_ahead, refresh_margin)
+        self._clock = clock
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh: Optional[_TokenRefresh] = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "fetches": 0,
+                      "background_fetches": 0, "errors": 0}
+
+    @staticmethod
+    def _expiry(data: Dict, now: float) -> float:
+        expires_at = data.get("expires_at")
+        if expires_at is None:
+            return now + float(data.get("expires_in", DEFAULT_TOKEN_LIFETIME))
+        expires_at = float(expires_at)
+        # SaluteSpeech возвращает миллисекунды
+        return expires_at / 1000 if expires_at > 1e11 else expires_at
+
+    def _cached(self) -> Optional[str]:
+        """Токен из кэша (при необходимости запускает фоновое обновление) или None"""
+        with self._lock:
+            now = self._clock()
+            if self._token is None or now >= self._expires_at - self.refresh_margin:
+                return None
+            self.stats["hits"] += 1
+            if now >= self._expires_at - self.refresh_ahead and self._refresh is None \
+                    and now >= self._retry_at:
+                refresh = self._refresh = _TokenRefresh()
+                self.stats["background_fetches"] += 1
+                threading.Thread(target=self._run_refresh, args=(refresh,),
+                                 name="salute-token", daemon=True).start()
+            return self._token
+
+    def _run_refresh(self, refresh: _TokenRefresh) -> None:
+        try:
+            data = self._fetch()
+            token = data["access_token"]
+            with self._lock:
+                self._token = token
+                self._expires_at = self._expiry(data, self._clock())
+                self.stats["fetches"] += 1
+            refresh.token = token
+        except BaseException as e:
+            refresh.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+                self._retry_at = self._clock() + TOKEN_RETRY_DELAY
+        finally:
+            with self._lock:
+                self._refresh = None
+            refresh.done.set()
+
+    def get_token(self) -> str:
+        token = self._cached()
+        if token is not None:
+            return token
+        with self._lock:
+            # Пока ждали блокировку, токен мог обновить другой поток
+            if self._token is not None and self._clock() < self._expires_at - self.refresh_margin:
+                return self._token
+            refresh, owner = self._refresh, False
+            if refresh is None:
+                refresh, owner = _TokenRefresh(), True
+                self._refresh = refresh
+        if owner:
+            self._run_refresh(refresh)
+        else:
+            refresh.done.wait()
+        if refresh.error is not None:
+            # Фоновое обновление могло упасть, пока старый токен еще годен
+            token = self._cached()
+            if token is not None:
+                return token
+            raise refresh.error
+        return refresh.token
+
+    async def get_token_async(self) -> str:
+        token = self._cached()
+        if token is not None:
+            return token
+        return await asyncio.to_thread(self.get_token)
+
+    def invalidate(self, token: Optional[str] = None) -> None:
+        """Сбрасывает кэш (например, после 401); token — сбросить, только если он еще текущий"""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token, self._expires_at = None, 0.0
+
+
+_token_managers: Dict[tuple, TokenManager] = {}
+_token_managers_lock = threading.Lock()
+
+
+def shared_token_manager(api_key_salute: str, user_id: str, scope: str = SALUTE_SCOPE) -> TokenManager:
+    """Один менеджер токенов на учетные данные: все сессии процесса делят токен"""
+    key = (api_key_salute, user_id, scope)
+    with _token_managers_lock:
+        if key not in _token_managers:
+            _token_managers[key] = TokenManager(functools.partial(
+                request_salute_token, api_key_salute, user_id, scope))
+        return _token_managers[key]
+
+
+def ffmpeg_opus_command() -> list:
+    """ffmpeg: аудио из stdin -> Ogg/Opus 16 кГц моно в stdout"""
+    return [
+        which("ffmpeg") or "ffmpeg",
+        '-i', 'pipe:0',
+        '-acodec', 'libopus',
+        '-ac', '1',
+        '-ar', '16000',
+        '-f', 'ogg',
+        'pipe:1'
+    ]
+
+
+def parse_recognition(result) -> str:
+    """Текст из ответа speech:recognize"""
+    if isinstance(result, dict) and 'result' in result:
+        return result['result']
+    elif isinstance(result, list) and len(result) > 0:
+        return str(result[0])
+    else:
+        return str(result)
+
+
+TTS_HEADERS = {
+    'Content-Type': 'application/text',
+    'Accept': 'audio/webm'
+}
+OPUS_CONTENT_TYPE = 'audio/ogg;codecs=opus'
 
 
 class SberSpeechAPI:
-    def __init__(self, api_key_salute, user_id):
+    """
+    Синтез и распознавание речи SaluteSpeech. atts/aasr — нативные асинхронные версии
+    (httpx и asyncio-подпроцесс ffmpeg), они не блокируют event loop; tts/asr — синхронные
+    для скриптов и потоков. Токен и пулы соединений общие для всех экземпляров.
+    """
+
+    def __init__(self, api_key_salute, user_id, http_client: Optional[SpeechHTTPClient] = None,
+                 async_http_client: Optional[AsyncSpeechHTTPClient] = None):
         self.api_key_salute = api_key_salute
         self.user_id = user_id
+        self.token_manager = shared_token_manager(api_key_salute, user_id)
+        # Пул соединений общий для всех сессий процесса
+        self.http = http_client or default_speech_client()
+        self.async_http = async_http_client or default_async_speech_client()
 
     def _get_token(self):
-        """Получение нового токена"""
-        url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-        payload = {'scope': 'SALUTE_SPEECH_PERS'}
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json',
-            'RqUID': self.user_id,
-            'Authorization': f'Basic {self.api_key_salute}'
-        }
-
-        response = requests.post(
-            url,
-            headers=headers,
-            data=payload,
-            verify=False
-        )
-        response.raise_for_status()
+        """Действующий токен из общего кэша; новый запрашивается только перед истечением"""
+        return self.token_manager.get_token()
 
-        return response.json()['access_token']
+    def _post(self, url, headers, data):
+        """POST с токеном; на 401 токен сбрасывается и запрос повторяется один раз"""
+        access_token = self._get_token()
+        response = self.http.post(
+            url, headers={**headers, 'Authorization': f'Bearer {access_token}'}, data=data)
+        if response.status_code == 401:
+            self.token_manager.invalidate(access_token)
+            response = self.http.post(
+                url, headers={**headers, 'Authorization': f'Bearer {self._get_token()}'}, data=data)
+        return response
+
+    async def _apost(self, url, headers, data):
+        """Асинхронный _post"""
+        access_token = await self.token_manager.get_token_async()
+        response = await self.async_http.post(
+            url, headers={**headers, 'Authorization': f'Bearer {access_token}'}, content=data)
+        if response.status_code == 401:
+            self.token_manager.invalidate(access_token)
+            access_token = await self.token_manager.get_token_async()
+            response = await self.async_http.post(
+                url, headers={**headers, 'Authorization': f'Bearer {access_token}'}, content=data)
+        return response
 
     def tts(self, text):
         """Преобразование текста в речь с возвратом WebM в виде байтов"""
-        access_token = self._get_token()
-
-        url = "https://smartspeech.sber.ru/rest/v1/text:synthesize"
-        headers = {
-            'Content-Type': 'application/text',
-            'Accept': 'audio/webm',
-            'Authorization': f'Bearer {access_token}'
-        }
-
-        response = requests.post(
-            url,
-            headers=headers,
-            data=text.encode('utf-8'),
-            verify=False
-        )
+        response = self._post(SYNTHESIZE_URL, TTS_HEADERS, text.encode('utf-8'))
         response.raise_for_status()
 
         return response.content
 
-    def asr(self, webm_data):
-        """Распознавание речи из WebM данных, возвращает строку"""
-        access_token = self._get_token()
-
-        ffmpeg_path = which("ffmpeg") or "ffmpeg"
+    async def atts(self, text):
+        """Асинхронный tts"""
+        response = await self._apost(SYNTHESIZE_URL, TTS_HEADERS, text.encode('utf-8'))
+        response.raise_for_status()
 
-        ffmpeg_command = [
-            ffmpeg_path,
-            '-i', 'pipe:0',
-            '-acodec', 'libopus',
-            '-ac', '1',
-            '-ar', '16000',
-            '-f', 'ogg',
-            'pipe:1'
-        ]
+        return response.content
 
+    def _transcode(self, webm_data):
+        """Аудио -> Ogg/Opus через ffmpeg; None при ошибке"""
         try:
             process = subprocess.Popen(
-                ffmpeg_command,
+                ffmpeg_opus_command(),
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
@@ -82,35 +421,56 @@ class SberSpeechAPI:
 
             if process.returncode != 0:
                 print(f"Ошибка ffmpeg: {stderr.decode()}")
-                return ""
+                return None
+            return opus_data
 
         except Exception as e:
             print(f"Ошибка при конвертации аудио: {e}")
-            return ""
-
-        url = "https://smartspeech.sber.ru/rest/v1/speech:recognize"
-        headers = {
-            'Content-Type': 'audio/ogg;codecs=opus',
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
+            return None
 
+    async def _atranscode(self, webm_data):
+        """Асинхронный _transcode: ffmpeg как asyncio-подпроцесс"""
         try:
-            response = requests.post(
-                url,
-                headers=headers,
-                data=opus_data,
-                verify=False
+            process = await asyncio.create_subprocess_exec(
+                *ffmpeg_opus_command(),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
-            response.raise_for_status()
+        except Exception as e:
+            print(f"Ошибка при конвертации аудио: {e}")
+            return None
+        try:
+            opus_data, stderr = await process.communicate(input=webm_data)
+        except asyncio.CancelledError:
+            # Сессия закрыта: не оставляем ffmpeg висеть
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise
+        except Exception as e:
+            print(f"Ошибка при конвертации аудио: {e}")
+            return None
 
-            result = response.json()
-            if isinstance(result, dict) and 'result' in result:
-                return result['result']
-            elif isinstance(result, list) and len(result) > 0:
-                return str(result[0])
-            else:
-                return str(result)
+        if process.returncode != 0:
+            print(f"Ошибка ffmpeg: {stderr.decode()}")
+            return None
+        return opus_data
+
+    def asr(self, webm_data):
+        """Распознавание речи из WebM данных, возвращает строку"""
+        opus_data = self._transcode(webm_data)
+        if opus_data is None:
+            return ""
+        return self.recognize(opus_data, OPUS_CONTENT_TYPE)
+
+    def recognize(self, audio, content_type=RECOGNIZER_CONTENT_TYPE):
+        """Распознавание готового для SaluteSpeech аудио (по умолчанию PCM 16 кГц) без ffmpeg"""
+        headers = {'Content-Type': content_type, 'Accept': 'application/json'}
+        try:
+            response = self._post(RECOGNIZE_URL, headers, audio)
+            response.raise_for_status()
+            return parse_recognition(response.json())
 
         except requests.exceptions.HTTPError as e:
             print(f"Ошибка при распознавании речи: {e}")
@@ -120,6 +480,29 @@ class SberSpeechAPI:
             print(f"Ошибка при распознавании речи: {e}")
             return ""
 
+    async def aasr(self, webm_data):
+        """Асинхронный asr"""
+        opus_data = await self._atranscode(webm_data)
+        if opus_data is None:
+            return ""
+        return await self.arecognize(opus_data, OPUS_CONTENT_TYPE)
+
+    async def arecognize(self, audio, content_type=RECOGNIZER_CONTENT_TYPE):
+        """Асинхронный recognize"""
+        headers = {'Content-Type': content_type, 'Accept': 'application/json'}
+        try:
+            response = await self._apost(RECOGNIZE_URL, headers, audio)
+            response.raise_for_status()
+            return parse_recognition(response.json())
+
+        except httpx.HTTPStatusError as e:
+            print(f"Ошибка при распознавании речи: {e}")
+            print(f"Статус код: {e.response.status_code}")
+            return ""
+        except Exception as e:
+            print(f"Ошибка при распознавании речи: {e}")
+            return ""
+
 
 load_dotenv()
 
@@ -0,0 +1,345 @@
+# embedding_cache.py
+# Двухуровневый кэш эмбеддингов: LRU в памяти + fp16-файл на диске (memmap).
+# Ключ — хэш от (имя модели, промпт-префикс, текст), поэтому одинаковые
+# требования вакансий и фрагменты резюме кодируются моделью один раз.
+# У каждой модели (namespace) свой дисковый каталог: размерности векторов у моделей разные.
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+KEY_SIZE = 16
+ROW_FIELD_SIZE = 8
+RECORD_SIZE = KEY_SIZE + ROW_FIELD_SIZE
+DISK_DTYPE = np.float16
+
+
+def make_cache_key(model_name: str, prompt: str, text: str) -> bytes:
+    """Контентный ключ эмбеддинга"""
+    payload = f"{model_name}\0{prompt}\0{text}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+
+class DiskEmbeddingStore:
+    """
+    Дисковый уровень кэша. Файлы одного поколения:
+      vectors-<gen>.f16 — строки fp16 размерности dim (читаются через memmap);
+      index-<gen>.bin   — журнал записей (ключ 16 байт, номер строки 8 байт).
+    CURRENT хранит номер актуального поколения, meta.json — размерность.
+    Писатели сериализуются через flock, читатели работают без блокировок:
+    запись индекса появляется только после записи вектора, а при уплотнении
+    создается новое поколение, старые файлы остаются валидными для открытых memmap.
+    Вытеснение — FIFO по порядку записи: чтения не отслеживаются, поэтому часто
+    используемый вектор после уплотнения может быть закодирован заново.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        self._dim: Optional[int] = None
+        self._generation: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._index_offset = 0
+        self._vectors: Optional[np.memmap] = None
+        self._mapped_rows = 0
+
+    # ---------- служебное ----------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _vectors_path(self, generation: int) -> str:
+        return self._path(f"vectors-{generation}.f16")
+
+    def _index_path(self, generation: int) -> str:
+        return self._path(f"index-{generation}.bin")
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self._path("CURRENT"), "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_generation(self, generation: int) -> None:
+        tmp_path = self._path("CURRENT.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, self._path("CURRENT"))
+
+    def _read_dim(self) -> Optional[int]:
+        if self._dim is None:
+            try:
+                with open(self._path("meta.json"), "r") as f:
+                    self._dim = int(json.load(f)["dim"])
+            except FileNotFoundError:
+                return None
+        return self._dim
+
+    def _row_bytes(self) -> int:
+        return self._dim * np.dtype(DISK_DTYPE).itemsize
+
+    def _refresh(self) -> None:
+        """Подтягивает новые записи индекса, в том числе сделанные другими процессами"""
+        generation = self._read_generation()
+        if generation != self._generation:
+            self._generation = generation
+            self._index = {}
+            self._index_offset = 0
+            self._vectors = None
+            self._mapped_rows = 0
+        try:
+            with open(self._index_path(generation), "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        complete = len(data) - len(data) % RECORD_SIZE
+        for offset in range(0, complete, RECORD_SIZE):
+            key = data[offset:offset + KEY_SIZE]
+            self._index[key] = int.from_bytes(
+                data[offset + KEY_SIZE:offset + RECORD_SIZE], "little")
+        self._index_offset += complete
+
+    def _row(self, row: int) -> np.ndarray:
+        if self._vectors is None or row >= self._mapped_rows:
+            path = self._vectors_path(self._generation)
+            rows = os.path.getsize(path) // self._row_bytes()
+            self._vectors = np.memmap(
+                path, dtype=DISK_DTYPE, mode="r", shape=(rows, self._dim))
+            self._mapped_rows = rows
+        return np.asarray(self._vectors[row], dtype=np.float32)
+
+    # ---------- публичный интерфейс ----------
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        if self._read_dim() is None:
+            return [None] * len(keys)
+        for _ in range(3):
+            self._refresh()
+            try:
+                results = []
+                for key in keys:
+                    row = self._index.get(key)
+                    results.append(None if row is None else self._row(row))
+                return results
+            except FileNotFoundError:
+                # Другой процесс уплотнил кэш и удалил файл прочитанного поколения
+                # до того, как мы его открыли: CURRENT уже указывает на новое
+                continue
+        return [None] * len(keys)
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        if not len(keys):
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._put_locked(keys, vectors)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def size_bytes(self) -> int:
+        generation = self._read_generation()
+        total = 0
+        for path in (self._vectors_path(generation), self._index_path(generation)):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def __len__(self) -> int:
+        if self._read_dim() is None:
+            return 0
+        self._refresh()
+        return len(self._index)
+
+    # ---------- запись под блокировкой ----------
+
+    def _put_locked(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        if self._read_dim() is None:
+            self._dim = int(vectors.shape[1])
+            with open(self._path("meta.json"), "w") as f:
+                json.dump({"dim": self._dim, "dtype": "float16"}, f)
+        elif vectors.shape[1] != self._dim:
+            raise ValueError(
+                f"Размерность эмбеддингов {vectors.shape[1]} не совпадает с кэшем ({self._dim})")
+
+        self._refresh()
+        new_rows = {}
+        for key, vector in zip(keys, vectors):
+            if key not in self._index and key not in new_rows:
+                new_rows[key] = vector
+        if not new_rows:
+            return
+
+        vectors_path = self._vectors_path(self._generation)
+        row_bytes = self._row_bytes()
+        with open(vectors_path, "ab") as f:
+            size = f.tell()
+            if size % row_bytes:
+                # Хвост от прерванной записи: обрезаем до целых строк
+                f.truncate(size - size % row_bytes)
+                size -= size % row_bytes
+            start_row = size // row_bytes
+            block = np.asarray(list(new_rows.values()), dtype=DISK_DTYPE)
+            f.write(block.tobytes())
+
+        records = bytearray()
+        for offset, key in enumerate(new_rows):
+            records += key + (start_row + offset).to_bytes(ROW_FIELD_SIZE, "little")
+        with open(self._index_path(self._generation), "ab") as f:
+            f.write(records)
+
+        if self.size_bytes() > self.max_bytes:
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        """Вытесняет самые ранние по записи строки (FIFO), оставляя половину лимита под новые"""
+        self._refresh()
+        entries = sorted(self._index.items(), key=lambda item: item[1])
+        keep_rows = max(1, (self.max_bytes // 2) //
+                        (self._row_bytes() + RECORD_SIZE))
+        kept = entries[-keep_rows:]
+
+        new_generation = self._generation + 1
+        rows = np.stack([self._row(row) for _, row in kept]).astype(DISK_DTYPE)
+        with open(self._vectors_path(new_generation), "wb") as f:
+            f.write(rows.tobytes())
+        with open(self._index_path(new_generation), "wb") as f:
+            f.write(b"".join(
+                key + new_row.to_bytes(ROW_FIELD_SIZE, "little")
+                for new_row, (key, _) in enumerate(kept)))
+
+        old_generation = self._generation
+        self._write_generation(new_generation)
+        self.evictions += len(entries) - len(kept)
+        # Открытые memmap в других процессах продолжают видеть удаленные файлы
+        for path in (self._vectors_path(old_generation), self._index_path(old_generation)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._refresh()
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов: LRU в памяти (float32) поверх опционального дискового уровня (fp16, FIFO).
+    namespace (идентификатор модели) выбирает дисковое хранилище — подкаталог cache_dir
+    со своим лимитом max_disk_bytes; ключи разных моделей и так не пересекаются.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_memory_bytes: int = 256 * 1024 ** 2,
+                 max_disk_bytes: int = 2 * 1024 ** 3):
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._disks: Dict[str, DiskEmbeddingStore] = {}
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions_memory = 0
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        # Копия: строка из пакета держала бы в памяти весь массив пакета
+        vector = vector.copy()
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.evictions_memory += 1
+
+    def _disk(self, namespace: str) -> Optional[DiskEmbeddingStore]:
+        if not self.cache_dir:
+            return None
+        if namespace not in self._disks:
+            directory = re.sub(r"[^\w.-]+", "_", namespace) or "_"
+            self._disks[namespace] = DiskEmbeddingStore(
+                os.path.join(self.cache_dir, directory), self.max_disk_bytes)
+        return self._disks[namespace]
+
+    def get_many(self, keys: Sequence[bytes], namespace: str = "") -> List[Optional[np.ndarray]]:
+        with self._lock:
+            results: List[Optional[np.ndarray]] = []
+            disk_lookup = []
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                else:
+                    disk_lookup.append(i)
+                results.append(vector)
+
+            disk = self._disk(namespace) if disk_lookup else None
+            if disk is not None:
+                found = disk.get_many([keys[i] for i in disk_lookup])
+                for i, vector in zip(disk_lookup, found):
+                    if vector is not None:
+                        results[i] = vector
+                        self.hits_disk += 1
+                        self._remember(keys[i], vector)
+            self.misses += sum(1 for vector in results if vector is None)
+            return results
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray, namespace: str = "") -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            disk = self._disk(namespace)
+            if disk is not None:
+                disk.put_many(keys, vectors)
+
+    def stats(self) -> Dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        disks = list(self._disks.values())
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "evictions_memory": self.evictions_memory,
+            "disk_items": sum(len(disk) for disk in disks),
+            "disk_bytes": sum(disk.size_bytes() for disk in disks),
+            "evictions_disk": sum(disk.evictions for disk in disks),
+        }
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def default_embedding_cache() -> Optional[EmbeddingCache]:
+    """Общий на процесс кэш; включается переменной окружения EMBEDDING_CACHE_DIR"""
+    global _default_cache
+    cache_dir = os.getenv("EMBEDDING_CACHE_DIR")
+    if not cache_dir:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache(
+                cache_dir,
+                max_memory_bytes=int(os.getenv(
+                    "EMBEDDING_CACHE_MEMORY_BYTES", 256 * 1024 ** 2)),
+                max_disk_bytes=int(os.getenv(
+                    "EMBEDDING_CACHE_DISK_BYTES", 2 * 1024 ** 3))
+            )
+    return _default_cache
@@ -0,0 +1,94 @@
+# execution.py
+# Модель исполнения сервиса: блокирующие вызовы (ASR/TTS, GigaChat, MinIO, сборка отчета)
+# выполняются в ограниченном пуле потоков, а не в event loop. У каждой стадии свой лимит
+# одновременных вызовов, поэтому, например, завершение анализа одной сессии не занимает
+# все потоки, нужные распознаванию речи остальных кандидатов.
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Лимиты одновременных вызовов по стадиям; переопределяются через STAGE_LIMIT_<СТАДИЯ>
+DEFAULT_STAGE_LIMITS = {
+    "asr": 8,
+    "tts": 8,
+    "dialog": 8,
+    "storage": 4,
+    "setup": 4,
+    "analysis": 2,
+}
+
+
+class StageExecutor:
+    """
+    Ограниченный пул потоков io_threads для блокирующего I/O и семафоры по стадиям.
+    Стадия без явного лимита ограничена только размером пула.
+    Кодировщик сюда не входит: он работает в отдельном потоке общей очереди (inference_queue.py),
+    разбор документов — в пуле процессов (extraction_pool.py).
+    """
+
+    def __init__(self, io_threads: int = 32, limits: Optional[Dict[str, int]] = None):
+        self.io_threads = io_threads
+        self.limits = dict(DEFAULT_STAGE_LIMITS if limits is None else limits)
+        self._executor = ThreadPoolExecutor(
+            max_workers=io_threads, thread_name_prefix="stage-io")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {stage: {"calls": 0, "active": 0, "peak": 0} for stage in self.limits}
+
+    def _semaphore(self, stage: str) -> Optional[asyncio.Semaphore]:
+        # Семафоры привязаны к event loop, в котором используются
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphores = loop, {}
+        if stage not in self.limits:
+            return None
+        if stage not in self._semaphores:
+            self._semaphores[stage] = asyncio.Semaphore(self.limits[stage])
+        return self._semaphores[stage]
+
+    @asynccontextmanager
+    async def limit(self, stage: str) -> AsyncIterator[None]:
+        """Ограничивает число одновременных вызовов стадии (и для асинхронного кода)"""
+        semaphore = self._semaphore(stage)
+        stats = self.stats.setdefault(stage, {"calls": 0, "active": 0, "peak": 0})
+        if semaphore is not None:
+            await semaphore.acquire()
+        stats["calls"] += 1
+        stats["active"] += 1
+        stats["peak"] = max(stats["peak"], stats["active"])
+        try:
+            yield
+        finally:
+            stats["active"] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    async def run(self, stage: str, func: Callable[..., T], *args) -> T:
+        """Выполняет блокирующий func(*args) в пуле потоков в пределах лимита стадии"""
+        async with self.limit(stage):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+_default_executor: Optional[StageExecutor] = None
+_default_executor_lock = threading.Lock()
+
+
+def default_stage_executor() -> StageExecutor:
+    """Общий на процесс исполнитель; IO_THREADS и STAGE_LIMIT_<СТАДИЯ> задают размеры"""
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            limits = {stage: int(os.getenv(f"STAGE_LIMIT_{stage.upper()}", limit))
+                      for stage, limit in DEFAULT_STAGE_LIMITS.items()}
+            _default_executor = StageExecutor(
+                io_threads=int(os.getenv("IO_THREADS", 32)), limits=limits)
+    return _default_executor
@@ -0,0 +1,276 @@
+# extraction_pool.py
+# Пул процессов для извлечения текста из документов. pypdf/python-docx/striprtf
+# работают в отдельных процессах, поэтому битый или огромный файл не блокирует
+# event loop сервиса: у каждого документа есть лимит времени, у каждого воркера —
+# лимит памяти (RSS). Зависший или раздувшийся воркер убивается и заменяется новым.
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import psutil
+
+from text_extraction import EXTRACTORS, DocumentSource, detect_extension, extract_document
+
+
+class ExtractionError(Exception):
+    """
+    Структурированная ошибка извлечения. kind:
+      not_found, unsupported_format, too_large — документ отклонен до разбора;
+      invalid_document — парсер упал на документе;
+      timeout, memory_limit — воркер убит по лимиту;
+      worker_crashed — воркер завершился без ответа.
+    """
+
+    def __init__(self, kind: str, message: str, source: Optional[str] = None, elapsed: float = 0.0):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+        self.source = source
+        self.elapsed = elapsed
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "message": self.message,
+            "source": self.source,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+def _worker_main(conn, recycle_rss_bytes: int) -> None:
+    """Цикл воркера: (источник, расширение, лимиты) -> ("ok", текст, rss) | ("error", kind, сообщение, rss)"""
+    process = psutil.Process()
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        source, extension, max_pages, max_chars = job
+        try:
+            reply = ("ok", extract_document(source, extension, max_pages, max_chars))
+        except FileNotFoundError as e:
+            reply = ("error", "not_found", str(e))
+        except Exception as e:
+            reply = ("error", "invalid_document", f"{type(e).__name__}: {e}")
+        rss = process.memory_info().rss
+        conn.send(reply + (rss,))
+        if rss > recycle_rss_bytes:
+            # Память после тяжелого документа не возвращается ОС — перезапускаемся
+            return
+
+
+class _Worker:
+    def __init__(self, context, recycle_rss_bytes: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, recycle_rss_bytes), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def rss(self) -> int:
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss
+        except psutil.Error:
+            return 0
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+
+class ExtractionPool:
+    """
+    Пул из workers процессов. Вызов extract() блокирует только вызывающий поток
+    до ответа воркера; extract_async() ждет ответ в пуле потоков asyncio.
+    timeout — лимит времени на документ, max_rss_bytes — жесткий лимит памяти
+    воркера во время разбора, recycle_rss_bytes — порог перезапуска после документа,
+    max_jobs_per_worker — плановый перезапуск против утечек.
+    max_pages и max_chars ограничивают разбор: у PDF лишние страницы не читаются.
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 30.0, max_rss_bytes: int = 1024 ** 3,
+                 recycle_rss_bytes: Optional[int] = None, max_jobs_per_worker: int = 200,
+                 max_input_bytes: int = 50 * 1024 ** 2, max_pages: Optional[int] = None,
+                 max_chars: Optional[int] = None, poll_interval: float = 0.05):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_rss_bytes = max_rss_bytes
+        self.recycle_rss_bytes = recycle_rss_bytes or max_rss_bytes // 2
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_input_bytes = max_input_bytes
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.poll_interval = poll_interval
+        # spawn: не форкаем процесс сервиса с загруженным torch и его потоками
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._all = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.stats = {"ok": 0, "errors": 0, "timeouts": 0,
+                      "memory_kills": 0, "recycled": 0}
+
+    # ---------- жизненный цикл ----------
+
+    def start(self) -> "ExtractionPool":
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ExtractionPool закрыт")
+            if not self._started:
+                for _ in range(self.workers):
+                    self._spawn()
+                self._started = True
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            workers, self._all = list(self._all), set()
+        for worker in workers:
+            worker.stop()
+
+    def __enter__(self) -> "ExtractionPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _spawn(self) -> None:
+        worker = _Worker(self._context, self.recycle_rss_bytes)
+        self._all.add(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker: _Worker, count_as: Optional[str] = None) -> None:
+        worker.kill()
+        with self._lock:
+            self._all.discard(worker)
+            if count_as:
+                self.stats[count_as] += 1
+            if not self._closed:
+                self._spawn()
+
+    def _release(self, worker: _Worker, rss: int) -> None:
+        # Воркер с rss выше порога завершается сам сразу после ответа — не ждем, пока он выйдет
+        if worker.jobs >= self.max_jobs_per_worker or rss > self.recycle_rss_bytes \
+                or not worker.process.is_alive():
+            self._replace(worker, "recycled")
+        else:
+            self._idle.put(worker)
+
+    # ---------- извлечение ----------
+
+    def _prepare(self, source: DocumentSource, extension: Optional[str]):
+        """
+        Проверки до отправки воркеру. Путь передается как есть,
+        файловые объекты читаются в байты. Возвращает (payload, расширение, метка).
+        """
+        if isinstance(source, (str, os.PathLike)):
+            payload = label = os.fspath(source)
+            if not os.path.exists(payload):
+                raise ExtractionError(
+                    "not_found", f"Файл не найден: {payload}", label)
+            size = os.path.getsize(payload)
+            extension = extension or os.path.splitext(payload)[1].lower()
+        else:
+            if not isinstance(source, (bytes, bytearray)):
+                source = source.read(self.max_input_bytes + 1)
+            payload, size, label = bytes(source), len(source), "<bytes>"
+            extension = extension or detect_extension(payload[:16])
+        if extension not in EXTRACTORS:
+            raise ExtractionError(
+                "unsupported_format", f"Неподдерживаемый формат: {extension}", label)
+        if size > self.max_input_bytes:
+            raise ExtractionError(
+                "too_large", f"Документ {size} байт больше лимита {self.max_input_bytes}", label)
+        return payload, extension, label
+
+    def extract(self, source: DocumentSource, extension: Optional[str] = None,
+                timeout: Optional[float] = None) -> str:
+        """Нормализованный текст документа; при любой неудаче — ExtractionError"""
+        payload, extension, label = self._prepare(source, extension)
+        timeout = self.timeout if timeout is None else timeout
+        self.start()
+        worker = self._idle.get()
+        worker.jobs += 1
+        started = time.monotonic()
+        try:
+            worker.conn.send(
+                (payload, extension, self.max_pages, self.max_chars))
+            while not worker.conn.poll(self.poll_interval):
+                elapsed = time.monotonic() - started
+                if not worker.process.is_alive():
+                    self._replace(worker)
+                    raise ExtractionError(
+                        "worker_crashed", f"Воркер завершился с кодом {worker.process.exitcode}", label, elapsed)
+                if elapsed > timeout:
+                    self._replace(worker, "timeouts")
+                    raise ExtractionError(
+                        "timeout", f"Извлечение дольше {timeout:.1f} с", label, elapsed)
+                if worker.rss() > self.max_rss_bytes:
+                    self._replace(worker, "memory_kills")
+                    raise ExtractionError(
+                        "memory_limit", f"Воркер превысил {self.max_rss_bytes} байт RSS", label, elapsed)
+            reply = worker.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError) as e:
+            self._replace(worker)
+            raise ExtractionError("worker_crashed", str(e), label,
+                                  time.monotonic() - started) from e
+
+        self._release(worker, reply[-1])
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stats["ok" if reply[0] == "ok" else "errors"] += 1
+        if reply[0] == "ok":
+            return reply[1]
+        raise ExtractionError(reply[1], reply[2], label, elapsed)
+
+    async def extract_async(self, source: DocumentSource, extension: Optional[str] = None,
+                            timeout: Optional[float] = None) -> str:
+        return await asyncio.to_thread(self.extract, source, extension, timeout)
+
+
+_default_pool: Optional[ExtractionPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def default_extraction_pool() -> ExtractionPool:
+    """Общий на процесс пул; размер и лимиты задаются переменными окружения EXTRACTION_*"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ExtractionPool(
+                workers=int(os.getenv("EXTRACTION_WORKERS", 2)),
+                timeout=float(os.getenv("EXTRACTION_TIMEOUT", 30)),
+                max_rss_bytes=int(os.getenv(
+                    "EXTRACTION_MAX_RSS_BYTES", 1024 ** 3)),
+                max_jobs_per_worker=int(os.getenv(
+                    "EXTRACTION_MAX_JOBS_PER_WORKER", 200)),
+                max_pages=int(os.getenv("EXTRACTION_MAX_PAGES", 0)) or None,
+                max_chars=int(os.getenv("EXTRACTION_MAX_CHARS", 0)) or None,
+            )
+    return _default_pool
+
+
+async def extract_text_async(source: DocumentSource, extension: Optional[str] = None,
+                             timeout: Optional[float] = None) -> str:
+    """Асинхронно извлекает текст из пути, байтов или файлового объекта через общий пул"""
+    return await default_extraction_pool().extract_async(source, extension, timeout)
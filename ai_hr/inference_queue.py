@@ -0,0 +1,240 @@
+# inference_queue.py
+# Общая для всех сессий очередь кодирования. Когда несколько интервью заканчиваются
+# одновременно, их запросы к кодировщику склеиваются в общие батчи и выполняются
+# одним потоком по очереди, а не конкурируют за ядра CPU параллельными encode.
+
+import asyncio
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar, Union
+
+import numpy as np
+
+from analyzer import (CompiledVacancy, InterviewAnalyzer, REQUIREMENT_PROMPT, SOURCE_PROMPT,
+                      structure_vacancy_text)
+
+T = TypeVar("T")
+
+
+class EncodeRequest:
+    def __init__(self, texts: List[str], prompt: str, future: asyncio.Future):
+        self.texts = texts
+        self.prompt = prompt
+        self.future = future
+
+
+class EncodeQueue:
+    """
+    Микробатчинг запросов encode из разных корутин. Батч отправляется в модель, когда
+    набралось max_batch_texts текстов или истек max_delay секунд с первого запроса батча.
+    Каждый вызов encode() получает свой future с эмбеддингами своих текстов.
+    Очередь ограничена max_pending запросами: при переполнении encode() ждет (backpressure).
+    Модель вызывается из одного потока, пока следующий батч копится в очереди.
+    Разбор текстов и сборка отчетов в analyze/compile_vacancy идут в пуле prepare_threads
+    потоков, чтобы не занимать event loop. Конструктор загружает модель — вызывайте его
+    (и default_encode_queue) вне event loop.
+    """
+
+    def __init__(self, analyzer: Optional[InterviewAnalyzer] = None, max_batch_texts: int = 512,
+                 max_delay: float = 0.005, max_pending: int = 256, prepare_threads: int = 2):
+        self.analyzer = analyzer or InterviewAnalyzer()
+        self.max_batch_texts = max_batch_texts
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="encode-queue")
+        self._prepare_executor = ThreadPoolExecutor(
+            max_workers=prepare_threads, thread_name_prefix="encode-prepare")
+        self._carry: Optional[EncodeRequest] = None
+        self.stats = {"requests": 0, "batches": 0, "texts": 0, "encoded": 0}
+
+    # ---------- жизненный цикл ----------
+
+    def _ensure_started(self) -> None:
+        # Очередь и воркер привязаны к event loop, в котором созданы
+        if self._worker is None or self._worker.done() or \
+                self._worker.get_loop() is not asyncio.get_running_loop():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Запросы, не попавшие в модель, завершаются ошибкой, а не висят
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("EncodeQueue закрыта"))
+        self._executor.shutdown(wait=False)
+        self._prepare_executor.shutdown(wait=False)
+
+    # ---------- кодирование ----------
+
+    async def encode(self, texts: List[str], prompt: str = "") -> np.ndarray:
+        """Эмбеддинги texts (n, dim) в исходном порядке, как InterviewAnalyzer.encode_texts"""
+        if not texts:
+            return np.zeros((0, self.analyzer.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(EncodeRequest(list(texts), prompt, future))
+        self.stats["requests"] += 1
+        return await future
+
+    async def _collect(self) -> List[EncodeRequest]:
+        """Первый запрос ждется без срока, остальные — до max_delay или заполнения батча"""
+        batch = [self._carry] if self._carry is not None else [await self._queue.get()]
+        self._carry = None
+        size = len(batch[0].texts)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while size < self.max_batch_texts:
+            try:
+                request = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if size + len(request.texts) > self.max_batch_texts:
+                # Не делим запрос между батчами: он откроет следующий
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _encode_batch(self, batch: List[EncodeRequest]) -> List[np.ndarray]:
+        """Выполняется в потоке очереди: одна модель, один вызов на промпт, общие тексты — один раз"""
+        by_prompt: Dict[str, Dict[str, int]] = {}
+        for request in batch:
+            rows = by_prompt.setdefault(request.prompt, {})
+            for text in request.texts:
+                rows.setdefault(text, len(rows))
+        embeddings = {prompt: self.analyzer.encode_texts(list(rows), prompt)
+                      for prompt, rows in by_prompt.items()}
+        self.stats["encoded"] += sum(len(rows) for rows in by_prompt.values())
+        return [embeddings[request.prompt][[by_prompt[request.prompt][text] for text in request.texts]]
+                for request in batch]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            live = [request for request in batch if not request.future.done()]
+            if not live:
+                continue
+            self.stats["batches"] += 1
+            self.stats["texts"] += sum(len(request.texts) for request in live)
+            try:
+                results = await loop.run_in_executor(self._executor, self._encode_batch, live)
+            except Exception as e:
+                for request in live:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            for request, embeddings in zip(live, results):
+                if not request.future.done():
+                    request.future.set_result(embeddings)
+
+    # ---------- анализ поверх очереди ----------
+
+    async def _prepare(self, func: Callable[..., T], *args) -> T:
+        """Разбор и сборка результата — в пуле подготовки, не в event loop и не в потоке модели"""
+        return await asyncio.get_running_loop().run_in_executor(self._prepare_executor, func, *args)
+
+    def _prepare_sources(self, resume_input: Union[str, List[str]]) -> tuple:
+        fragments, candidate_total_months, is_interview = self.analyzer._prepare_candidate(
+            resume_input)
+        return self.analyzer._unique_texts(fragments), candidate_total_months, is_interview
+
+    def _finish_analysis(self, compiled: CompiledVacancy, active_weights: Dict, sources: List[str],
+                         source_embeddings: Optional[np.ndarray], candidate_total_months: int,
+                         is_interview: bool, return_features: bool) -> Dict:
+        analyzer = self.analyzer
+        requirement_texts = [item["text"] for item in compiled.items]
+        if source_embeddings is not None:
+            best_matches = analyzer._best_matches(
+                requirement_texts, compiled.requirement_texts, compiled.requirement_embeddings,
+                sources, source_embeddings)
+        else:
+            best_matches = [(0.0, None)] * len(requirement_texts)
+        return analyzer._build_result(compiled, active_weights, best_matches, candidate_total_months,
+                                      is_interview, return_features)
+
+    async def analyze(self, resume_input: Union[str, List[str]], vacancy: Union[Dict, CompiledVacancy],
+                      weights: Optional[Dict] = None, return_features: bool = False) -> Dict:
+        """Как InterviewAnalyzer.analyze, но кодирование идет через общую очередь"""
+        analyzer = self.analyzer
+        if analyzer.cascade_model is not None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, analyzer.analyze, resume_input, vacancy, weights, return_features)
+
+        if not isinstance(vacancy, CompiledVacancy):
+            vacancy = await self.compile_vacancy(vacancy)
+        compiled, active_weights = await self._prepare(analyzer._compiled, vacancy, weights)
+        sources, candidate_total_months, is_interview = await self._prepare(
+            self._prepare_sources, resume_input)
+        source_embeddings = await self.encode(sources, SOURCE_PROMPT) \
+            if sources and compiled.requirement_texts else None
+        return await self._prepare(self._finish_analysis, compiled, active_weights, sources, source_embeddings,
+                                   candidate_total_months, is_interview, return_features)
+
+    def _prepare_vacancy(self, vacancy: Union[Dict, str]) -> tuple:
+        if isinstance(vacancy, str):
+            vacancy = structure_vacancy_text(vacancy)
+        items = self.analyzer._vacancy_items(vacancy)
+        return vacancy, items, self.analyzer._unique_texts([item["text"] for item in items])
+
+    async def compile_vacancy(self, vacancy: Union[Dict, str], weights: Optional[Dict] = None) -> CompiledVacancy:
+        """
+        Как InterviewAnalyzer.compile_vacancy; текст вакансии разбирается structure_vacancy_text.
+        Требования кодируются через очередь.
+        """
+        vacancy, items, requirement_texts = await self._prepare(self._prepare_vacancy, vacancy)
+        embeddings = await self.encode(requirement_texts, REQUIREMENT_PROMPT)
+        return await self._prepare(self.analyzer._build_compiled_vacancy, vacancy, items, requirement_texts,
+                                   embeddings, weights)
+
+    async def analyze_text(self, vacancy: Union[str, CompiledVacancy], history_text: str) -> str:
+        """Асинхронный аналог LLMAnalyzer.analyze_text: JSON-строка с результатом или ошибкой"""
+        try:
+            interview_answers = json.loads(history_text)
+            if not isinstance(interview_answers, list):
+                raise ValueError("history_text должен быть списком строк")
+            if not isinstance(vacancy, CompiledVacancy):
+                vacancy = await self.compile_vacancy(vacancy)
+            result = await self.analyze(interview_answers, vacancy, return_features=True)
+            return await self._prepare(functools.partial(json.dumps, result, ensure_ascii=False, indent=2))
+        except Exception as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False, indent=2)
+
+
+_default_queue: Optional[EncodeQueue] = None
+_default_queue_lock = threading.Lock()
+
+
+def default_encode_queue() -> EncodeQueue:
+    """
+    Общая на процесс очередь поверх анализатора по умолчанию. Первый вызов загружает модель:
+    сервис создает очередь при старте после прогрева (main.lifespan), сессии — в пуле потоков.
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = EncodeQueue()
+    return _default_queue
@@ -0,0 +1,135 @@
+# interview_scorer.py
+# Инкрементальная оценка интервью по ходу диалога: каждый ответ кандидата кодируется
+# сразу после реплики, а лучшие оценки, фрагменты и глубина по требованиям обновляются
+# на лету. После завершения звонка отчет собирается из готового состояния без кодирования.
+
+import asyncio
+import json
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from analyzer import CompiledVacancy, InterviewAnalyzer, SOURCE_PROMPT, structure_vacancy_text
+from inference_queue import EncodeQueue
+
+
+class IncrementalInterviewScorer:
+    """
+    Состояние оценки одного интервью. finalize() возвращает то же, что
+    InterviewAnalyzer.analyze(ответы, вакансия, return_features=True) на тех же ответах:
+    ответы обрабатываются в порядке поступления, повторы не кодируются, а лучшая оценка
+    обновляется только строгим улучшением — как argmax по всем ответам сразу.
+    vacancy — скомпилированная вакансия, dict или текст (компилируется при первом ответе).
+    encode_queue — общая очередь кодирования для асинхронного add_answer_async.
+    Каскад (cascade_model) здесь не используется: ответы оцениваются большой моделью.
+    """
+
+    def __init__(self, vacancy: Union[CompiledVacancy, Dict, str], analyzer: Optional[InterviewAnalyzer] = None,
+                 weights: Optional[Dict] = None, encode_queue: Optional[EncodeQueue] = None):
+        self.encode_queue = encode_queue
+        self.analyzer = analyzer or (
+            encode_queue.analyzer if encode_queue is not None else InterviewAnalyzer())
+        self.weights = weights
+        self.answers: List[str] = []
+        self._vacancy = structure_vacancy_text(
+            vacancy) if isinstance(vacancy, str) else vacancy
+        self._compiled: Optional[CompiledVacancy] = None
+        self._active_weights: Optional[Dict] = None
+        self._seen = set()
+        self._best_scores: Optional[np.ndarray] = None
+        self._best_sources: List[Optional[str]] = []
+        self._depths: Dict[str, Dict] = {}
+        self._lock = asyncio.Lock()
+
+    # ---------- подготовка ----------
+
+    def _start(self, compiled: CompiledVacancy) -> None:
+        self._compiled, self._active_weights = self.analyzer._compiled(
+            compiled, self.weights)
+        self._best_scores = np.zeros(
+            len(self._compiled.requirement_texts), dtype=np.float64)
+        self._best_sources = [None] * len(self._compiled.requirement_texts)
+
+    def _ensure_compiled(self) -> None:
+        if self._compiled is None:
+            vacancy = self._vacancy
+            if not isinstance(vacancy, CompiledVacancy):
+                vacancy = self.analyzer.compile_vacancy(vacancy, self.weights)
+            self._start(vacancy)
+
+    async def _ensure_compiled_async(self) -> None:
+        if self._compiled is None:
+            vacancy = self._vacancy
+            if not isinstance(vacancy, CompiledVacancy):
+                vacancy = await self.encode_queue.compile_vacancy(vacancy, self.weights)
+            self._start(vacancy)
+
+    # ---------- поступление ответов ----------
+
+    def _accept(self, answer: str) -> Optional[str]:
+        """Запоминает ответ; возвращает текст, если его нужно кодировать"""
+        if not isinstance(answer, str) or not answer.strip():
+            return None
+        answer = answer.strip()
+        self.answers.append(answer)
+        if answer in self._seen:
+            return None
+        self._seen.add(answer)
+        return answer
+
+    def _update(self, answer: str, embedding: np.ndarray) -> None:
+        self.analyzer._update_best(self._compiled.requirement_embeddings, [answer], embedding,
+                                   self._best_scores, self._best_sources)
+        # Глубина считается один раз, когда ответ впервые стал лучшим хотя бы для одного требования
+        if answer not in self._depths and answer in self._best_sources:
+            self._depths[answer] = self.analyzer.evaluate_answer_depth(answer)
+
+    def add_answer(self, answer: str) -> None:
+        """Синхронно кодирует ответ и обновляет лучшие совпадения"""
+        self._ensure_compiled()
+        answer = self._accept(answer)
+        if answer is not None and len(self._compiled.requirement_texts):
+            self._update(answer, self.analyzer.encode_texts(
+                [answer], SOURCE_PROMPT))
+
+    async def add_answer_async(self, answer: str) -> None:
+        """
+        То же через общую очередь кодирования. Вызовы одного интервью выполняются
+        по очереди (в порядке вызова), поэтому равные оценки разрешаются как в analyze.
+        """
+        if self.encode_queue is None:
+            raise RuntimeError("Для add_answer_async нужна encode_queue")
+        async with self._lock:
+            await self._ensure_compiled_async()
+            answer = self._accept(answer)
+            if answer is not None and len(self._compiled.requirement_texts):
+                self._update(answer, await self.encode_queue.encode([answer], SOURCE_PROMPT))
+
+    # ---------- результат ----------
+
+    def snapshot(self) -> List[Dict]:
+        """Текущее состояние по уникальным требованиям: лучшая оценка, ответ и глубина"""
+        if self._compiled is None:
+            return []
+        return [{"item": text, "similarity_score": round(float(score), 3),
+                 "source": source, "depth_analysis": self._depths.get(source)}
+                for text, score, source in zip(self._compiled.requirement_texts, self._best_scores,
+                                               self._best_sources)]
+
+    def finalize(self, return_features: bool = True) -> Dict:
+        """Итоговый отчет как у analyze: кодирования нет, глубина ответов уже посчитана"""
+        self._ensure_compiled()
+        requirement_texts = [item["text"] for item in self._compiled.items]
+        best_matches = self.analyzer._collect_matches(requirement_texts, self._compiled.requirement_texts,
+                                                      self._best_scores, self._best_sources)
+        candidate_total_months = self.analyzer.extract_experience_from_text(
+            self.answers)
+        return self.analyzer._build_result(self._compiled, self._active_weights, best_matches,
+                                           candidate_total_months, True, return_features, self._depths)
+
+    def finalize_text(self) -> str:
+        """Отчет в формате LLMAnalyzer.analyze_text (JSON-строка)"""
+        try:
+            return json.dumps(self.finalize(), ensure_ascii=False, indent=2)
+        except Exception as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False, indent=2)
@@ -1,6 +1,7 @@
 # This file contains the WebSocket endpoint for AI-HR interviewer.
 # It accepts WebSocket connections with interview_uuid and fetches interview data from external service.
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
@@ -11,13 +12,41 @@ from pipeline import ConferencePipeline
 import logging
 import json
 import httpx
-from analyzer import clean_and_format_dict, extract_text_as_single_line, parse_text_to_dict, parse_vacancy_from_json
+from analyzer import model_registry
+from dialog_voice import default_async_speech_client
+from execution import default_stage_executor
+from extraction_pool import ExtractionError, default_extraction_pool, extract_text_async
+from inference_queue import default_encode_queue
 import uvicorn
 
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+async def warmup_models():
+    """Load the sentence encoder in background so the service accepts probes while it loads"""
+    try:
+        await asyncio.to_thread(model_registry.warmup)
+        # The shared encode queue builds its analyzer on first use; create it here, off the event loop
+        await asyncio.to_thread(default_encode_queue)
+        logger.info(f"Models ready: {model_registry.status()['ready']}")
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(warmup_models())
+    # Document parsing runs in worker processes so a bad file cannot block the event loop
+    extraction_pool = await asyncio.to_thread(default_extraction_pool().start)
+    yield
+    warmup_task.cancel()
+    await asyncio.to_thread(extraction_pool.close)
+    default_stage_executor().close()
+    await default_async_speech_client().aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class InterviewRequest(BaseModel):
@@ -73,11 +102,14 @@ async def extract_files_from_minio(vacancy_bucket: str, vacancy_filename: str,
         vacancy_path = f"resources/vacancies/{vacancy_filename}"
         resume_path = f"resources/resumes/{resume_filename}"
 
-        # Download vacancy file directly to local storage
-        client.fget_object(vacancy_bucket, vacancy_filename, vacancy_path)
-
-        # Download resume file directly to local storage
-        client.fget_object(resume_bucket, resume_filename, resume_path)
+        # Download both files directly to local storage in the I/O thread pool
+        executor = default_stage_executor()
+        await asyncio.gather(
+            executor.run("storage", client.fget_object,
+                         vacancy_bucket, vacancy_filename, vacancy_path),
+            executor.run("storage", client.fget_object,
+                         resume_bucket, resume_filename, resume_path)
+        )
 
         logger.info(f"Downloaded vacancy file to: {vacancy_path}")
         logger.info(f"Downloaded resume file to: {resume_path}")
@@ -89,6 +121,15 @@ async def extract_files_from_minio(vacancy_bucket: str, vacancy_filename: str,
             status_code=500, detail=f"Error extracting files from MinIO: {e}")
 
 
+@app.get("/ready")
+async def readiness_probe():
+    """Readiness probe: 200 once the analyzer model is loaded and warmed up"""
+    status = model_registry.status()
+    if not model_registry.is_ready():
+        return JSONResponse(status_code=503, content={"ready": False, **status})
+    return {"ready": True, **status}
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     try:
@@ -109,30 +150,43 @@ async def websocket_endpoint(websocket: WebSocket):
             interview_request.resume_filename
         )
 
-        # Extract vacancy text using analyzer function
-        vacancy_text = extract_text_as_single_line(vacancy_path)
-        vacancy_structured = parse_vacancy_from_json(
-            clean_and_format_dict(
-                parse_text_to_dict(vacancy_text)
+        # Extract document texts in the extraction worker pool
+        try:
+            vacancy_text, resume_text = await asyncio.gather(
+                extract_text_async(vacancy_path),
+                extract_text_async(resume_path)
             )
-        )
-        resume_text = extract_text_as_single_line(resume_path)
-
-        # Create pipeline with vacancy text
+        except ExtractionError as extraction_err:
+            logger.error(f"Document extraction failed: {extraction_err.to_dict()}")
+            await websocket.close(code=1011, reason=extraction_err.kind)
+            return
+        # Parse, categorize and embed the vacancy once per session;
+        # the embeddings are computed on the shared encode queue thread.
+        # The queue is fetched in the thread pool: until warm-up finishes it waits for the model
+        executor = default_stage_executor()
+        encode_queue = await executor.run("setup", default_encode_queue)
+        async with executor.limit("analysis"):
+            compiled_vacancy = await encode_queue.compile_vacancy(vacancy_text)
+
+        # Create pipeline with vacancy text; API clients are set up off the event loop
         logger.info(
             f"Starting AI HR pipeline for candidate {interview_request.first_name} {interview_request.last_name}")
-        pipeline = ConferencePipeline(vacancy_text=vacancy_text)
+        pipeline = await executor.run(
+            "setup", ConferencePipeline, vacancy_text, compiled_vacancy)
 
-        # Run the blocking WebSocket pipeline
+        # Run the WebSocket pipeline
         await pipeline.process_websocket(websocket)
 
-        # Analyze and store results when socket flow ends
-        history_text = pipeline._format_dialog_history()
+        # The pipeline scores answers during the interview and finalizes the
+        # report at hang-up; re-run the analysis only if it produced none
+        analysis_result = pipeline.review_result
         try:
-            analysis_result = pipeline.review.analyze_text(
-                vacancy_text,
-                history_text
-            )
+            if analysis_result is None:
+                async with executor.limit("analysis"):
+                    analysis_result = await encode_queue.analyze_text(
+                        compiled_vacancy,
+                        pipeline._format_dialog_history()
+                    )
         except Exception as analyze_err:
             logger.error(f"Error during analysis: {analyze_err}")
             raise HTTPException(
@@ -1,13 +1,15 @@
-
 import asyncio
 import json
 import time
 from typing import Optional
 from dialog_voice import SberSpeechAPI
+from audio_stream import END_OF_TURN, UTTERANCE, PCMResampler, SpeechEndpointer
 from dialog_giigachat import HRAssistant, GigaChatModel
-from analyzer import LLMAnalyzer
+from analyzer import LLMAnalyzer, CompiledVacancy
+from inference_queue import default_encode_queue
+from execution import default_stage_executor
+from interview_scorer import IncrementalInterviewScorer
 import os
-from io import StringIO
 from pydub import AudioSegment
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
@@ -22,8 +24,6 @@ import asyncio
 from fastapi import FastAPI, WebSocket
 from typing import Optional
 import os
-from io import StringIO, BytesIO
-import wave
 import struct
 from dotenv import load_dotenv
 
@@ -58,7 +58,11 @@ if not api_key or not api_key_salute or not user_id:
 
 
 class ConferencePipeline:
-    def __init__(self, vacancy_text: str | None = None):
+    def __init__(self, vacancy_text: str | None = None, compiled_vacancy: CompiledVacancy | None = None):
+        self.vacancy_text = vacancy_text
+        # Скомпилированная вакансия избавляет анализ от повторного разбора и кодирования
+        self.compiled_vacancy = compiled_vacancy
+
         # Инициализация модулей
         self.dialog_voice = SberSpeechAPI(
             api_key_salute,
@@ -77,25 +81,28 @@ class ConferencePipeline:
             db_api_url=os.getenv("REVIEW_DB_URL")
         )
 
-        self.is_processing = False
-        self.audio_buffer = StringIO()
-        self.empty_count = 0
-
-    def raw_audio_to_webm(self, raw_audio_data: bytes) -> bytes:
-        """Конвертация сырых аудиоданных в WebM формат"""
-        wav_buffer = BytesIO()
-        sample_rate = 44100
-        channels = 1
-        sample_width = 2
-
-        with wave.open(wav_buffer, 'wb') as wav_file:
-            wav_file.setnchannels(channels)
-            wav_file.setsampwidth(sample_width)
-            wav_file.setframerate(sample_rate)
-            wav_file.writeframes(raw_audio_data)
-        wav_buffer.seek(0)
-        wav_data = wav_buffer.read()
-        return wav_data
+        # Конструктор выполняется в пуле потоков (см. main.py), поэтому очередь можно получить здесь:
+        # если модель еще грузится, ждет поток, а не event loop
+        self.encode_queue = default_encode_queue()
+        # Ответы оцениваются по мере поступления; к концу звонка отчет почти готов
+        self.scorer = IncrementalInterviewScorer(
+            compiled_vacancy or vacancy_text, encode_queue=self.encode_queue) \
+            if compiled_vacancy is not None or vacancy_text else None
+        self._scoring_tasks = []
+        self.review_result: Optional[str] = None
+        # Блокирующие вызовы диалога выполняются вне event loop, у всех стадий свои лимиты
+        self.executor = default_stage_executor()
+
+        # Сырой PCM 44.1 кГц передискретизируется в 16 кГц в процессе, без ffmpeg на фрагмент
+        self.resampler = PCMResampler()
+        # Тишина не уходит в ASR: распознаются целые фразы, конец реплики — по длительности тишины
+        self.endpointer = SpeechEndpointer(
+            utterance_silence_ms=int(os.getenv("VAD_UTTERANCE_SILENCE_MS", 400)),
+            turn_silence_ms=int(os.getenv("VAD_TURN_SILENCE_MS", 800)),
+            spectral=os.getenv("VAD_SPECTRAL", "0") == "1"
+        )
+        # Распознавание фраз текущей реплики, в порядке речи
+        self._utterance_tasks = []
 
     async def process_websocket(self, websocket: WebSocket):
         """Обработка WebSocket соединения"""
@@ -103,78 +110,31 @@ class ConferencePipeline:
 
         # 0. Воспроизведение приветственного сообщения
         welcome_text = "Здравствуйте, я ассистент ВТБ. Давайте начнем собеседование."
-        welcome_audio = self.dialog_voice.tts(welcome_text)
+        async with self.executor.limit("tts"):
+            welcome_audio = await self.dialog_voice.atts(welcome_text)
         await websocket.send_bytes(welcome_audio)
 
-        while True:
+        conference_active = True
+        while conference_active:
             try:
                 # 1. Получение сырых аудиоданных от конференции
                 raw_audio_data = await websocket.receive_bytes()
 
-                # Конвертация в WebM
-                webm_data = self.raw_audio_to_webm(raw_audio_data)
-
-                if not self.is_processing:
-                    # 2. Распознавание речи
-                    asr_result = self.dialog_voice.asr(webm_data)
-                    print(
-                        f"Тип asr_result: {type(asr_result)}, Значение: '{asr_result}'")
-
-                    asr_text = ""
-                    if isinstance(asr_result, list) and len(asr_result) > 0:
-                        asr_text = str(
-                            asr_result[0]) if asr_result[0] is not None else ""
-                    elif isinstance(asr_result, dict):
-                        asr_text = str(asr_result.get('result', ''))
-                    elif asr_result is not None:
-                        asr_text = str(asr_result)
-
-                    print(
-                        f"Извлеченный asr_text: Тип {type(asr_text)}, Значение: '{asr_text}'")
-
-                    if not asr_text or not isinstance(asr_text, str) or not asr_text.strip():
-                        self.empty_count += 1
-                        print(
-                            f"Пустой текст, увеличиваем empty_count: {self.empty_count}")
-                    else:
-                        self.empty_count = 0
-                        self.audio_buffer.write(asr_text + " ")
-                        print(
-                            f"Добавлен текст в буфер: '{asr_text}', buffer_size: {self.audio_buffer.tell()}")
-
-                    print(
-                        f"empty_count: {self.empty_count}, buffer_size: {self.audio_buffer.tell()}")
-
-                    # 3. Запуск генерации после 3 пустых ответов
-                    if self.empty_count >= 3 and self.audio_buffer.tell() > 0:
-                        self.is_processing = True
-                        user_text = self.audio_buffer.getvalue().strip()
-                        self.audio_buffer = StringIO()
-                        print(f"Отправляем в Dialog: '{user_text}'")
-
-                        # 4. Генерация ответа
-                        response = self.dialog.send_message(user_text)
-                        print(f"Получен ответ от Dialog: '{response}'")
-
-                        if not self.dialog.is_dialog_active():
-                            # 5. Завершение конференции
-                            await websocket.send_json({"action": "end_conference"})
-                            await websocket.close()
+                # Передискретизация в формат распознавателя (PCM 16 кГц);
+                # состояние фильтра сохраняется между фрагментами
+                pcm_data = self.resampler.process(raw_audio_data)
+
+                for event, utterance in self.endpointer.push(pcm_data):
+                    if event == UTTERANCE:
+                        # 2. Распознавание законченной фразы, пока кандидат продолжает говорить
+                        self._utterance_tasks.append(
+                            asyncio.create_task(self._recognize(utterance)))
+                    elif event == END_OF_TURN:
+                        # 3. Кандидат замолчал на VAD_TURN_SILENCE_MS: реплика закончена
+                        conference_active = await self._answer_turn(websocket)
+                        if not conference_active:
                             break
 
-                        # 6. Преобразование текста в речь
-                        response_audio = self.dialog_voice.tts(response)
-                        await websocket.send_bytes(response_audio)
-
-                        with open("output.webm", "wb") as f:
-                            f.write(response_audio)
-
-                        # Сбрасываем счетчики после отправки ответа
-                        self.is_processing = False
-                        self.empty_count = 0
-                        print(
-                            f"Сбросили счетчики: empty_count={self.empty_count}, is_processing={self.is_processing}")
-
             except WebSocketDisconnect:
                 logger.info("WebSocket отключен клиентом")
                 break
@@ -182,13 +142,37 @@ class ConferencePipeline:
                 logger.error(f"Ошибка в процессе WebSocket: {e}")
                 break
 
+        if conference_active:
+            # Соединение закрыто посреди реплики: недоговоренная фраза тоже распознается и оценивается
+            for event, utterance in self.endpointer.flush():
+                if event == UTTERANCE:
+                    self._utterance_tasks.append(
+                        asyncio.create_task(self._recognize(utterance)))
+            last_text = await self._collect_utterances()
+            if last_text:
+                self.dialog.dialog_history.append(("Кандидат", last_text))
+                self._score_answer(last_text)
+        else:
+            for task in self._utterance_tasks:
+                task.cancel()
+
         # 6. Отправка истории в review (анализатор)
         history_text = self._format_dialog_history()
         print(f"История диалога: {history_text}")
 
         if history_text.strip():
             try:
-                review_result = self.review.analyze_text(self.vacancy_text, history_text)
+                if self.scorer is not None:
+                    # Ответы уже закодированы по ходу интервью: остается собрать отчет
+                    await asyncio.gather(*self._scoring_tasks)
+                    review_result = await self.executor.run("analysis", self.scorer.finalize_text)
+                else:
+                    # Кодирование идет через общую очередь: одновременно закончившиеся
+                    # интервью делят батчи модели, а event loop не блокируется
+                    async with self.executor.limit("analysis"):
+                        review_result = await self.encode_queue.analyze_text(
+                            self.compiled_vacancy or self.vacancy_text, history_text)
+                self.review_result = review_result
                 print(f"Результат анализа: {review_result}")
                 # 7. Сохранение в БД (заглушка)
                 self._save_to_db(review_result)
@@ -199,11 +183,71 @@ class ConferencePipeline:
         else:
             print("История диалога пуста — анализ не выполняется.")
 
+    async def _recognize(self, utterance: bytes) -> str:
+        """Распознавание одной фразы (PCM 16 кГц), возвращает текст"""
+        async with self.executor.limit("asr"):
+            asr_result = await self.dialog_voice.arecognize(utterance)
+        print(
+            f"Тип asr_result: {type(asr_result)}, Значение: '{asr_result}'")
+
+        asr_text = ""
+        if isinstance(asr_result, list) and len(asr_result) > 0:
+            asr_text = str(
+                asr_result[0]) if asr_result[0] is not None else ""
+        elif isinstance(asr_result, dict):
+            asr_text = str(asr_result.get('result', ''))
+        elif asr_result is not None:
+            asr_text = str(asr_result)
+        return asr_text.strip()
+
+    async def _collect_utterances(self) -> str:
+        """Текст реплики из распознанных фраз; фразы с ошибкой распознавания пропускаются"""
+        results = await asyncio.gather(*self._utterance_tasks, return_exceptions=True)
+        self._utterance_tasks = []
+        texts = []
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка распознавания фразы: {result!r}")
+            elif result:
+                texts.append(result)
+        return " ".join(texts)
+
+    def _score_answer(self, user_text: str) -> None:
+        if self.scorer is not None:
+            self._scoring_tasks.append(asyncio.create_task(
+                self.scorer.add_answer_async(user_text)))
+
+    async def _answer_turn(self, websocket: WebSocket) -> bool:
+        """Ответ на законченную реплику кандидата; False — диалог завершен"""
+        user_text = await self._collect_utterances()
+        if not user_text:
+            print("Реплика не распознана — ответ не формируется")
+            return True
+        print(f"Отправляем в Dialog: '{user_text}'")
+        self._score_answer(user_text)
+
+        # 4. Генерация ответа
+        response = await self.executor.run("dialog", self.dialog.send_message, user_text)
+        print(f"Получен ответ от Dialog: '{response}'")
+
+        if not self.dialog.is_dialog_active():
+            # 5. Завершение конференции
+            await websocket.send_json({"action": "end_conference"})
+            await websocket.close()
+            return False
+
+        # 6. Преобразование текста в речь
+        async with self.executor.limit("tts"):
+            response_audio = await self.dialog_voice.atts(response)
+        await websocket.send_bytes(response_audio)
+        return True
+
     def _format_dialog_history(self) -> str:
         """Форматирование истории диалога: только ответы кандидата (клиента)"""
+        # HRAssistant записывает реплики кандидата с ролью "Кандидат"
         user_messages = [
             message for role, message in self.dialog.dialog_history
-            if role == "client" and isinstance(message, str) and message.strip()
+            if role in ("client", "Кандидат") and isinstance(message, str) and message.strip()
         ]
 
         # Оставляем только непустые строки
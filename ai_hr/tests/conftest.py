@@ -0,0 +1,59 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Модули сервиса импортируются по имени (как в main.py), поэтому ai_hr — в sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubEncoder:
+    """Детерминированная замена SentenceTransformer: хэши символьных триграмм в dim измерениях"""
+
+    max_seq_length = 128
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.encoded = 0
+
+    def tokenizer(self, texts, max_length=128, **kwargs):
+        return {"input_ids": [[0] * min(max_length, 2 * len(text.split()) + 2) for text in texts]}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.encoded += len(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = text.lower()
+            for i in range(len(text) - 2):
+                digest = hashlib.md5(text[i:i + 3].encode("utf-8")).digest()
+                vectors[row, int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture
+def stub_encoders(monkeypatch):
+    """
+    Реестр моделей анализатора с заглушками вместо загрузки весов: имя модели -> StubEncoder.
+    Размерность зависит от имени, как у настоящих моделей (у малой модели каскада она меньше).
+    """
+    analyzer = pytest.importorskip("analyzer")
+    encoders = {}
+
+    def load_encoder(model_name, device, backend):
+        dim = 8 if "tiny" in model_name else 32
+        return encoders.setdefault(model_name, StubEncoder(dim))
+
+    monkeypatch.setattr(analyzer, "load_encoder", load_encoder)
+    monkeypatch.setattr(analyzer, "model_registry", analyzer.ModelRegistry())
+    monkeypatch.delenv("EMBEDDING_CACHE_DIR", raising=False)
+    monkeypatch.delenv("ENCODER_CASCADE_MODEL", raising=False)
+    return encoders
@@ -0,0 +1,71 @@
+import json
+import os
+
+from embedding_cache import EmbeddingCache
+
+VACANCY = {
+    "requirements": ["Опыт администрирования Linux серверов", "Знание Python и SQL",
+                     "Настройка сетевого оборудования Cisco"],
+    "responsibilities": ["Монтаж серверов в ЦОД", "Диагностика инцидентов"],
+    "experience_years": "от 3 лет",
+}
+RESUME = ("Опыт работы 5 лет. Администрировал Linux серверы, писал скрипты на Python, "
+          "настраивал коммутаторы Cisco, проводил монтаж оборудования в дата-центре.")
+
+
+def test_cascade_with_disk_cache_keeps_models_apart(stub_encoders, tmp_path):
+    from analyzer import InterviewAnalyzer
+
+    def analyzer(cache):
+        return InterviewAnalyzer(embedding_cache=cache, cascade_model_name="cointegrated/rubert-tiny2",
+                                 cascade_band=1.0)
+
+    first = analyzer(EmbeddingCache(str(tmp_path))).analyze(RESUME, VACANCY)
+    assert first["cascade"]["borderline_requirements"] > 0
+    dims = []
+    for name in os.listdir(tmp_path):
+        with open(os.path.join(tmp_path, name, "meta.json")) as f:
+            dims.append(json.load(f)["dim"])
+    assert sorted(dims) == [8, 32]
+
+    # Новый процесс с тем же каталогом: все векторы обеих моделей берутся с диска
+    encoded = {name: encoder.encoded for name, encoder in stub_encoders.items()}
+    cache = EmbeddingCache(str(tmp_path))
+    second = analyzer(cache).analyze(RESUME, VACANCY)
+    assert {name: encoder.encoded for name, encoder in stub_encoders.items()} == encoded
+    assert cache.stats()["misses"] == 0
+    # На диске векторы в fp16: оценки совпадают с точностью до округления
+    for before, after in zip(first["matched_items"], second["matched_items"]):
+        assert (after["item"], after["source"], after["found"]) == (before["item"], before["source"], before["found"])
+        assert abs(after["similarity_score"] - before["similarity_score"]) <= 0.005
+
+
+def test_rank_resumes_matches_analyze_with_cascade(stub_encoders):
+    from analyzer import InterviewAnalyzer
+
+    analyzer = InterviewAnalyzer(cascade_model_name="cointegrated/rubert-tiny2", cascade_band=1.0)
+    compiled = analyzer.compile_vacancy(VACANCY)
+    resumes = {"full": RESUME, "python": "Пишу на Python и SQL три года.", "empty": ""}
+    for result in analyzer.rank_resumes(compiled, resumes, group_size=2):
+        expected = analyzer.analyze(resumes[result.pop("candidate_id")], compiled)
+        # Время ступеней каскада отличается от запуска к запуску — сравниваются количества
+        counts = [{k: v for k, v in r.pop("cascade").items() if not k.endswith("_seconds")}
+                  for r in (result, expected)]
+        assert counts[0] == counts[1]
+        assert result == expected
+
+
+def test_iter_rank_resumes_yields_before_reading_next_group(stub_encoders):
+    from analyzer import InterviewAnalyzer
+
+    analyzer = InterviewAnalyzer()
+    events = []
+
+    def resumes():
+        for i in range(3):
+            events.append(("read", i))
+            yield RESUME
+
+    for result in analyzer.iter_rank_resumes(VACANCY, resumes(), group_size=1):
+        events.append(("ranked", result["candidate_id"]))
+    assert events == [("read", 0), ("ranked", 0), ("read", 1), ("ranked", 1), ("read", 2), ("ranked", 2)]
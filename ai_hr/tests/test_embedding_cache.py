@@ -0,0 +1,38 @@
+import numpy as np
+
+from embedding_cache import DiskEmbeddingStore, EmbeddingCache, make_cache_key
+
+
+def _keys(count, start=0):
+    return [make_cache_key("model", "", f"text {i}") for i in range(start, start + count)]
+
+
+def test_reader_survives_compaction_between_refresh_and_read(tmp_path, monkeypatch):
+    writer = DiskEmbeddingStore(str(tmp_path), max_bytes=10 ** 6)
+    reader = DiskEmbeddingStore(str(tmp_path), max_bytes=10 ** 6)
+    keys = _keys(4)
+    vectors = np.eye(4, 8, dtype=np.float32)
+    writer.put_many(keys, vectors)
+
+    refresh = reader._refresh
+    compacted = []
+
+    def refresh_then_compact():
+        refresh()
+        if not compacted:
+            # Уплотнение в другом процессе сразу после того, как читатель прочитал CURRENT
+            compacted.append(True)
+            writer._compact_locked()
+
+    monkeypatch.setattr(reader, "_refresh", refresh_then_compact)
+    found = reader.get_many(keys)
+    assert writer._read_generation() == 1
+    assert all(vector is not None for vector in found)
+    np.testing.assert_allclose(np.stack(found), vectors)
+
+
+def test_memory_tier_does_not_keep_batch_alive():
+    cache = EmbeddingCache(max_memory_bytes=10 ** 6)
+    batch = np.ones((100, 8), dtype=np.float32)
+    cache.put_many(_keys(1), batch[:1])
+    assert cache.get_many(_keys(1))[0].base is None
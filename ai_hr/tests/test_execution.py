@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+import pytest
+
+from execution import StageExecutor
+
+VACANCY_TEXT = ("Требования: Опыт администрирования Linux серверов; Знание Python и SQL; "
+                "Настройка сетевого оборудования Cisco. Обязанности: Монтаж серверов в ЦОД")
+ANSWERS = ["Настраивал серверы Linux на проекте в компании",
+           "Использовал Python и SQL, сократил время отчетов",
+           "Монтаж стоек и коммутаторов Cisco в дата-центре"]
+UTTERANCES = 20
+
+
+class StubSpeech:
+    """Распознавание без сети: отдает управление event loop, как HTTP-запрос"""
+
+    def __init__(self, session: str, events: list):
+        self.session = session
+        self.events = events
+
+    async def arecognize(self, audio, content_type=None):
+        await asyncio.sleep(0)
+        self.events.append(("asr", self.session))
+        return {"result": [f"{self.session}: {len(audio)} байт"]}
+
+
+class StubDialog:
+    def __init__(self, *args, **kwargs):
+        self.dialog_history = []
+
+
+@pytest.fixture
+def pipeline_module(stub_encoders, monkeypatch):
+    monkeypatch.setenv("API_KEY", "test")
+    monkeypatch.setenv("API_KEY_SALUTE", "test")
+    monkeypatch.setenv("USER_ID", "test")
+    pipeline = pytest.importorskip("pipeline")
+    from inference_queue import EncodeQueue
+
+    executor = StageExecutor(io_threads=4, limits={"asr": 2, "analysis": 1, "setup": 4})
+    encode_queue = EncodeQueue()
+    monkeypatch.setattr(pipeline, "default_stage_executor", lambda: executor)
+    monkeypatch.setattr(pipeline, "default_encode_queue", lambda: encode_queue)
+    monkeypatch.setattr(pipeline, "SberSpeechAPI", lambda *args: None)
+    monkeypatch.setattr(pipeline, "HRAssistant", StubDialog)
+    monkeypatch.setattr(pipeline, "LLMAnalyzer", lambda *args, **kwargs: None)
+    yield pipeline, executor
+    executor.close()
+
+
+def test_recognition_keeps_streaming_while_another_session_is_analyzed(pipeline_module):
+    pipeline, executor = pipeline_module
+    events = []
+    streams_done = threading.Event()
+
+    def session(name):
+        conference = pipeline.ConferencePipeline(VACANCY_TEXT)
+        conference.dialog_voice = StubSpeech(name, events)
+        return conference
+
+    analyzed = session("analyzed")
+    for answer in ANSWERS:
+        analyzed.scorer.add_answer(answer)
+    report = analyzed.scorer.finalize()
+
+    def finalize_until_streams_done():
+        # Сборка отчета, занимающая CPU (и GIL), пока идут две другие сессии. Если бы она
+        # блокировала event loop, распознавание не продвинулось бы и лимит был бы исчерпан
+        events.append(("analysis", "start"))
+        rounds = 0
+        while not streams_done.is_set() and rounds < 20000:
+            result = analyzed.scorer.finalize()
+            rounds += 1
+        events.append(("analysis", "end"))
+        return result, rounds
+
+    async def stream(conference):
+        for i in range(UTTERANCES):
+            await conference._recognize(b"\0\0" * (160 * (i + 1)))
+
+    async def main():
+        analysis = asyncio.ensure_future(
+            executor.run("analysis", finalize_until_streams_done))
+        while ("analysis", "start") not in events:
+            await asyncio.sleep(0)
+        await asyncio.gather(stream(session("a")), stream(session("b")))
+        events.append(("streams", "done"))
+        streams_done.set()
+        return await analysis
+
+    result, rounds = asyncio.run(main())
+
+    assert result == report
+    assert 0 < rounds < 20000
+    order = [kind for kind, _ in events]
+    assert order[0] == "analysis" and order[-1] == "analysis"
+    assert events[-2] == ("streams", "done")
+    recognized = [name for kind, name in events if kind == "asr"]
+    assert recognized.count("a") == recognized.count("b") == UTTERANCES
+    # Сессии распознаются вперемешку, а не одна после другой
+    assert recognized.index("b") < len(recognized) - recognized[::-1].index("a") - 1
+    assert executor.stats["asr"]["calls"] == 2 * UTTERANCES
+    assert executor.stats["analysis"] == {"calls": 1, "active": 0, "peak": 1}
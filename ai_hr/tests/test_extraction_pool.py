@@ -0,0 +1,24 @@
+import pytest
+
+from extraction_pool import ExtractionError, ExtractionPool
+
+RTF = rb"{\rtf1\ansi Python developer, 5 years of experience\par}"
+
+
+def test_workers_over_rss_threshold_are_recycled():
+    # Порог в 1 байт: каждый воркер завершается после первого же документа
+    with ExtractionPool(workers=2, recycle_rss_bytes=1, timeout=60) as pool:
+        texts = [pool.extract(RTF, ".rtf") for _ in range(6)]
+        assert all("Python developer" in text for text in texts)
+        assert pool.stats["ok"] == 6
+        assert pool.stats["errors"] == 0
+        assert pool.stats["recycled"] == 6
+
+
+def test_invalid_document_keeps_worker():
+    with ExtractionPool(workers=1, timeout=60) as pool:
+        with pytest.raises(ExtractionError) as error:
+            pool.extract(b"%PDF-1.4 broken", ".pdf")
+        assert error.value.kind == "invalid_document"
+        assert "Python developer" in pool.extract(RTF, ".rtf")
+        assert pool.stats == {"ok": 1, "errors": 1, "timeouts": 0, "memory_kills": 0, "recycled": 0}
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from dialog_voice import SpeechHTTPClient, TokenManager, request_salute_token
+
+LIFETIME = 1800
+
+
+@pytest.fixture
+def oauth_server():
+    """Локальная замена OAuth SaluteSpeech: считает запросы токена, срок жизни — по часам теста"""
+    requests_seen, now = [], [time.time()]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            requests_seen.append(self.headers["RqUID"])
+            time.sleep(0.05)
+            body = json.dumps({"access_token": f"token-{len(requests_seen)}",
+                               "expires_at": int((now[0] + LIFETIME) * 1000)}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.request_queue_size = 128
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/oauth", requests_seen, now
+    server.shutdown()
+    server.server_close()
+
+
+def test_sessions_share_one_token_request_per_expiry(oauth_server):
+    url, requests_seen, now = oauth_server
+    client = SpeechHTTPClient(retries=0)
+    manager = TokenManager(functools.partial(request_salute_token, "key", "user", url=url, client=client),
+                           clock=lambda: now[0])
+
+    def concurrent_sessions(count):
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(manager.get_token()))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+
+        async def async_sessions():
+            return await asyncio.gather(*(manager.get_token_async() for _ in range(count)))
+
+        tokens.extend(asyncio.run(async_sessions()))
+        for thread in threads:
+            thread.join()
+        return set(tokens)
+
+    # Холодный старт: 40 одновременных сессий, один запрос
+    assert concurrent_sessions(20) == {"token-1"}
+    assert len(requests_seen) == 1
+    for _ in range(100):
+        manager.get_token()
+    assert len(requests_seen) == 1
+
+    # Окно фонового обновления: вызовы не ждут, новый токен запрашивается один раз
+    now[0] += LIFETIME - 200
+    assert concurrent_sessions(20) == {"token-1"}
+    deadline = time.monotonic() + 5
+    while manager.get_token() == "token-1" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert manager.get_token() == "token-2"
+    assert len(requests_seen) == 2
+
+    # Токен истек: одновременные сессии ждут один и тот же запрос
+    now[0] += 2 * LIFETIME
+    assert concurrent_sessions(20) == {"token-3"}
+    assert len(requests_seen) == 3
+    assert manager.stats["fetches"] == 3
+    assert manager.stats["background_fetches"] == 1
+    client.close()
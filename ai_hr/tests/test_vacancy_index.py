@@ -0,0 +1,84 @@
+import pytest
+
+SKILLS = ["Опыт администрирования Linux серверов", "Знание Python и SQL", "Настройка сетевого оборудования Cisco",
+          "Опыт работы с Kubernetes и Docker", "Разработка REST API на FastAPI", "Знание PostgreSQL и Redis",
+          "Ведение технической документации", "Навыки общения с заказчиком"]
+DUTIES = ["Монтаж серверов в ЦОД", "Диагностика инцидентов", "Сопровождение CI/CD", "Код-ревью"]
+EXPERIENCE = ["от 1 года", "от 3 лет", "от 5 лет", ""]
+RESUME = ("Опыт работы 4 года. Администрировал Linux серверы и Docker, писал REST API на Python, "
+          "настраивал PostgreSQL, проводил код-ревью и диагностику инцидентов.")
+
+
+def vacancy(i):
+    return {
+        "requirements": [SKILLS[(i + k) % len(SKILLS)] for k in range(1 + i % 3)],
+        "responsibilities": [DUTIES[(i * 3 + k) % len(DUTIES)] for k in range(i % 2 + 1)],
+        "experience_years": EXPERIENCE[i % len(EXPERIENCE)],
+    }
+
+
+@pytest.fixture
+def analyzer(stub_encoders):
+    from analyzer import InterviewAnalyzer
+
+    return InterviewAnalyzer()
+
+
+def build(analyzer, count=16, **kwargs):
+    from vacancy_index import VacancyIndex
+
+    index = VacancyIndex(analyzer, **kwargs)
+    for i in range(count):
+        index.add(f"v{i}", vacancy(i))
+    return index
+
+
+def test_add_and_remove(analyzer):
+    index = build(analyzer, 4)
+    assert len(index) == 4 and "v2" in index
+
+    assert index.remove("v2")
+    assert not index.remove("v2")
+    assert "v2" not in index
+    ids = [r["vacancy_id"] for r in index.match_resume_to_vacancies(RESUME, top_k=10)]
+    assert sorted(ids) == ["v0", "v1", "v3"]
+
+    # Освободившиеся строки занимает следующая вакансия, замена не дублирует вакансию
+    size = index._size
+    index.add("v4", vacancy(2))
+    index.add("v4", vacancy(1))
+    assert index._size == size and len(index) == 4
+    by_id = {r["vacancy_id"]: r for r in index.match_resume_to_vacancies(RESUME, top_k=10)}
+    assert by_id["v4"]["matched_items"] == by_id["v1"]["matched_items"]
+
+
+def test_top_k_matches_analyze(analyzer, monkeypatch):
+    index = build(analyzer)
+    weights = {"technical_skills": 0.6, "experience_years_match": 0.4}
+    for kwargs in ({}, {"weights": weights}):
+        expected = []
+        for i in range(16):
+            result = analyzer.analyze(RESUME, vacancy(i), **kwargs)
+            expected.append({"vacancy_id": f"v{i}", **result})
+        expected.sort(key=lambda r: r["total_match_percent"], reverse=True)
+
+        results = index.match_resume_to_vacancies(RESUME, top_k=5, **kwargs)
+        assert [r["vacancy_id"] for r in results] == [r["vacancy_id"] for r in expected[:5]]
+        assert [r["total_match_percent"] for r in results] == [r["total_match_percent"] for r in expected[:5]]
+    assert index.match_resume_to_vacancies(RESUME, top_k=0) == []
+
+    # Отчеты собираются только для отобранных вакансий, а не для всего корпуса
+    built = []
+    build_result = analyzer._build_result
+    monkeypatch.setattr(analyzer, "_build_result", lambda *args: built.append(1) or build_result(*args))
+    index.match_resume_to_vacancies(RESUME, top_k=3)
+    assert len(built) < len(index)
+
+
+def test_ivf_agrees_with_flat(analyzer):
+    flat = build(analyzer).match_resume_to_vacancies(RESUME, top_k=5)
+    # Все кластеры просмотрены, либо переранжирование покрывает весь корпус
+    for kwargs in ({"nlist": 4, "nprobe": 4}, {"nlist": 4, "nprobe": 1, "rerank_factor": 4}):
+        index = build(analyzer, **kwargs)
+        assert index.match_resume_to_vacancies(RESUME, top_k=5) == flat
+        assert index._centroids is not None
@@ -0,0 +1,270 @@
+# text_extraction.py
+# Извлечение и нормализация текста из .docx, .pdf, .rtf.
+# Модуль не зависит от torch/sentence_transformers, поэтому его можно
+# импортировать в процессах-воркерах извлечения (см. extraction_pool.py).
+
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Union
+
+from docx import Document
+from lxml import etree
+from pypdf import PdfReader
+from striprtf.striprtf import rtf_to_text
+
+DocumentSource = Union[str, os.PathLike, bytes, bytearray, BinaryIO]
+
+# Непозиционируемые потоки (ответ MinIO/HTTP) буферизуются: в памяти до этого
+# размера, дальше во временном файле. PdfReader читает xref с конца файла
+SPOOL_MEMORY_BYTES = 8 * 1024 ** 2
+
+# Управляющие символы удаляются (\t, \n, \r, \v, \f сюда не входят)
+CONTROL_CHARS_PATTERN = re.compile(r'[\x00-\x08\x0e-\x1f\x7f-\x9f]')
+# Непробельные символы, которые заменяются пробелом: нулевой ширины, bidi-метки,
+# маркеры списков и дефисы (\uf0b7 — маркер шрифта Symbol, частый в PDF из Word).
+# Пробельные символы (\s, включая неразрывные) схлопывает str.split()
+SPACE_MARKS_PATTERN = re.compile(
+    r'[\u200b-\u200f\u202a-\u202e\u2060•▪▶➢\uf0b7*‣⁃\-]')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Очищает извлеченный текст: удаляет управляющие символы, заменяет маркеры пробелом
+    и схлопывает все пробельные символы за один str.split() без промежуточных re.sub.
+    Результат совпадает с прежней цепочкой из семи re.sub.
+    """
+    if not text:
+        return ""
+    if '\\t' in text:
+        text = text.replace('\\t', ' ')
+    if CONTROL_CHARS_PATTERN.search(text):
+        text = CONTROL_CHARS_PATTERN.sub('', text)
+    return ' '.join(SPACE_MARKS_PATTERN.sub(' ', text).split())
+
+
+def detect_extension(data: bytes) -> Optional[str]:
+    """Формат документа по сигнатуре содержимого"""
+    if data.startswith(b'%PDF'):
+        return '.pdf'
+    if data.startswith(b'PK'):
+        return '.docx'
+    if data.lstrip().startswith(b'{\\rtf'):
+        return '.rtf'
+    return None
+
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+W_P, W_T, W_TC, W_TCPR, W_VMERGE = (WORD_NS + tag for tag in ('p', 't', 'tc', 'tcPr', 'vMerge'))
+W_BR, W_VAL, W_TYPE = WORD_NS + 'br', WORD_NS + 'val', WORD_NS + 'type'
+# Элементы внутри абзаца, которые python-docx переводит в символы
+DOCX_INLINE_TEXT = {
+    WORD_NS + 'tab': '\t',
+    WORD_NS + 'ptab': '\t',
+    WORD_NS + 'cr': '\n',
+    WORD_NS + 'noBreakHyphen': '-',
+}
+
+
+def iter_docx_blocks(source: BinaryIO) -> Iterator[str]:
+    """
+    Потоково читает word/document.xml через iterparse и отдает текст абзацев
+    и ячеек таблиц в порядке документа. Ячейка-продолжение вертикального объединения
+    (vMerge) пропускается, ячейка с gridSpan отдается один раз. Альтернативное
+    содержимое (mc:Fallback) не читается, чтобы не дублировать надписи.
+    Обработанные элементы удаляются, поэтому память не растет с размером документа.
+    """
+    with zipfile.ZipFile(source) as archive, archive.open('word/document.xml') as xml:
+        paragraphs = []   # стек текстов открытых абзацев (надписи вложены в абзацы)
+        cells = []        # стек открытых ячеек: [тексты абзацев, это продолжение vMerge]
+        skip_depth = 0
+        for event, element in etree.iterparse(xml, events=('start', 'end')):
+            tag = element.tag
+            if tag == MC_FALLBACK:
+                skip_depth += 1 if event == 'start' else -1
+                if event == 'end':
+                    element.clear()
+                continue
+            if skip_depth:
+                continue
+
+            if event == 'start':
+                if tag == W_P:
+                    paragraphs.append([])
+                elif tag == W_TC:
+                    cells.append([[], False])
+                continue
+
+            if tag == W_T:
+                if paragraphs and element.text:
+                    paragraphs[-1].append(element.text)
+            elif tag in DOCX_INLINE_TEXT:
+                if paragraphs:
+                    paragraphs[-1].append(DOCX_INLINE_TEXT[tag])
+            elif tag == W_BR:
+                if paragraphs and element.get(W_TYPE, 'textWrapping') == 'textWrapping':
+                    paragraphs[-1].append('\n')
+            elif tag == W_VMERGE:
+                if cells and element.getparent() is not None and element.getparent().tag == W_TCPR:
+                    cells[-1][1] = element.get(W_VAL, 'continue') != 'restart'
+            elif tag == W_P:
+                text = ''.join(paragraphs.pop())
+                if cells:
+                    cells[-1][0].append(text)
+                elif text.strip():
+                    yield text.strip()
+                element.clear()
+            elif tag == W_TC:
+                cell_paragraphs, is_continuation = cells.pop()
+                text = '\n'.join(cell_paragraphs).strip()
+                if text and not is_continuation:
+                    yield text
+                element.clear()
+            else:
+                continue
+            # Удаляем уже обработанных соседей, чтобы дерево не накапливалось
+            if tag in (W_P, W_TC):
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+
+def extract_docx_python_docx(source: BinaryIO) -> str:
+    """Запасной путь через объектную модель python-docx; объединенные ячейки не дублируются"""
+    doc = Document(source)
+    paragraphs = [p.text.strip()
+                  for p in doc.paragraphs if p.text.strip()]
+    for table in doc.tables:
+        seen_cells = set()
+        for row in table.rows:
+            for cell in row.cells:
+                if cell._tc in seen_cells:
+                    continue
+                seen_cells.add(cell._tc)
+                if cell.text.strip():
+                    paragraphs.append(cell.text.strip())
+    return ' '.join(paragraphs)
+
+
+def extract_docx(source: BinaryIO) -> str:
+    try:
+        return ' '.join(iter_docx_blocks(source))
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        source.seek(0)
+        return extract_docx_python_docx(source)
+
+
+@contextmanager
+def _binary_stream(source: DocumentSource) -> Iterator[BinaryIO]:
+    """Путь, байты или файловый объект -> позиционируемый бинарный поток"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            yield file
+    elif isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    elif source.seekable():
+        yield source
+    else:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) as spool:
+            shutil.copyfileobj(source, spool)
+            spool.seek(0)
+            yield spool
+
+
+def iter_pdf_pages(source: DocumentSource, max_pages: Optional[int] = None,
+                   max_chars: Optional[int] = None) -> Iterator[str]:
+    """
+    Лениво отдает нормализованный текст PDF постранично, пропуская пустые страницы.
+    Останавливается после max_pages страниц или когда ' '.join(страниц) достигает
+    max_chars символов: последняя страница при этом обрезается. Остальные страницы не разбираются.
+    """
+    with _binary_stream(source) as stream:
+        pdf_reader = PdfReader(stream)
+        remaining = max_chars
+        for number, page in enumerate(pdf_reader.pages):
+            if max_pages is not None and number >= max_pages:
+                return
+            if remaining is not None and remaining <= 0:
+                return
+            page_text = normalize_text(page.extract_text())
+            if not page_text:
+                continue
+            if remaining is not None:
+                if len(page_text) >= remaining:
+                    yield page_text[:remaining].rstrip()
+                    return
+                remaining -= len(page_text) + 1
+            yield page_text
+
+
+def extract_pdf(source: DocumentSource, max_pages: Optional[int] = None,
+                max_chars: Optional[int] = None) -> str:
+    return ' '.join(iter_pdf_pages(source, max_pages, max_chars))
+
+
+def extract_rtf(source: BinaryIO) -> str:
+    rtf_content = source.read().decode('utf-8', errors='ignore')
+    # Переводы строк как при чтении в текстовом режиме
+    rtf_content = rtf_content.replace('\r\n', '\n').replace('\r', '\n')
+    return rtf_to_text(rtf_content)
+
+
+EXTRACTORS = {
+    '.rtf': extract_rtf,
+    '.docx': extract_docx,
+    '.pdf': extract_pdf,
+}
+
+
+def extract_document(source: DocumentSource, extension: Optional[str] = None,
+                     max_pages: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+    """
+    Строгий вариант извлечения: путь, байты или файловый объект -> нормализованный текст
+    не длиннее max_chars; у PDF разбираются не больше max_pages страниц.
+    Ошибки разбора не подавляются (ими пользуется пул воркеров, см. extraction_pool.py).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Файл не найден: {source}")
+        extension = extension or Path(source).suffix.lower()
+    elif extension is None:
+        if isinstance(source, (bytes, bytearray)):
+            extension = detect_extension(bytes(source[:16]))
+        else:
+            with _binary_stream(source) as stream:
+                extension = detect_extension(stream.read(16))
+                stream.seek(0)
+                return extract_document(stream, extension, max_pages, max_chars)
+    if extension not in EXTRACTORS:
+        raise ValueError(f"Неподдерживаемый формат: {extension}")
+
+    if extension == '.pdf':
+        return extract_pdf(source, max_pages, max_chars)
+    with _binary_stream(source) as stream:
+        text = EXTRACTORS[extension](stream)
+    text = normalize_text(text) if text else ""
+    return text[:max_chars].rstrip() if max_chars is not None else text
+
+
+def extract_text_as_single_line(file_path: str, max_pages: Optional[int] = None,
+                                max_chars: Optional[int] = None) -> str:
+    """Извлекает и очищает текст из .docx, .pdf, .rtf"""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Файл не найден: {file_path}")
+
+    extension = Path(file_path).suffix.lower()
+    if extension not in EXTRACTORS:
+        raise ValueError(f"Неподдерживаемый формат: {extension}")
+
+    try:
+        return extract_document(file_path, extension, max_pages, max_chars)
+    except Exception as e:
+        print(f"Ошибка {extension[1:].upper()}: {str(e)}")
+        return ""
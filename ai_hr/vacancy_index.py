@@ -0,0 +1,316 @@
+# vacancy_index.py
+# Индекс эмбеддингов требований всех открытых вакансий для обратного поиска:
+# резюме -> наиболее подходящие вакансии. Оценка та же, что в InterviewAnalyzer.analyze,
+# но фрагменты резюме кодируются один раз и сравниваются сразу со всеми требованиями.
+
+import threading
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from analyzer import CompiledVacancy, InterviewAnalyzer, SOURCE_PROMPT
+
+# Наибольшее расхождение векторной оценки с total_match_percent (итог округляется до 0.1,
+# веса нормированы) — с запасом
+ROUNDING_SLACK = 0.2
+
+
+class VacancyIndex:
+    """
+    Плоская матрица требований (brute-force) с инкрементальным добавлением и удалением вакансий.
+    total_match_percent всех вакансий считается векторно (суммы оценок строк по категориям,
+    умноженные на веса), полный отчет собирается только для top_k лучших.
+    При nlist > 0 включается разбиение на кластеры (IVF): запрос просматривает nprobe ближайших
+    кластеров для каждого фрагмента, отбирает top_k * rerank_factor вакансий по приближенной
+    оценке (только по строкам просмотренных кластеров) и точно пересчитывает только их.
+    Новые вакансии относятся к ближайшему центроиду сразу при добавлении, а кластеры
+    переобучаются, когда число требований выросло в retrain_growth раз с прошлого обучения.
+    """
+
+    def __init__(self, analyzer: Optional[InterviewAnalyzer] = None, nlist: int = 0, nprobe: int = 8,
+                 rerank_factor: int = 4, kmeans_iterations: int = 10, retrain_growth: float = 2.0):
+        self.analyzer = analyzer or InterviewAnalyzer()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.retrain_growth = retrain_growth
+
+        self._vacancies: Dict[str, CompiledVacancy] = {}
+        self._rows: Dict[str, np.ndarray] = {}
+        # Строка матрицы для каждого пункта вакансии (-1, если у пункта нет эмбеддинга)
+        self._item_rows: Dict[str, np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._live = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._free_rows: List[int] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._partition = np.zeros(0, dtype=np.int32)
+        self._trained_rows = 0
+        # Раскладка пунктов по (вакансия, категория) для каждого набора весов; сбрасывается при изменении
+        self._layouts: Dict[Optional[tuple], "_WeightLayout"] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._vacancies)
+
+    def __contains__(self, vacancy_id: str) -> bool:
+        return vacancy_id in self._vacancies
+
+    # ---------- изменение индекса ----------
+
+    def add(self, vacancy_id: str, vacancy: Union[Dict, CompiledVacancy]) -> CompiledVacancy:
+        """Добавляет (или заменяет) вакансию; dict компилируется анализатором"""
+        compiled, _ = self.analyzer._compiled(vacancy, None)
+        with self._lock:
+            if vacancy_id in self._vacancies:
+                self.remove(vacancy_id)
+            rows = self._allocate(len(compiled.requirement_texts),
+                                  compiled.requirement_embeddings.shape[1])
+            if len(rows):
+                self._matrix[rows] = compiled.requirement_embeddings
+                self._live[rows] = True
+                if self._centroids is not None:
+                    self._partition[rows] = self._nearest_centroids(
+                        compiled.requirement_embeddings, 1)[:, 0]
+            self._vacancies[vacancy_id] = compiled
+            self._rows[vacancy_id] = rows
+            requirement_rows = dict(zip(compiled.requirement_texts, rows.tolist()))
+            self._item_rows[vacancy_id] = np.asarray(
+                [requirement_rows.get(item["text"], -1) for item in compiled.items], dtype=np.int64)
+            self._layouts.clear()
+        return compiled
+
+    def remove(self, vacancy_id: str) -> bool:
+        """Удаляет вакансию (например, закрытую или истекшую); строки переиспользуются"""
+        with self._lock:
+            if vacancy_id not in self._vacancies:
+                return False
+            rows = self._rows.pop(vacancy_id)
+            del self._vacancies[vacancy_id]
+            del self._item_rows[vacancy_id]
+            self._layouts.clear()
+            if len(rows):
+                self._matrix[rows] = 0.0
+                self._live[rows] = False
+                self._free_rows.extend(rows.tolist())
+            return True
+
+    def _allocate(self, count: int, dim: int) -> np.ndarray:
+        reused = [self._free_rows.pop() for _ in range(min(count, len(self._free_rows)))]
+        fresh = count - len(reused)
+        if self._matrix is None:
+            self._matrix = np.zeros((max(fresh, 64), dim), dtype=np.float32)
+            self._live = np.zeros(len(self._matrix), dtype=bool)
+            self._partition = np.zeros(len(self._matrix), dtype=np.int32)
+        elif self._matrix.shape[1] != dim:
+            raise ValueError(
+                f"Размерность эмбеддингов {dim} не совпадает с индексом ({self._matrix.shape[1]})")
+        if self._size + fresh > len(self._matrix):
+            capacity = max(self._size + fresh, 2 * len(self._matrix))
+            self._matrix = np.resize(self._matrix, (capacity, dim))
+            self._matrix[self._size:] = 0.0
+            self._live = np.concatenate(
+                [self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+            self._partition = np.concatenate(
+                [self._partition, np.zeros(capacity - len(self._partition), dtype=np.int32)])
+        rows = reused + list(range(self._size, self._size + fresh))
+        self._size += fresh
+        return np.asarray(rows, dtype=np.int64)
+
+    # ---------- кластеризация (IVF) ----------
+
+    def train_partitions(self) -> None:
+        """
+        Сферический k-means по живым строкам. Вызывается автоматически при первом запросе
+        и когда индекс вырос в retrain_growth раз с прошлого обучения.
+        """
+        with self._lock:
+            live_rows = np.flatnonzero(self._live[:self._size])
+            self._trained_rows = len(live_rows)
+            if self.nlist <= 0 or len(live_rows) < self.nlist:
+                self._centroids = None
+                return
+            data = self._matrix[live_rows]
+            rng = np.random.default_rng(0)
+            centroids = data[rng.choice(
+                len(data), self.nlist, replace=False)].copy()
+            for _ in range(self.kmeans_iterations):
+                assignment = (data @ centroids.T).argmax(axis=1)
+                for k in range(self.nlist):
+                    members = data[assignment == k]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        centroids[k] = centroid / \
+                            max(np.linalg.norm(centroid), 1e-12)
+            self._centroids = centroids
+            self._partition[live_rows] = (data @ centroids.T).argmax(axis=1)
+
+    def _nearest_centroids(self, vectors: np.ndarray, count: int) -> np.ndarray:
+        similarity = vectors @ self._centroids.T
+        count = min(count, similarity.shape[1])
+        return np.argsort(-similarity, axis=1)[:, :count]
+
+    # ---------- поиск ----------
+
+    def match_resume_to_vacancies(self, resume_text: str, top_k: int = 5,
+                                  weights: Optional[Dict] = None, return_features: bool = False) -> List[Dict]:
+        """
+        Возвращает top_k вакансий для резюме, отсортированных по total_match_percent.
+        Каждый результат — как у InterviewAnalyzer.analyze, плюс поле vacancy_id.
+        """
+        fragments, candidate_total_months, _ = self.analyzer._prepare_candidate(
+            resume_text)
+        sources = self.analyzer._unique_texts(fragments)
+        source_embeddings = self.analyzer.encode_texts(
+            sources, SOURCE_PROMPT) if sources else None
+
+        with self._lock:
+            if not self._vacancies:
+                return []
+            layout = self._layout(weights)
+            if source_embeddings is None:
+                row_scores = np.zeros(self._size, dtype=np.float32)
+                limit = top_k
+            elif self.nlist > 0 and self._probe_ready():
+                probed = np.unique(self._nearest_centroids(
+                    source_embeddings, self.nprobe))
+                candidate_rows = np.flatnonzero(
+                    self._live[:self._size] & np.isin(self._partition[:self._size], probed))
+                row_scores = self._raw_scores(candidate_rows, source_embeddings)
+                limit = top_k * self.rerank_factor
+            else:
+                row_scores = self._raw_scores(
+                    np.flatnonzero(self._live[:self._size]), source_embeddings)
+                limit = top_k
+            totals = self._approximate_totals(
+                layout, row_scores, candidate_total_months)
+            # Порядок добавления сохраняется, чтобы равные оценки сортировались как без отбора
+            vacancy_ids = [layout.vacancy_ids[i]
+                           for i in np.sort(self._shortlist(totals, limit))]
+
+            rows = np.concatenate([self._rows[v] for v in vacancy_ids]) if vacancy_ids else np.zeros(
+                0, dtype=np.int64)
+            exact = self._score_rows(rows, sources, source_embeddings)
+            results = self._results(
+                vacancy_ids, exact, candidate_total_months, weights, return_features)
+        return self._top(results, top_k)
+
+    def _probe_ready(self) -> bool:
+        """Обучает кластеры при первом запросе и при росте индекса; False — кластеров нет"""
+        live = int(self._live[:self._size].sum())
+        if self._centroids is None or live >= self._trained_rows * self.retrain_growth:
+            self.train_partitions()
+        return self._centroids is not None
+
+    @staticmethod
+    def _shortlist(totals: np.ndarray, limit: int) -> np.ndarray:
+        """
+        Индексы limit лучших вакансий и всех, кто отстает от последней из них меньше чем
+        на ROUNDING_SLACK: итог отчета округляется по критериям, поэтому порядок
+        векторных оценок может разойтись с ним на близких значениях.
+        """
+        if limit <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if limit >= len(totals):
+            return np.arange(len(totals))
+        cutoff = np.partition(-totals, limit - 1)[limit - 1]
+        return np.flatnonzero(-totals <= cutoff + ROUNDING_SLACK)
+
+    def _score_rows(self, rows: np.ndarray, sources: List[str],
+                    source_embeddings: Optional[np.ndarray]) -> Dict[int, tuple]:
+        """Лучший фрагмент для каждой строки требований: row -> (score, source)"""
+        if source_embeddings is None or not len(rows):
+            return {}
+        scores = self._matrix[rows] @ source_embeddings.T
+        best_idx = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(rows)), best_idx]
+        return {int(row): (float(score), sources[idx])
+                for row, score, idx in zip(rows, best_scores, best_idx) if score > 0.0}
+
+    def _raw_scores(self, rows: np.ndarray, source_embeddings: np.ndarray) -> np.ndarray:
+        """Лучшая оценка по фрагментам для строк rows; остальные строки (и оценки <= 0) — 0"""
+        best = np.zeros(self._size, dtype=np.float32)
+        if len(rows):
+            best[rows] = np.maximum(
+                (self._matrix[rows] @ source_embeddings.T).max(axis=1), 0.0)
+        return best
+
+    def _layout(self, weights: Optional[Dict]) -> "_WeightLayout":
+        key = None if weights is None else tuple(sorted(weights.items()))
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = _WeightLayout(self, weights)
+        return layout
+
+    def _approximate_totals(self, layout: "_WeightLayout", row_scores: np.ndarray,
+                            candidate_total_months: int) -> np.ndarray:
+        """total_match_percent каждой вакансии по сырым оценкам строк — формулы _build_result без отчета"""
+        item_scores = np.append(row_scores, 0.0)[layout.item_rows]  # индекс -1 — пункт без строки
+        sums = np.bincount(layout.item_groups, weights=item_scores,
+                           minlength=len(layout.group_counts))
+        means = np.divide(sums, layout.group_counts, out=np.zeros(len(sums)),
+                          where=layout.group_counts > 0)
+        totals = np.bincount(layout.group_vacancies, weights=np.round(means * 100, 1) * layout.group_weights,
+                             minlength=len(layout.vacancy_ids))
+        experience = np.asarray([self.analyzer.match_experience_range(candidate_total_months, *bounds)
+                                 for bounds in layout.experience_ranges], dtype=np.float64)
+        return totals + np.round(experience[layout.experience_index] * 100, 1) * layout.experience_weights
+
+    def _results(self, vacancy_ids: List[str], row_matches: Dict[int, tuple], candidate_total_months: int,
+                 weights: Optional[Dict], return_features: bool) -> List[Dict]:
+        results = []
+        for vacancy_id in vacancy_ids:
+            compiled, active_weights = self.analyzer._compiled(
+                self._vacancies[vacancy_id], weights)
+            best_matches = [row_matches.get(row, (0.0, None))
+                            for row in self._item_rows[vacancy_id].tolist()]
+            result = self.analyzer._build_result(compiled, active_weights, best_matches,
+                                                 candidate_total_months, False, return_features)
+            results.append({"vacancy_id": vacancy_id, **result})
+        return results
+
+    @staticmethod
+    def _top(results: List[Dict], top_k: int) -> List[Dict]:
+        return sorted(results, key=lambda r: r["total_match_percent"], reverse=True)[:top_k]
+
+
+class _WeightLayout:
+    """
+    Пункты всех вакансий индекса, сгруппированные по (вакансия, категория) для одного набора весов:
+    сумма оценок группы делится на число ее пунктов и умножается на вес категории.
+    """
+
+    def __init__(self, index: VacancyIndex, weights: Optional[Dict]):
+        self.vacancy_ids = list(index._vacancies)
+        rows, groups, group_vacancies, group_weights = [], [], [], []
+        ranges: Dict[tuple, int] = {}
+        experience_index, experience_weights = [], []
+        for i, vacancy_id in enumerate(self.vacancy_ids):
+            compiled, active_weights = index.analyzer._compiled(
+                index._vacancies[vacancy_id], weights)
+            vacancy_groups = {}
+            for cat, weight in active_weights.items():
+                if cat != "experience_years_match":
+                    vacancy_groups[cat] = len(group_weights)
+                    group_vacancies.append(i)
+                    group_weights.append(weight)
+            for row, item in zip(index._item_rows[vacancy_id].tolist(), compiled.items):
+                if item["category"] in vacancy_groups:
+                    rows.append(row)
+                    groups.append(vacancy_groups[item["category"]])
+            experience_index.append(ranges.setdefault(
+                tuple(compiled.experience_range), len(ranges)))
+            experience_weights.append(
+                active_weights.get("experience_years_match", 0.0))
+
+        self.item_rows = np.asarray(rows, dtype=np.int64)
+        self.item_groups = np.asarray(groups, dtype=np.int64)
+        self.group_vacancies = np.asarray(group_vacancies, dtype=np.int64)
+        self.group_weights = np.asarray(group_weights, dtype=np.float64)
+        self.group_counts = np.bincount(
+            self.item_groups, minlength=len(group_weights)).astype(np.float64)
+        self.experience_ranges = list(ranges)
+        self.experience_index = np.asarray(experience_index, dtype=np.int64)
+        self.experience_weights = np.asarray(
+            experience_weights, dtype=np.float64)